@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Compare :func:`pymodsecurity.utils.as_bytes` with its previous
+exception-based implementation.
+
+Usage::
+
+    $ python3 benchmarks/bench_as_bytes.py
+"""
+
+import sys
+import timeit
+
+from pymodsecurity import utils
+
+_encoding = sys.getdefaultencoding()
+
+
+def legacy_as_bytes(arg, encoding=_encoding):
+    try:
+        return bytes(arg, encoding)
+    except TypeError:
+        # ``arg`` is not a :class:`str`
+        return arg
+
+
+CASES = [
+    ("bytes", b"/index.html?id=42"),
+    ("common header name", "User-Agent"),
+    ("method", "GET"),
+    ("other str", "/index.html?id=42"),
+    ("bytearray", bytearray(b"/index.html?id=42")),
+]
+
+
+def main(number=1000000):
+    print("{:<20} {:>12} {:>12} {:>8}".format("input", "legacy (ns)",
+                                              "current (ns)", "speedup"))
+    for name, value in CASES:
+        legacy = min(timeit.repeat(lambda: legacy_as_bytes(value),
+                                   number=number, repeat=3))
+        current = min(timeit.repeat(lambda: utils.as_bytes(value),
+                                    number=number, repeat=3))
+        print("{:<20} {:>12.1f} {:>12.1f} {:>7.2f}x".format(
+            name, legacy / number * 1e9, current / number * 1e9,
+            legacy / current))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Measure the throughput of :class:`pymodsecurity.logmessage.LogMessage`
+compared with a typical regular expression parsing every field at once.
+
+Usage::
+
+    $ python3 benchmarks/bench_logmessage.py
+"""
+
+import re
+import timeit
+
+from pymodsecurity.logmessage import LogMessage
+
+MESSAGE = (
+    '[client 192.0.2.1] ModSecurity: Warning. Matched "Operator `Rx\' with '
+    'parameter `(?i)union\\s+select\' against variable `ARGS:q\' (Value: '
+    '`1 union select password from users\' )" '
+    '[file "/etc/modsecurity/rules/REQUEST-942-APPLICATION-ATTACK-SQLI.conf"] '
+    '[line "45"] [id "942100"] [rev ""] '
+    '[msg "SQL Injection Attack Detected via libinjection"] '
+    '[data "Matched Data: 1UE found within ARGS:q"] [severity "2"] '
+    '[ver "OWASP_CRS/3.3.0"] [maturity "0"] [accuracy "0"] '
+    '[tag "application-multi"] [tag "language-multi"] '
+    '[tag "attack-sqli"] [hostname "example.com"] [uri "/search"] '
+    '[unique_id "161480000066.953143"] [ref "v48,35"]')
+
+_REGEX = re.compile(r'\[(\w+) "(.*?)"\]')
+
+
+def regex_parse(message):
+    fields = {}
+    tags = []
+    for name, value in _REGEX.findall(message):
+        if name == "tag":
+            tags.append(value)
+        else:
+            fields.setdefault(name, value)
+    fields["tags"] = tags
+    return fields
+
+
+def _id_msg(record):
+    return record.id, record.msg
+
+
+def _all_fields(record):
+    return (record.id, record.msg, record.severity, record.tags, record.data,
+            record.uri, record.unique_id)
+
+
+CASES = [
+    ("regex, every field", lambda: regex_parse(MESSAGE)),
+    ("LogMessage only", lambda: LogMessage(MESSAGE)),
+    ("LogMessage, id", lambda: LogMessage(MESSAGE).id),
+    ("LogMessage, id+msg", lambda: _id_msg(LogMessage(MESSAGE))),
+    ("LogMessage, all", lambda: _all_fields(LogMessage(MESSAGE))),
+]
+
+
+def main(number=500000):
+    print("{:<20} {:>10} {:>16}".format("case", "ns/call",
+                                        "messages/second"))
+    for name, function in CASES:
+        elapsed = min(timeit.repeat(function, number=number, repeat=3))
+        print("{:<20} {:>10.1f} {:>16,.0f}".format(
+            name, elapsed / number * 1e9, number / elapsed))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Measure what inspecting requests with :class:`pymodsecurity.connector.Connector`
+costs, end to end, on localhost.
+
+A stdlib HTTP server serves a small WSGI application, once as is and once
+wrapped by the connector. Client processes send a mix of benign and attack
+requests to each, then the requests per second, latency percentiles and
+server CPU time per request are reported.
+
+Usage::
+
+    $ python3 benchmarks/loadtest.py --clients 4 --duration 10 \\
+        --attack-ratio 0.1 --rules /etc/modsecurity/crs-setup.conf
+"""
+
+import argparse
+import http.client
+import multiprocessing
+import os
+import random
+import socketserver
+import time
+import wsgiref.simple_server
+
+from pymodsecurity.connector import Connector
+from pymodsecurity.modsecurity import ModSecurity
+from pymodsecurity.rules import Rules
+
+# Used when no rules file is given.
+DEFAULT_RULES = """
+SecRuleEngine On
+SecRequestBodyAccess On
+SecRule ARGS "@rx (?i)union\\s+select" \\
+    "id:100001,phase:2,deny,status:403,log,msg:'SQL injection'"
+SecRule ARGS "@rx (?i)<script" \\
+    "id:100002,phase:2,deny,status:403,log,msg:'XSS'"
+SecRule REQUEST_HEADERS:User-Agent "@pm sqlmap nikto" \\
+    "id:100003,phase:1,deny,status:403,log,msg:'Scanner'"
+"""
+
+BENIGN = [
+    ("GET", "/", None),
+    ("GET", "/search?q=modsecurity+python&page=2", None),
+    ("GET", "/static/app.js", None),
+    ("POST", "/login", b"user=alice&password=correct+horse"),
+]
+
+ATTACKS = [
+    ("GET", "/search?q=1%27%20union%20select%20password%20from%20users",
+     None),
+    ("GET", "/search?q=%3Cscript%3Ealert(1)%3C/script%3E", None),
+    ("POST", "/login", b"user=admin%27+union+select+1--&password=x"),
+]
+
+PERCENTILES = (50, 90, 99)
+
+
+def application(environ, start_response):
+    length = int(environ.get("CONTENT_LENGTH") or 0)
+    if length:
+        environ["wsgi.input"].read(length)
+    body = b"<html><body>Hello</body></html>"
+    start_response("200 OK", [("Content-Type", "text/html"),
+                              ("Content-Length", str(len(body)))])
+    return [body]
+
+
+class _Server(socketserver.ThreadingMixIn,
+              wsgiref.simple_server.WSGIServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+class _QuietHandler(wsgiref.simple_server.WSGIRequestHandler):
+    def log_message(self, *pargs):
+        pass
+
+
+def _serve(waf, rules_file, connection):
+    """
+    Run the HTTP server until something is received on ``connection``, then
+    send back the CPU time it used.
+    """
+    app = application
+    if waf:
+        rules = Rules()
+        if rules_file:
+            rules.add_rules_file(rules_file)
+        else:
+            rules.add_rules(DEFAULT_RULES)
+        app = Connector(application, ModSecurity(), rules)
+
+    server = wsgiref.simple_server.make_server("127.0.0.1", 0, app,
+                                               server_class=_Server,
+                                               handler_class=_QuietHandler)
+    server.timeout = 0.1
+    connection.send(server.server_port)
+
+    start = os.times()
+    while not connection.poll():
+        server.handle_request()
+    end = os.times()
+    connection.send((end.user - start.user) + (end.system - start.system))
+    server.server_close()
+
+
+def _client(port, duration, attack_ratio, seed, results):
+    """
+    Send requests for ``duration`` seconds, then put the latencies of the
+    answered requests and the number of blocked ones in ``results``.
+    """
+    chooser = random.Random(seed)
+    latencies = []
+    blocked = errors = 0
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        requests = ATTACKS if chooser.random() < attack_ratio else BENIGN
+        method, path, body = chooser.choice(requests)
+        headers = {"User-Agent": "pymodsecurity-loadtest"}
+        if body is not None:
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+
+        start = time.perf_counter()
+        try:
+            connection = http.client.HTTPConnection("127.0.0.1", port,
+                                                    timeout=10)
+            connection.request(method, path, body, headers)
+            response = connection.getresponse()
+            response.read()
+            connection.close()
+        except (OSError, http.client.HTTPException):
+            errors += 1
+            continue
+        latencies.append(time.perf_counter() - start)
+        if response.status == 403:
+            blocked += 1
+    results.put((latencies, blocked, errors))
+
+
+def _percentile(values, percent):
+    index = min(len(values) - 1, int(len(values) * percent / 100))
+    return values[index]
+
+
+def run(waf, clients, duration, attack_ratio, rules_file=None):
+    """
+    Load a server, with or without the connector.
+
+    :return: :class:`dict` of measures
+    """
+    parent, child = multiprocessing.Pipe()
+    server = multiprocessing.Process(target=_serve,
+                                     args=(waf, rules_file, child))
+    server.start()
+    port = parent.recv()
+
+    results = multiprocessing.Queue()
+    workers = [multiprocessing.Process(target=_client,
+                                       args=(port, duration, attack_ratio,
+                                             seed, results))
+               for seed in range(clients)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    outcomes = [results.get() for _ in workers]
+    elapsed = time.perf_counter() - start
+    for worker in workers:
+        worker.join()
+
+    parent.send(None)
+    cpu = parent.recv()
+    server.join()
+
+    latencies = sorted(latency for outcome in outcomes
+                       for latency in outcome[0])
+    count = len(latencies)
+    measures = {
+        "requests": count,
+        "blocked": sum(outcome[1] for outcome in outcomes),
+        "errors": sum(outcome[2] for outcome in outcomes),
+        "rps": count / elapsed,
+        "cpu_per_request": cpu / count if count else 0.0,
+    }
+    for percent in PERCENTILES:
+        measures["p" + str(percent)] = (_percentile(latencies, percent)
+                                        if count else 0.0)
+    measures["max"] = latencies[-1] if count else 0.0
+    return measures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--clients", type=int, default=4,
+                        help="number of client processes")
+    parser.add_argument("--duration", type=float, default=5,
+                        help="seconds of load for each run")
+    parser.add_argument("--attack-ratio", type=float, default=0.1,
+                        help="share of attack requests, from 0 to 1")
+    parser.add_argument("--rules",
+                        help="rules file loaded by the connector, a few "
+                             "built-in rules otherwise")
+    options = parser.parse_args(argv)
+
+    columns = ["requests", "blocked", "errors", "rps"]
+    columns += ["p" + str(percent) for percent in PERCENTILES]
+    columns += ["max", "cpu_per_request"]
+    print("{:<6}".format("waf") + "".join("{:>16}".format(column)
+                                         for column in columns))
+    for waf in (False, True):
+        measures = run(waf, options.clients, options.duration,
+                       options.attack_ratio, options.rules)
+        cells = [str(measures["requests"]), str(measures["blocked"]),
+                 str(measures["errors"]), "{:.1f}".format(measures["rps"])]
+        cells += ["{:.3f} ms".format(measures[column] * 1000)
+                  for column in columns[4:]]
+        print("{:<6}".format("on" if waf else "off") +
+              "".join("{:>16}".format(cell) for cell in cells))
+
+
+if __name__ == "__main__":
+    main()
@@ -38,6 +38,9 @@ setup_parameters = dict(
     cffi_modules=["src/pymodsecurity/build_pymodsecurity.py:ffibuilder"],
     package_dir={"pymodsecurity": "src/pymodsecurity"},
     ext_package="pymodsecurity",
+    entry_points={
+        "console_scripts": ["pymodsecurity = pymodsecurity.cli:main"],
+    },
 
     test_suite="tests",
 )
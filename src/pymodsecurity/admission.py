@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+"""
+pymodsecurity.admission
+-----------------------
+
+Provide a class :class:`AdmissionControl` bounding the number of
+transactions inspected at the same time, and shedding the inspection of the
+requests past this bound.
+"""
+
+import threading
+import time
+import weakref
+
+from pymodsecurity import metrics
+
+
+#: Pass the request to the application without any inspection.
+BYPASS = "bypass"
+#: Inspect the request without enforcing the interventions, past the bound.
+DETECTION_ONLY = "detection_only"
+#: Answer the request with an error status.
+REJECT = "reject"
+
+_POLICIES = (BYPASS, DETECTION_ONLY, REJECT)
+
+# Live instances, summed by the gauges of the library metrics.
+_controls = weakref.WeakSet()
+
+
+def totals():
+    """
+    Sum the state of every live :class:`AdmissionControl`.
+
+    :return: ``(in_flight, waiting, detecting, limit)``
+    """
+    totals = [0, 0, 0, 0]
+    for control in list(_controls):
+        totals[0] += control.in_flight
+        totals[1] += control.waiting
+        totals[2] += control.detecting
+        totals[3] += control.limit
+    return tuple(totals)
+
+
+class AdmissionControl:
+    """
+    Admit at most ``limit`` inspections at the same time.
+
+    Once saturated, up to ``queue_size`` requests wait for a slot, each for at
+    most ``queue_timeout`` seconds. Requests which are not admitted are shed
+    according to ``policy``.
+
+    Requests shed with :data:`DETECTION_ONLY` are still inspected, outside
+    of the ``limit``: they are only counted, in :attr:`detecting`, and must
+    be given back with ``release(admitted=False)``. Use :data:`BYPASS` or
+    :data:`REJECT` to bound the inspections strictly.
+
+    ::
+
+        admission = AdmissionControl(64, policy=DETECTION_ONLY,
+                                     queue_size=128, queue_timeout=0.05)
+        if admission.acquire():
+            try:
+                ...
+            finally:
+                admission.release()
+
+    :param limit: maximum number of inspections at the same time
+    :param policy: what to do with requests not admitted: :data:`BYPASS`,
+        :data:`DETECTION_ONLY` or :data:`REJECT`
+    :param queue_size: maximum number of requests waiting for a slot, ``0``
+        sheds requests as soon as every slot is taken
+    :param queue_timeout: maximum number of seconds a request waits for a
+        slot
+    :param status: HTTP status of the requests rejected with the
+        :data:`REJECT` policy
+    """
+    def __init__(self, limit, policy=REJECT, queue_size=0, queue_timeout=0.1,
+                 status=503):
+        if policy not in _POLICIES:
+            raise ValueError("Unknown policy: " + repr(policy))
+        if limit < 1:
+            raise ValueError("limit must be greater than 0")
+
+        self.limit = limit
+        self.policy = policy
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.status = status
+
+        #: Number of inspections in progress.
+        self.in_flight = 0
+        #: Number of requests waiting for a slot.
+        self.waiting = 0
+        #: Number of requests admitted.
+        self.admitted = 0
+        #: Number of requests shed.
+        self.shed = 0
+        #: Number of requests shed with :data:`DETECTION_ONLY` and being
+        #: inspected.
+        self.detecting = 0
+        #: Seconds spent waiting for a slot by the admitted requests.
+        self.queue_time = 0.0
+        self._condition = threading.Condition()
+        _controls.add(self)
+
+    @property
+    def saturation(self):
+        """
+        Ratio of the slots in use, from 0 to 1.
+        """
+        return self.in_flight / self.limit
+
+    def acquire(self):
+        """
+        Take a slot, waiting for one if every slot is taken and the queue is
+        not full.
+
+        :return: ``True`` if the request is admitted, in which case the slot
+            must be given back with :meth:`release`, ``False`` if it must be
+            shed
+        """
+        start = time.perf_counter()
+        with self._condition:
+            if (self.in_flight >= self.limit and
+                    self.waiting < self.queue_size):
+                self.waiting += 1
+                try:
+                    self._condition.wait_for(
+                        lambda: self.in_flight < self.limit,
+                        self.queue_timeout)
+                finally:
+                    self.waiting -= 1
+
+            admitted = self.in_flight < self.limit
+            waited = time.perf_counter() - start
+            if admitted:
+                self.in_flight += 1
+                self.admitted += 1
+                self.queue_time += waited
+            else:
+                self.shed += 1
+                if self.policy == DETECTION_ONLY:
+                    self.detecting += 1
+
+        stats = metrics.library
+        if stats is not None:
+            stats.admission_queue_time.observe(waited)
+            stats.admissions.labels("admitted" if admitted
+                                    else self.policy).inc()
+        return admitted
+
+    def release(self, admitted=True):
+        """
+        Give back a slot taken by :meth:`acquire`.
+
+        :param admitted: ``False`` to end the inspection of a request shed
+            with :data:`DETECTION_ONLY` instead
+        """
+        with self._condition:
+            if not admitted:
+                self.detecting -= 1
+                return
+            self.in_flight -= 1
+            self._condition.notify()
@@ -102,3 +102,58 @@ int msc_rules_add_remote(Rules *rules,
 int msc_rules_add_file(Rules *rules, const char *file, const char **error);
 int msc_rules_add(Rules *rules, const char *plain_rules, const char **error);
 int msc_rules_cleanup(Rules *rules);
+
+/*
+ * pymodsecurity helpers section
+ */
+
+typedef struct {
+    const char *client_ip;
+    int client_port;
+    const char *server_ip;
+    int server_port;
+    const char *uri;
+    const char *method;
+    const char *http_version;
+    const char **header_keys;
+    const char **header_values;
+    size_t header_count;
+    const char *body;
+    size_t body_size;
+} PyMscRequest;
+
+typedef struct {
+    int status;
+    int disruptive;
+    size_t matched_rules;
+} PyMscVerdict;
+
+size_t pymsc_inspect_many(ModSecurity *ms,
+			  Rules *rules,
+			  const PyMscRequest *requests,
+			  size_t count,
+			  PyMscVerdict *verdicts);
+
+int pymsc_process_connection(Transaction *transaction,
+			     const char *client,
+			     int cPort,
+			     const char *server,
+			     int sPort,
+			     ModSecurityIntervention *it);
+int pymsc_process_uri(Transaction *transaction,
+		      const char *uri,
+		      const char *protocol,
+		      const char *http_version,
+		      ModSecurityIntervention *it);
+int pymsc_process_request_headers(Transaction *transaction,
+				  ModSecurityIntervention *it);
+int pymsc_process_request_body(Transaction *transaction,
+			       ModSecurityIntervention *it);
+int pymsc_process_response_headers(Transaction *transaction,
+				   int code,
+				   const char *protocol,
+				   ModSecurityIntervention *it);
+int pymsc_process_response_body(Transaction *transaction,
+				ModSecurityIntervention *it);
+void pymsc_intervention_cleanup(ModSecurityIntervention *it);
+int pymsc_rules_dump_fd(Rules *rules, int fd);
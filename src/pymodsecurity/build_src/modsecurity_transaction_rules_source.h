@@ -141,6 +141,7 @@ struct RulesInfo msc_get_matched_rules_info(Transaction *transaction);
 
 #include <stdio.h>
 #include <string.h>
+#include <unistd.h>
 
 #include "modsecurity/rules_properties.h"
 #include "modsecurity/modsecurity.h"
@@ -159,3 +160,248 @@ int msc_rules_add_file(Rules *rules, const char *file, const char **error);
 int msc_rules_add(Rules *rules, const char *plain_rules, const char **error);
 int msc_rules_cleanup(Rules *rules);
 
+/*
+ * pymodsecurity helpers section
+ *
+ * Functions below are not part of libmodsecurity: they are built with the
+ * CFFI module to run several libmodsecurity calls with a single crossing.
+ */
+
+typedef struct {
+    const char *client_ip;
+    int client_port;
+    const char *server_ip;
+    int server_port;
+    const char *uri;
+    const char *method;
+    const char *http_version;
+    const char **header_keys;
+    const char **header_values;
+    size_t header_count;
+    const char *body;
+    size_t body_size;
+} PyMscRequest;
+
+typedef struct {
+    int status;
+    int disruptive;
+    size_t matched_rules;
+} PyMscVerdict;
+
+/*
+ * Fill the verdict if ModSecurity asks for an intervention.
+ * Return 1 if there is an intervention, 0 otherwise.
+ */
+static int pymsc_check_intervention(Transaction *transaction,
+				    PyMscVerdict *verdict)
+{
+    ModSecurityIntervention it = {200, 0, NULL, NULL, 0};
+
+    if (!msc_intervention(transaction, &it))
+	return 0;
+
+    verdict->status = it.status;
+    verdict->disruptive = it.disruptive;
+    /* Strings are duplicated by libmodsecurity for the caller. */
+    free((void *) it.url);
+    free((void *) it.log);
+    return 1;
+}
+
+/*
+ * Run the request phases then the logging phase on a transaction.
+ * Return 0 if libmodsecurity failed on a phase, 1 otherwise.
+ */
+static int pymsc_inspect_request(Transaction *transaction,
+				 const PyMscRequest *request,
+				 PyMscVerdict *verdict)
+{
+    size_t i;
+
+    verdict->status = 200;
+    verdict->disruptive = 0;
+    verdict->matched_rules = 0;
+
+    if (!msc_process_connection(transaction,
+				request->client_ip, request->client_port,
+				request->server_ip, request->server_port))
+	return 0;
+    if (pymsc_check_intervention(transaction, verdict))
+	goto logging;
+
+    if (!msc_process_uri(transaction, request->uri, request->method,
+			 request->http_version))
+	return 0;
+    if (pymsc_check_intervention(transaction, verdict))
+	goto logging;
+
+    for (i = 0; i < request->header_count; i++) {
+	if (!msc_add_request_header(
+		transaction,
+		(const unsigned char *) request->header_keys[i],
+		(const unsigned char *) request->header_values[i]))
+	    return 0;
+    }
+    if (!msc_process_request_headers(transaction))
+	return 0;
+    if (pymsc_check_intervention(transaction, verdict))
+	goto logging;
+
+    if (request->body_size > 0
+	&& !msc_append_request_body(transaction,
+				    (const unsigned char *) request->body,
+				    request->body_size))
+	return 0;
+    if (!msc_process_request_body(transaction))
+	return 0;
+    pymsc_check_intervention(transaction, verdict);
+
+logging:
+    verdict->matched_rules = msc_get_matched_rules_info(transaction).size;
+    return msc_process_logging(transaction);
+}
+
+/*
+ * Inspect a batch of requests, each one in its own transaction.
+ * Return the number of requests inspected, which is lower than count if
+ * libmodsecurity failed on a request.
+ */
+size_t pymsc_inspect_many(ModSecurity *ms,
+			  Rules *rules,
+			  const PyMscRequest *requests,
+			  size_t count,
+			  PyMscVerdict *verdicts)
+{
+    Transaction *transaction;
+    size_t i;
+    int inspected;
+
+    for (i = 0; i < count; i++) {
+	transaction = msc_new_transaction(ms, rules, NULL);
+	if (transaction == NULL)
+	    return i;
+
+	inspected = pymsc_inspect_request(transaction, &requests[i],
+					  &verdicts[i]);
+	msc_transaction_cleanup(transaction);
+	if (!inspected)
+	    return i;
+    }
+
+    return count;
+}
+
+/*
+ * Phase functions checking for an intervention in the same call.
+ * Return -1 if libmodsecurity failed on the phase, 1 if ModSecurity asks for
+ * an intervention, which is written to it, 0 otherwise.
+ */
+static int pymsc_phase_result(Transaction *transaction,
+			      int processed,
+			      ModSecurityIntervention *it)
+{
+    if (!processed)
+	return -1;
+    return msc_intervention(transaction, it) ? 1 : 0;
+}
+
+int pymsc_process_connection(Transaction *transaction,
+			     const char *client,
+			     int cPort,
+			     const char *server,
+			     int sPort,
+			     ModSecurityIntervention *it)
+{
+    return pymsc_phase_result(
+	transaction,
+	msc_process_connection(transaction, client, cPort, server, sPort),
+	it);
+}
+
+int pymsc_process_uri(Transaction *transaction,
+		      const char *uri,
+		      const char *protocol,
+		      const char *http_version,
+		      ModSecurityIntervention *it)
+{
+    return pymsc_phase_result(
+	transaction,
+	msc_process_uri(transaction, uri, protocol, http_version),
+	it);
+}
+
+int pymsc_process_request_headers(Transaction *transaction,
+				  ModSecurityIntervention *it)
+{
+    return pymsc_phase_result(transaction,
+			      msc_process_request_headers(transaction),
+			      it);
+}
+
+int pymsc_process_request_body(Transaction *transaction,
+			       ModSecurityIntervention *it)
+{
+    return pymsc_phase_result(transaction,
+			      msc_process_request_body(transaction),
+			      it);
+}
+
+int pymsc_process_response_headers(Transaction *transaction,
+				   int code,
+				   const char *protocol,
+				   ModSecurityIntervention *it)
+{
+    return pymsc_phase_result(
+	transaction,
+	msc_process_response_headers(transaction, code, protocol),
+	it);
+}
+
+int pymsc_process_response_body(Transaction *transaction,
+				ModSecurityIntervention *it)
+{
+    return pymsc_phase_result(transaction,
+			      msc_process_response_body(transaction),
+			      it);
+}
+
+/*
+ * Free the strings duplicated by msc_intervention() and reset the
+ * intervention: msc_intervention() reports the disruptive field of the
+ * caller's structure, which would otherwise stay set for the next checks.
+ */
+void pymsc_intervention_cleanup(ModSecurityIntervention *it)
+{
+    free((void *) it->url);
+    free((void *) it->log);
+    it->status = 200;
+    it->pause = 0;
+    it->url = NULL;
+    it->log = NULL;
+    it->disruptive = 0;
+}
+
+/*
+ * Run msc_rules_dump() with the standard output redirected to fd.
+ * Return 0 on success, -1 if the redirection failed.
+ */
+int pymsc_rules_dump_fd(Rules *rules, int fd)
+{
+    int saved;
+
+    fflush(stdout);
+    saved = dup(STDOUT_FILENO);
+    if (saved == -1)
+	return -1;
+    if (dup2(fd, STDOUT_FILENO) == -1) {
+	close(saved);
+	return -1;
+    }
+
+    msc_rules_dump(rules);
+    fflush(stdout);
+
+    dup2(saved, STDOUT_FILENO);
+    close(saved);
+    return 0;
+}
@@ -0,0 +1,360 @@
+# -*- coding: utf-8 -*-
+"""
+pymodsecurity.bundle
+--------------------
+
+Build and read rules bundles: a rules configuration with its ``Include``
+directives resolved and its data files inlined, stored compressed in a
+single file.
+
+A bundle is made of a header followed by the zlib-compressed configuration
+encoded in UTF-8. Load it with :meth:`~pymodsecurity.rules.Rules.from_bundle`.
+
+Some files cannot be inlined: data files holding values with spaces, quotes,
+commas or backslashes, remote data files, ``@inspectFile`` scripts and the
+files of ``SecUnicodeMapFile`` and ``SecGeoLookupDb``. The bundle refers to
+them by their absolute path, and :func:`build` warns about them.
+"""
+
+import glob
+import mmap
+import os
+import re
+import struct
+import tempfile
+import warnings
+import zlib
+
+from pymodsecurity.exceptions import BundleError
+
+
+MAGIC = b"PYMSCBDL"
+VERSION = 1
+
+# Magic, format version, number of rules, size of the configuration and its
+# CRC32.
+_HEADER = struct.Struct("!8sHIQI")
+
+_INCLUDE = re.compile(r"^\s*(Include|IncludeOptional)\s+(.+?)\s*$",
+                      re.IGNORECASE)
+_DIRECTIVE_FILE = re.compile(r"^(\s*(?:SecUnicodeMapFile|SecGeoLookupDb)"
+                             r"\s+)(\S+)", re.IGNORECASE)
+# Within a quoted operator, every file up to the closing quote.
+_FROM_FILE = re.compile(r"(\")?@(pmFromFile|pmf|ipMatchFromFile|ipMatchF)"
+                        r"\s+((?(1)[^\"]+|[^\s\"]+))", re.IGNORECASE)
+_INSPECT_FILE = re.compile(r"(@inspectFile\s+)([^\s\"]+)", re.IGNORECASE)
+
+# Operators reading a data file, mapped to their inline equivalent and the
+# separator of their arguments.
+_INLINE_OPERATORS = {
+    "pmfromfile": ("pm", " "),
+    "pmf": ("pm", " "),
+    "ipmatchfromfile": ("ipMatch", ","),
+    "ipmatchf": ("ipMatch", ","),
+}
+
+
+def join_continuations(lines):
+    """
+    Yield configuration lines, lines ending with a backslash being joined
+    with the following ones.
+
+    :param lines: iterable of :class:`str`
+    """
+    pending = ""
+    for line in lines:
+        line = line.rstrip("\r\n")
+        if line.endswith("\\"):
+            pending += line + "\n"
+            continue
+        yield pending + line
+        pending = ""
+    if pending:
+        yield pending
+
+
+def logical_lines(path):
+    """
+    Yield lines of a configuration file, lines ending with a backslash being
+    joined with the following ones.
+
+    :param path: path to the configuration file
+
+    :raise: :exc:`~pymodsecurity.exceptions.BundleError` if the file cannot
+        be read
+    """
+    try:
+        with open(path, encoding="utf-8") as f:
+            yield from join_continuations(f)
+    except OSError as error:
+        raise BundleError("Cannot read " + path + ": " + str(error))
+
+
+def _unquote(value):
+    if len(value) > 1 and value[0] == value[-1] and value[0] in "\"'":
+        return value[1:-1]
+    return value
+
+
+def _read_data_file(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return [line.strip() for line in f
+                    if line.strip() and not line.lstrip().startswith("#")]
+    except OSError as error:
+        raise BundleError("Cannot read " + path + ": " + str(error))
+
+
+def _absolute_path(filename, directory, external):
+    """
+    Get the absolute path of a file referred to by a directive, appending it
+    to ``external`` if it is not ``None``.
+    """
+    if "://" not in filename:
+        # Remote files are fetched by libmodsecurity
+        filename = os.path.abspath(os.path.join(directory, filename))
+    if external is not None:
+        external.append(filename)
+    return filename
+
+
+def _absolute_data_file(match, directory, external):
+    quote, operator, filenames = match.groups()
+    paths = [_absolute_path(filename, directory, external)
+             for filename in filenames.split()]
+    return (quote or "") + "@" + operator + " " + " ".join(paths)
+
+
+def _inline_data_file(match, directory, external):
+    """
+    Replace an operator reading data files by its inline equivalent.
+
+    The operator is only made to point to absolute paths when a data file
+    is remote or holds values which cannot be written inline.
+    """
+    quote, operator, filenames = match.groups()
+    filenames = filenames.split()
+    if any("://" in filename for filename in filenames):
+        return _absolute_data_file(match, directory, external)
+
+    values = []
+    for filename in filenames:
+        values.extend(_read_data_file(os.path.join(directory, filename)))
+    inline_operator, separator = _INLINE_OPERATORS[operator.lower()]
+    if not values or any(char in value
+                         for value in values for char in " \t\"',\\"):
+        return _absolute_data_file(match, directory, external)
+    return ((quote or "") + "@" + inline_operator + " " +
+            separator.join(values))
+
+
+def resolve_paths(line, directory, inline=True, external=None):
+    """
+    Make a directive independent from the directory of its file.
+
+    :param line: directive, as yielded by :func:`logical_lines`
+    :param directory: directory of its file
+    :param inline: inline the data files, refer to them by their absolute
+        path otherwise
+    :param external: :class:`list` to which the files the directive still
+        refers to are appended, if not ``None``
+    """
+    line = _DIRECTIVE_FILE.sub(
+        lambda match: match.group(1) + _absolute_path(match.group(2),
+                                                      directory, external),
+        line)
+    line = _INSPECT_FILE.sub(
+        lambda match: match.group(1) + _absolute_path(match.group(2),
+                                                      directory, external),
+        line)
+    data_file = _inline_data_file if inline else _absolute_data_file
+    return _FROM_FILE.sub(lambda match: data_file(match, directory, external),
+                          line)
+
+
+def included_files(line, directory):
+    """
+    Get the files included by an ``Include`` or ``IncludeOptional``
+    directive.
+
+    :param line: directive, as yielded by :func:`logical_lines`
+    :param directory: directory of its file
+
+    :return: sorted :class:`list` of absolute paths, ``None`` if ``line``
+        is not an ``Include`` or ``IncludeOptional`` directive
+
+    :raise: :exc:`~pymodsecurity.exceptions.BundleError` if an ``Include``
+        directive matches no file
+    """
+    include = _INCLUDE.match(line)
+    if not include:
+        return None
+
+    directive, pattern = include.groups()
+    pattern = os.path.join(directory, _unquote(pattern))
+    filenames = sorted(glob.glob(pattern))
+    if not filenames and directive.lower() == "include":
+        raise BundleError("No file matches " + pattern)
+    return [os.path.abspath(filename) for filename in filenames]
+
+
+def _resolve_file(path, output, stack, external):
+    path = os.path.abspath(path)
+    if path in stack:
+        raise BundleError("Include loop on " + path)
+    stack.append(path)
+    directory = os.path.dirname(path)
+
+    for line in logical_lines(path):
+        stripped = line.strip()
+        if not stripped or stripped.startswith("#"):
+            continue
+
+        filenames = included_files(line, directory)
+        if filenames is None:
+            output.append(resolve_paths(line, directory,
+                                        external=external))
+            continue
+        for filename in filenames:
+            _resolve_file(filename, output, stack, external)
+
+    stack.pop()
+
+
+def resolve(path, external=None):
+    """
+    Get the configuration stored in ``path`` as a single text.
+
+    ``Include`` and ``IncludeOptional`` directives are replaced by the
+    content of the included files, ``@pmFromFile`` and ``@ipMatchFromFile``
+    operators by ``@pm`` and ``@ipMatch`` with the content of the data
+    files. Comments and empty lines are removed. Other files are referred
+    to by their absolute path.
+
+    :param path: path to the main configuration file
+    :param external: :class:`list` to which the files the configuration
+        still refers to are appended, if not ``None``
+
+    :return: configuration as :class:`str`
+    """
+    output = []
+    _resolve_file(path, output, [], external)
+    return "\n".join(output) + "\n"
+
+
+def write(path, plain_rules, rule_count=0):
+    """
+    Write a bundle holding ``plain_rules``.
+
+    The bundle is written in a temporary file first, then moved to ``path``
+    so that readers never see a partial bundle.
+
+    :param path: path to the bundle
+    :param plain_rules: ModSecurity rules as :class:`str`
+    :param rule_count: number of rules in ``plain_rules``
+    """
+    data = plain_rules.encode("utf-8")
+    header = _HEADER.pack(MAGIC, VERSION, rule_count, len(data),
+                          zlib.crc32(data))
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(header)
+            f.write(zlib.compress(data, 9))
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+def is_bundle(path):
+    """
+    Check whether ``path`` is a bundle written by :func:`write`.
+
+    :param path: path to a file
+    """
+    try:
+        with open(path, "rb") as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+
+def read(path):
+    """
+    Read a bundle written by :func:`write`.
+
+    :param path: path to the bundle
+
+    :return: ``(rule_count, plain_rules)`` where ``plain_rules`` is the
+        configuration as :class:`bytes`
+    """
+    try:
+        with open(path, "rb") as f, \
+                mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as view:
+            if len(view) < _HEADER.size:
+                raise BundleError(path + " is not a rules bundle")
+            magic, version, rule_count, size, crc = _HEADER.unpack_from(view)
+            if magic != MAGIC:
+                raise BundleError(path + " is not a rules bundle")
+            if version != VERSION:
+                raise BundleError("Unsupported bundle version " +
+                                  str(version))
+
+            payload = memoryview(view)[_HEADER.size:]
+            try:
+                data = zlib.decompress(payload)
+            except zlib.error as error:
+                raise BundleError("Corrupted bundle " + path + ": " +
+                                  str(error))
+            finally:
+                payload.release()
+    except (OSError, ValueError) as error:
+        raise BundleError("Cannot read " + path + ": " + str(error))
+
+    if len(data) != size or zlib.crc32(data) != crc:
+        raise BundleError("Corrupted bundle " + path)
+    return rule_count, data
+
+
+def build(source, destination, validate=True, strict=False):
+    """
+    Build a bundle from a configuration file.
+
+    A :class:`RuntimeWarning` is emitted if the bundle still refers to files
+    which could not be inlined.
+
+    :param source: path to the main configuration file
+    :param destination: path to the bundle
+    :param validate: load the resolved configuration with libmodsecurity
+        before writing the bundle
+    :param strict: raise instead of warning if the bundle still refers to
+        files
+
+    :return: number of rules in the bundle as :class:`int`, ``0`` if
+        ``validate`` is ``False``
+
+    :raise: :exc:`~pymodsecurity.exceptions.InternalError` if
+        libmodsecurity rejects the configuration,
+        :exc:`~pymodsecurity.exceptions.BundleError` if ``strict`` is
+        ``True`` and the bundle still refers to files
+    """
+    external = []
+    plain_rules = resolve(source, external)
+    if external:
+        message = "The bundle still refers to " + ", ".join(external)
+        if strict:
+            raise BundleError(message)
+        warnings.warn(message, RuntimeWarning, stacklevel=2)
+
+    rule_count = 0
+    if validate:
+        from pymodsecurity.rules import Rules
+
+        with Rules() as rules:
+            rule_count = rules.add_rules(plain_rules)
+
+    write(destination, plain_rules, rule_count)
+    return rule_count
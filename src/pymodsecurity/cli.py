@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""
+pymodsecurity.cli
+-----------------
+
+Command line tools shipped with pymodsecurity, available as the
+``pymodsecurity`` command.
+"""
+
+import argparse
+import sys
+
+from pymodsecurity import bundle, profiler
+from pymodsecurity.exceptions import Error
+
+
+def _bundle(args):
+    rule_count = bundle.build(args.source, args.destination,
+                              validate=not args.no_validate,
+                              strict=args.strict)
+    if not args.no_validate:
+        print(str(rule_count) + " rules written to " + args.destination)
+
+
+def _profile(args):
+    rule_profiler = profiler.RuleLoadProfiler()
+    total = rule_profiler.load_file(args.source)
+    print(rule_profiler.format_report(args.limit), end="")
+    print("{} rules loaded in {:.2f} ms".format(total.rules,
+                                                 total.seconds * 1000))
+
+
+def _parser():
+    parser = argparse.ArgumentParser(prog="pymodsecurity")
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.required = True
+
+    bundle_parser = subparsers.add_parser(
+        "bundle",
+        help="build a single-file rules bundle from a configuration file")
+    bundle_parser.add_argument("source",
+                               help="main configuration file")
+    bundle_parser.add_argument("destination",
+                               help="bundle file to write")
+    bundle_parser.add_argument("--no-validate", action="store_true",
+                               help="do not load the rules with "
+                                    "libmodsecurity before writing them")
+    bundle_parser.add_argument("--strict", action="store_true",
+                               help="fail if some files cannot be inlined")
+    bundle_parser.set_defaults(function=_bundle)
+
+    profile_parser = subparsers.add_parser(
+        "profile",
+        help="report the files and includes slowest to load")
+    profile_parser.add_argument("source",
+                                help="main configuration file")
+    profile_parser.add_argument("--limit", type=int, default=20,
+                                help="number of steps to report")
+    profile_parser.set_defaults(function=_profile)
+
+    return parser
+
+
+def main(argv=None):
+    args = _parser().parse_args(argv)
+    try:
+        args.function(args)
+    except Error as error:
+        print("pymodsecurity: " + str(error), file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
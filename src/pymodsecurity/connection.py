@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""
+pymodsecurity.connection
+------------------------
+
+Provide a class :class:`Connection` creating the transactions of the
+requests carried by a client connection, such as an HTTP keep-alive or
+HTTP/2 connection.
+"""
+
+import threading
+import weakref
+
+from pymodsecurity.transaction import Transaction
+from pymodsecurity.utils import as_bytes
+
+
+class Connection:
+    """
+    Client connection whose endpoints are encoded once for all the
+    transactions it carries.
+
+    Transactions are independent from each other: several of them can be
+    inspected at the same time, e.g. for the streams of an HTTP/2
+    connection.
+
+    :param modsecurity: an instance of
+        :class:`~pymodsecurity.modsecurity.ModSecurity`
+    :param rules: an instance of :class:`~pymodsecurity.rules.Rules`
+    :param client: ``(ip, port)`` of the client
+    :param server: ``(ip, port)`` of the server
+    """
+    __slots__ = ("modsecurity",
+                 "rules",
+                 "client",
+                 "server",
+                 "_endpoints",
+                 "_transactions",
+                 "_lock",
+                 "__weakref__")
+
+    def __init__(self, modsecurity, rules, client, server):
+        self.modsecurity = modsecurity
+        self.rules = rules
+        self.client = client
+        self.server = server
+        self._endpoints = (as_bytes(client[0]), int(client[1]),
+                           as_bytes(server[0]), int(server[1]))
+        self._transactions = weakref.WeakSet()
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def new_transaction(self, log_data=None, return_interventions=False):
+        """
+        Create a transaction on which the connection phase is performed.
+
+        :param log_data: object passed to the log callback
+        :param return_interventions: see
+            :class:`~pymodsecurity.transaction.Transaction`
+
+        :return: an instance of
+            :class:`~pymodsecurity.transaction.Transaction`
+
+        .. note:: An intervention asked during the connection phase is
+            reported by
+            :meth:`~pymodsecurity.transaction.Transaction.get_intervention`
+            until the next phase: check it before going on with the request.
+        """
+        transaction = Transaction(self.modsecurity, self.rules, log_data,
+                                  return_interventions)
+        try:
+            transaction.process_connection(*self._endpoints)
+        except BaseException:
+            transaction.close()
+            raise
+        with self._lock:
+            self._transactions.add(transaction)
+        return transaction
+
+    @property
+    def active(self):
+        """
+        Number of transactions created by this connection and not closed
+        yet.
+        """
+        with self._lock:
+            return sum(1 for transaction in self._transactions
+                       if not transaction.closed)
+
+    def detach(self, transaction):
+        """
+        Stop tracking a transaction: it is not closed by :meth:`close`
+        anymore, e.g. once handed to a
+        :class:`~pymodsecurity.scheduler.LoggingScheduler` which closes it
+        after logging it.
+
+        :param transaction: a transaction created by :meth:`new_transaction`
+        """
+        with self._lock:
+            self._transactions.discard(transaction)
+
+    def close(self):
+        """
+        Close every transaction of the connection still open, except the
+        detached ones.
+
+        Calling this method several times has no effect.
+
+        .. warning:: Transactions handed to a
+            :class:`~pymodsecurity.scheduler.LoggingScheduler` are closed too,
+            whether they have been logged or not, unless they have been
+            detached with :meth:`detach` first.
+        """
+        with self._lock:
+            transactions = list(self._transactions)
+            self._transactions.clear()
+        for transaction in transactions:
+            transaction.close()
@@ -0,0 +1,573 @@
+# -*- coding: utf-8 -*-
+"""
+pymodsecurity.connector
+-----------------------
+
+Provide a class :class:`Connector`, a WSGI middleware inspecting requests
+and responses of a WSGI application with libmodsecurity.
+"""
+
+import functools
+import http
+import time
+import urllib.parse
+
+from pymodsecurity import metrics
+from pymodsecurity.admission import BYPASS, DETECTION_ONLY, REJECT
+from pymodsecurity.exceptions import LatencyBudgetExceeded
+from pymodsecurity.prefilter import ALLOW, DENY
+from pymodsecurity.spool import RequestBodySpooler
+from pymodsecurity.transaction import Transaction
+
+
+# Budget of a response body not looked up yet.
+_UNKNOWN = object()
+
+
+def _request_uri(environ):
+    """
+    Get the URI of the request as sent by the client, with its query string.
+    """
+    uri = environ.get("RAW_URI") or environ.get("REQUEST_URI")
+    if uri:
+        return uri
+
+    uri = urllib.parse.quote(environ.get("SCRIPT_NAME", "") +
+                             environ.get("PATH_INFO", ""),
+                             safe="/;=,", encoding="latin1")
+    query = environ.get("QUERY_STRING")
+    if query:
+        uri += "?" + query
+    return uri
+
+
+def _request_headers(environ):
+    """
+    Yield ``(key, value)`` request headers found in a WSGI environment.
+    """
+    for key, value in environ.items():
+        if key.startswith("HTTP_"):
+            yield key[5:].replace("_", "-").title(), value
+    for key in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+        value = environ.get(key)
+        if value:
+            yield key.replace("_", "-").title(), value
+
+
+def _content_length(environ):
+    try:
+        return max(int(environ.get("CONTENT_LENGTH") or 0), 0)
+    except ValueError:
+        return 0
+
+
+def _header(headers, name):
+    """
+    Get the value of a header from a list of ``(key, value)``, ``None`` if
+    it is missing.
+
+    :param name: lowercase header name
+    """
+    for key, value in headers:
+        if key.lower() == name:
+            return value
+    return None
+
+
+def _close(result):
+    if hasattr(result, "close"):
+        result.close()
+
+
+def _append_response_body(transaction, body, budget):
+    """
+    Append the chunks of a response body to a transaction, up to ``budget``
+    bytes if it is not ``None``.
+    """
+    for chunk in body:
+        if budget is not None:
+            if budget <= 0:
+                break
+            chunk = chunk[:budget]
+            budget -= len(chunk)
+        if chunk:
+            transaction.append_response_body(chunk)
+
+
+class _Slot:
+    """
+    Slot of a request in an
+    :class:`~pymodsecurity.admission.AdmissionControl`, given back while the
+    application runs.
+    """
+    def __init__(self, admission, admitted):
+        self.admission = admission
+        self.admitted = admitted
+        self.held = True
+
+    def acquire(self):
+        """
+        Take a slot again, shed according to the policy of ``admission``.
+
+        :return: ``True`` if the request is admitted
+        """
+        self.admitted = self.admission.acquire()
+        self.held = (self.admitted or
+                     self.admission.policy == DETECTION_ONLY)
+        return self.admitted
+
+    def release(self):
+        """
+        Give back the slot, if it is held.
+        """
+        if self.held:
+            self.held = False
+            self.admission.release(self.admitted)
+
+
+class _ClosingBody:
+    """
+    Response body of the application, passed as is, calling ``finish`` if it
+    is set once the body is closed.
+    """
+    def __init__(self, result):
+        self._result = result
+        self.finish = None
+
+    def __iter__(self):
+        return iter(self._result)
+
+    def close(self):
+        try:
+            _close(self._result)
+        finally:
+            if self.finish is not None:
+                self.finish()
+
+
+class _StreamedBody(_ClosingBody):
+    """
+    Response body made of an inspected prefix followed by the rest of the
+    application's body, streamed without inspection.
+
+    Bytes not inspected are recorded by the response policy once the body
+    is closed, then ``finish`` is called if it is set.
+    """
+    def __init__(self, prefix, chunks, result, truncated, policy=None,
+                 content_type=None):
+        super().__init__(result)
+        self._prefix = prefix
+        self._chunks = chunks
+        self._truncated = truncated
+        self._policy = policy
+        self._content_type = content_type
+
+    def __iter__(self):
+        for chunk in self._prefix:
+            yield chunk
+        for chunk in self._chunks:
+            self._truncated += len(chunk)
+            yield chunk
+
+    def close(self):
+        try:
+            if self._policy is not None:
+                self._policy.record(self._content_type, self._truncated)
+                stats = metrics.library
+                if stats is not None:
+                    stats.response_body_truncated_bytes.inc(self._truncated)
+        finally:
+            super().close()
+
+
+def _deny(start_response, status, url=None):
+    """
+    Send the response of a disruptive intervention.
+    """
+    if url and 300 <= status < 400:
+        headers = [("Location", url)]
+    else:
+        headers = []
+        if status < 400:
+            status = 403
+
+    try:
+        phrase = http.HTTPStatus(status).phrase
+    except ValueError:
+        phrase = "Unknown"
+    body = (str(status) + " " + phrase + "\n").encode("ascii")
+
+    headers += [("Content-Type", "text/plain"),
+                ("Content-Length", str(len(body)))]
+    start_response(str(status) + " " + phrase, headers)
+    return [body]
+
+
+class Connector:
+    """
+    WSGI middleware inspecting each request and response of
+    ``application`` in its own :class:`~pymodsecurity.transaction.Transaction`.
+
+    Requests are answered with an error instead of being passed to
+    ``application`` when ModSecurity asks for a disruptive intervention
+    during the request phases. Responses are buffered until the response
+    phases are performed, or up to the budget of ``response_policy``.
+
+    :param application: WSGI application
+    :param modsecurity: an instance of
+        :class:`~pymodsecurity.modsecurity.ModSecurity`
+    :param rules: an instance of :class:`~pymodsecurity.rules.Rules`
+    :param prefilter: an instance of
+        :class:`~pymodsecurity.prefilter.IPPrefilter` checked before any
+        transaction is created
+    :param exclusions: an instance of
+        :class:`~pymodsecurity.exclusions.URIExclusions`, requests it
+        excludes are passed to ``application`` without any transaction
+    :param scheduler: an instance of
+        :class:`~pymodsecurity.scheduler.LoggingScheduler` to log
+        transactions in the background, they are logged before returning the
+        response otherwise
+    :param spooler: an instance of
+        :class:`~pymodsecurity.spool.RequestBodySpooler` feeding request
+        bodies, one with default settings if ``None``
+    :param response_policy: an instance of
+        :class:`~pymodsecurity.response_policy.ResponseBodyPolicy` bounding
+        the inspected part of response bodies, whole bodies are inspected
+        if ``None``
+    :param memory_accounting: an instance of
+        :class:`~pymodsecurity.memory.MemoryAccounting` measuring the memory
+        allocated by each transaction, without its logging and cleanup when
+        it is logged by ``scheduler``
+    :param latency_budget: an instance of
+        :class:`~pymodsecurity.latency.LatencyBudget` bounding the time
+        spent inspecting each request, a transaction over budget is logged
+        and closed once its last phase is done
+    :param admission: an instance of
+        :class:`~pymodsecurity.admission.AdmissionControl` bounding the
+        number of requests inspected at the same time, a request gives back
+        its slot while the application runs and takes one again for the
+        response phases, shed according to the policy if none is left, and
+        keeps it until its phases are done, even past the latency budget
+    """
+    def __init__(self, application, modsecurity, rules,
+                 prefilter=None, exclusions=None, scheduler=None,
+                 spooler=None, response_policy=None, memory_accounting=None,
+                 latency_budget=None, admission=None):
+        self.application = application
+        self.modsecurity = modsecurity
+        self.rules = rules
+        self.prefilter = prefilter
+        self.exclusions = exclusions
+        self.scheduler = scheduler
+        if spooler is None:
+            spooler = RequestBodySpooler()
+        self.spooler = spooler
+        self.response_policy = response_policy
+        self.memory_accounting = memory_accounting
+        self.latency_budget = latency_budget
+        self.admission = admission
+
+    def __call__(self, environ, start_response):
+        if self.prefilter is not None:
+            decision = self.prefilter.lookup(environ.get("REMOTE_ADDR", ""))
+            if decision == ALLOW:
+                return self.application(environ, start_response)
+            if decision == DENY:
+                return _deny(start_response, 403)
+
+        uri = _request_uri(environ)
+        if self.exclusions is not None and self.exclusions.excluded(uri):
+            return self.application(environ, start_response)
+
+        admission = self.admission
+        if admission is None:
+            return self._inspect(environ, start_response, uri)
+        admitted = admission.acquire()
+        if not admitted:
+            if admission.policy == BYPASS:
+                return self.application(environ, start_response)
+            if admission.policy == REJECT:
+                return _deny(start_response, admission.status)
+        return self._inspect(environ, start_response, uri,
+                             detection_only=not admitted,
+                             slot=_Slot(admission, admitted))
+
+    def _inspect(self, environ, start_response, uri, detection_only=False,
+                 slot=None):
+        """
+        Inspect a request and its response in a new transaction.
+
+        :param detection_only: let ModSecurity log the interventions without
+            enforcing them
+        :param slot: admission slot of the request, released once the phases
+            are done, which may be after returning if a phase ran over the
+            latency budget
+        """
+        pending = None
+        try:
+            usage = None
+            if self.memory_accounting is not None:
+                usage = self.memory_accounting.start(uri)
+            # Without return_interventions, phases never return an
+            # intervention.
+            transaction = Transaction(self.modsecurity, self.rules,
+                                      return_interventions=not detection_only)
+            if usage is not None:
+                transaction.memory = usage
+                usage.record("creation")
+            if self.latency_budget is not None:
+                transaction.latency = self.latency_budget.start(uri)
+            stream = environ.get("wsgi.input")
+            deferred = False
+            try:
+                try:
+                    intervention = self._inspect_request(transaction,
+                                                         environ, uri)
+                except LatencyBudgetExceeded as error:
+                    pending = error.pending
+                    if not self.latency_budget.fail_open:
+                        return _deny(start_response,
+                                     self.latency_budget.status)
+                    response = _ClosingBody(self.application(environ,
+                                                             start_response))
+                else:
+                    if intervention is not None:
+                        return _deny(start_response, intervention.status,
+                                     intervention.url)
+                    response, pending = self._inspect_response(
+                        transaction, environ, start_response, slot)
+                if isinstance(response, _ClosingBody):
+                    # The application may still read its input while its
+                    # body is iterated.
+                    response.finish = functools.partial(
+                        self._cleanup, transaction, environ, stream, pending)
+                    deferred = True
+                return response
+            finally:
+                if not deferred:
+                    self._cleanup(transaction, environ, stream, pending)
+        finally:
+            if slot is not None:
+                if pending is None:
+                    slot.release()
+                else:
+                    # The abandoned phase holds its slot until it is done.
+                    pending.add_done_callback(lambda future: slot.release())
+
+    def _cleanup(self, transaction, environ, stream, pending):
+        """
+        Close the spooled request body, then finish the transaction, once
+        ``pending`` is done if it is not ``None``.
+
+        :param stream: ``wsgi.input`` as received from the server
+        """
+        body = environ.get("wsgi.input")
+        if body is not stream:
+            body.close()
+        if pending is None:
+            self._finish(transaction)
+        else:
+            # The phase still runs on a worker, which finishes the
+            # transaction once it is done. A failure of the phase is counted
+            # in the failed attribute of the latency budget.
+            pending.add_done_callback(
+                lambda future: self._finish(transaction))
+
+    def _inspect_request(self, transaction, environ, uri):
+        """
+        Perform the request phases, stopping at the first intervention.
+
+        :return: an :class:`~pymodsecurity.transaction.Intervention` or
+            ``None``
+        """
+        intervention = self._phase(
+            transaction, "connection", transaction.process_connection,
+            environ.get("REMOTE_ADDR", ""),
+            environ.get("REMOTE_PORT") or 0,
+            environ.get("SERVER_ADDR") or environ.get("SERVER_NAME", ""),
+            environ.get("SERVER_PORT") or 0)
+        if intervention is not None:
+            return intervention
+
+        protocol = environ.get("SERVER_PROTOCOL", "HTTP/1.1")
+        intervention = self._phase(transaction, "uri",
+                                   transaction.process_uri,
+                                   uri,
+                                   environ.get("REQUEST_METHOD", "GET"),
+                                   protocol.partition("/")[2] or protocol)
+        if intervention is not None:
+            return intervention
+
+        for key, value in _request_headers(environ):
+            transaction.add_request_header(key, value)
+        intervention = self._phase(transaction, "request_headers",
+                                   transaction.process_request_headers)
+        if intervention is not None:
+            return intervention
+
+        length = _content_length(environ)
+        if length:
+            environ["wsgi.input"] = self.spooler.feed(transaction,
+                                                      environ["wsgi.input"],
+                                                      length)
+        return self._phase(transaction, "request_body",
+                           transaction.process_request_body)
+
+    def _inspect_response(self, transaction, environ, start_response,
+                          slot=None):
+        """
+        Run ``application`` then perform the response phases on its
+        response.
+
+        The body is buffered up to the budget of the response policy,
+        chunks sent to the ``write()`` callable included. Past it, the
+        buffered prefix is inspected and the rest is streamed from
+        ``application`` without inspection.
+
+        An admitted ``slot`` is given back while ``application`` runs and
+        its body is buffered, then taken again for the response phases.
+
+        :return: ``(body, pending)`` where ``pending`` is the future of a
+            phase over the latency budget, ``None`` otherwise
+        """
+        response = []
+        body = []
+        size = 0
+
+        def write(chunk):
+            nonlocal size
+            body.append(chunk)
+            size += len(chunk)
+
+        def _start_response(status, headers, exc_info=None):
+            response[:] = [status, headers, exc_info]
+            return write
+
+        if slot is not None and slot.admitted:
+            slot.release()
+        result = self.application(environ, _start_response)
+        chunks = iter(result)
+        budget = _UNKNOWN
+        streamed = False
+        try:
+            for chunk in chunks:
+                write(chunk)
+                if budget is _UNKNOWN:
+                    budget = self._response_budget(response[1])
+                if budget is not None and size > budget:
+                    streamed = True
+                    break
+        finally:
+            if not streamed:
+                _close(result)
+                result = None
+
+        status, headers, exc_info = response
+        if budget is _UNKNOWN:
+            # The body, if any, was sent to write()
+            budget = self._response_budget(headers)
+        truncated = budget is not None and size > budget
+        enforce = True
+        if slot is not None and not slot.held and not slot.acquire():
+            admission = slot.admission
+            if admission.policy == REJECT:
+                _close(result)
+                return _deny(start_response, admission.status), None
+            if admission.policy == BYPASS:
+                start_response(status, headers, exc_info)
+                if streamed:
+                    body = _StreamedBody(body, chunks, result, 0)
+                return body, None
+            enforce = False
+        try:
+            for key, value in headers:
+                transaction.add_response_header(key, value)
+            intervention = self._phase(
+                transaction, "response_headers",
+                transaction.process_response_headers,
+                int(status.split(None, 1)[0]),
+                environ.get("SERVER_PROTOCOL", "HTTP/1.1"))
+            if intervention is None:
+                _append_response_body(transaction, body, budget)
+                intervention = self._phase(transaction, "response_body",
+                                           transaction.process_response_body)
+        except LatencyBudgetExceeded as error:
+            if not self.latency_budget.fail_open:
+                _close(result)
+                return (_deny(start_response, self.latency_budget.status),
+                        error.pending)
+            intervention = None
+            pending = error.pending
+        except BaseException:
+            _close(result)
+            raise
+        else:
+            pending = None
+
+        if intervention is not None and enforce:
+            _close(result)
+            return _deny(start_response, intervention.status,
+                         intervention.url), None
+
+        start_response(status, headers, exc_info)
+        if truncated:
+            body = _StreamedBody(body, chunks, result, size - budget,
+                                 self.response_policy,
+                                 _header(headers, "content-type"))
+        return body, pending
+
+    def _response_budget(self, headers):
+        if self.response_policy is None:
+            return None
+        return self.response_policy.budget(_header(headers, "content-type"))
+
+    def _phase(self, transaction, phase, function, *pargs):
+        """
+        Perform a phase with ``function``, which checks for an intervention
+        in the same call.
+
+        :return: an :class:`~pymodsecurity.transaction.Intervention` or
+            ``None``
+        """
+        if (transaction.latency is not None and
+                phase in self.latency_budget.phases):
+            pargs = (transaction.latency, phase, function) + pargs
+            function = self.latency_budget.run
+
+        stats = metrics.library
+        if stats is None:
+            intervention = function(*pargs)
+        else:
+            start = time.perf_counter()
+            intervention = function(*pargs)
+            stats.phase_latencies[phase].observe(time.perf_counter() - start)
+        if transaction.memory is not None:
+            transaction.memory.record(phase)
+        return intervention
+
+    def _finish(self, transaction):
+        stats = metrics.library
+        if stats is not None:
+            stats.rule_hits.inc(len(transaction.get_matched_rules_info()))
+
+        usage = transaction.memory
+        if self.scheduler is not None:
+            # Logged and closed later, on the scheduler thread.
+            self.scheduler.schedule(transaction)
+        else:
+            if stats is None:
+                transaction.process_logging()
+            else:
+                start = time.perf_counter()
+                transaction.process_logging()
+                stats.phase_latencies["logging"].observe(
+                    time.perf_counter() - start)
+            if usage is not None:
+                usage.record("logging")
+            transaction.close()
+
+        if usage is not None:
+            # Closed later by the scheduler: its cleanup cannot be measured
+            # here.
+            self.memory_accounting.finish(usage,
+                                          cleanup=self.scheduler is None)
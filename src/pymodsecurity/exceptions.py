@@ -20,6 +20,13 @@ class Error(Exception):
         super().__init__(message, *pargs, **kargs)
 
 
+class ClosedError(Error):
+    """
+    Error raised when an instance is used after being closed.
+    """
+    default_message = "Instance is closed"
+
+
 class InternalError(Error):
     """
     Error raised when libmodsecurity has fed an error pointer.
@@ -52,3 +59,27 @@ class LoggingActionError(Error):
     a transaction.
     """
     default_message = "Failed to log information about the transaction"
+
+
+class LatencyBudgetExceeded(Error):
+    """
+    Error raised when a phase does not finish within the latency budget of
+    its transaction.
+
+    .. attribute:: pending
+
+        :class:`concurrent.futures.Future` of the phase, still running on a
+        worker: the transaction must not be used before it is done.
+    """
+    default_message = "Transaction over its latency budget"
+
+    def __init__(self, message=None, pending=None):
+        super().__init__(message)
+        self.pending = pending
+
+
+class BundleError(Error):
+    """
+    Error raised when a rules bundle cannot be built or read.
+    """
+    default_message = "Invalid rules bundle"
@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+"""
+pymodsecurity.exclusions
+------------------------
+
+Provide a class :class:`URIExclusions` telling which requests do not need
+to be inspected from their path, before any libmodsecurity work.
+
+Exclusions are configured with directives written one per line, in the
+same fashion as ModSecurity rules::
+
+    # Static assets
+    ExcludePrefix /static/ /media/
+    ExcludeExtension .woff2 .png .css
+    ExcludePath /healthz
+
+``ExcludePrefix`` excludes paths starting with one of its arguments,
+``ExcludeExtension`` paths whose last segment ends with one of its arguments
+(case-insensitive) and ``ExcludePath`` paths equal to one of its arguments.
+"""
+
+# Trie key marking the end of a prefix.
+_END = None
+
+# Paths holding one of these are always inspected: once decoded or
+# normalized by the application, they could point outside of an excluded
+# prefix.
+_UNSAFE = ("%", "/.", "//", "\\", ";")
+
+
+def _parse(config, origin="<config>"):
+    """
+    Parse exclusion directives.
+
+    :return: ``(prefixes, extensions, paths)`` as :class:`list`
+    """
+    prefixes = []
+    extensions = []
+    paths = []
+    directives = {"excludeprefix": prefixes,
+                  "excludeextension": extensions,
+                  "excludepath": paths}
+
+    for number, line in enumerate(config.splitlines(), 1):
+        line = line.split("#", 1)[0].strip()
+        if not line:
+            continue
+
+        directive, *arguments = line.split()
+        values = directives.get(directive.lower())
+        if values is None or not arguments:
+            raise ValueError(origin + ":" + str(number) +
+                             ": invalid directive: " + line)
+        values.extend(arguments)
+
+    return prefixes, extensions, paths
+
+
+def _build(prefixes, extensions, paths):
+    trie = {}
+    for prefix in prefixes:
+        node = trie
+        for char in prefix:
+            node = node.setdefault(char, {})
+        node[_END] = True
+
+    extensions = frozenset(extension.lower() for extension in extensions)
+    longest = max((len(extension) for extension in extensions), default=0)
+    return trie, extensions, longest, frozenset(paths)
+
+
+class URIExclusions:
+    """
+    Index of paths excluded from inspection, made of a prefix trie, a set of
+    file extensions and a set of exact paths.
+
+    Paths holding percent-encoded characters, dot segments, empty segments,
+    backslashes or semicolons are never excluded, so that a crafted URI
+    cannot escape inspection.
+
+    :param prefixes: iterable of excluded path prefixes
+    :param extensions: iterable of excluded file extensions, with their dot
+    :param paths: iterable of excluded paths
+    """
+    def __init__(self, prefixes=(), extensions=(), paths=()):
+        self._index = _build(prefixes, extensions, paths)
+
+        #: Number of URIs excluded from inspection.
+        self.hits = 0
+        #: Number of URIs to be inspected.
+        self.misses = 0
+
+    @classmethod
+    def from_file(cls, path):
+        """
+        Create an index from a file of exclusion directives.
+
+        :param path: path to the configuration file
+
+        :return: an instance of :class:`URIExclusions`
+        """
+        exclusions = cls()
+        exclusions.load_file(path)
+        return exclusions
+
+    def load(self, config, origin="<config>"):
+        """
+        Replace the exclusions with the ones defined by ``config``.
+
+        The new index is built before replacing the current one in a single
+        step, so that concurrent lookups use either the old or the new one.
+
+        :param config: exclusion directives as :class:`str`
+        :param origin: name of the configuration used in error messages
+        """
+        self._index = _build(*_parse(config, origin))
+
+    def load_file(self, path):
+        """
+        Replace the exclusions with the ones defined in a file, see
+        :meth:`load`.
+
+        :param path: path to the configuration file
+        """
+        with open(path) as f:
+            self.load(f.read(), path)
+
+    def excluded(self, uri):
+        """
+        Check whether a request does not need to be inspected.
+
+        :param uri: URI of the request, with its query string
+
+        :return: ``True`` if the request must not be inspected
+        """
+        trie, extensions, longest, paths = self._index
+        path = uri.partition("?")[0]
+        if any(unsafe in path for unsafe in _UNSAFE):
+            self.misses += 1
+            return False
+
+        if path in paths:
+            self.hits += 1
+            return True
+
+        if extensions:
+            segment = path[path.rfind("/") + 1:]
+            dot = segment.rfind(".", max(len(segment) - longest, 0))
+            while dot != -1:
+                if segment[dot:].lower() in extensions:
+                    self.hits += 1
+                    return True
+                dot = segment.rfind(".", max(len(segment) - longest, 0),
+                                    dot)
+
+        node = trie
+        for char in path:
+            node = node.get(char)
+            if node is None:
+                break
+            if _END in node:
+                self.hits += 1
+                return True
+
+        self.misses += 1
+        return False
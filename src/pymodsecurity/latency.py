@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+"""
+pymodsecurity.latency
+---------------------
+
+Provide a class :class:`LatencyBudget` bounding the time a request waits
+for the inspection of its transaction.
+
+The slow phases of a transaction, its body phases by default, are performed
+on a pool of worker threads while the request's thread waits for them up to
+the time left in the budget. libmodsecurity runs without holding the GIL,
+so a phase keeps running on its worker once the request has given up on it.
+"""
+
+import collections
+import concurrent.futures
+import threading
+import time
+
+from pymodsecurity import metrics
+from pymodsecurity.exceptions import LatencyBudgetExceeded
+
+
+#: A transaction which ran over its budget: its URI, the phase it was
+#: waiting for, the seconds elapsed since it was created and the time of the
+#: event, as returned by :func:`time.time`.
+BudgetEvent = collections.namedtuple("BudgetEvent", ("uri",
+                                                     "phase",
+                                                     "elapsed",
+                                                     "time"))
+
+
+class LatencyTimer:
+    """
+    Time left in the budget of a transaction, attached to it as its
+    ``latency`` attribute.
+    """
+    __slots__ = ("uri", "start", "deadline")
+
+    def __init__(self, uri, budget):
+        self.uri = uri
+        self.start = time.perf_counter()
+        self.deadline = self.start + budget
+
+    def remaining(self):
+        """
+        Seconds left in the budget, negative once it is exceeded.
+        """
+        return self.deadline - time.perf_counter()
+
+
+class LatencyBudget:
+    """
+    Latency budget of each transaction.
+
+    When a phase is still running once the budget of its transaction is
+    spent, the request fails open, going on without further inspection, or
+    closed, answered with ``status``. The phase finishes on its worker, the
+    transaction must only be logged and closed once it is done.
+
+    If every worker is busy, phases wait in the pool queue and count against
+    the budget: a slow inspection only holds up its worker, not the requests
+    queued behind it.
+
+    .. warning:: With the defaults, at most 4 body phases run at the same
+        time across every request, and requests over budget fail open:
+        under load, or with a payload crafted to be slow to inspect,
+        requests reach the application without their bodies being fully
+        inspected. Size ``workers`` to the expected concurrency, and set
+        ``fail_open`` to ``False`` where an unchecked request is worse than
+        an error.
+
+    :param budget: seconds allowed to the phases of a transaction
+    :param fail_open: pass requests over budget to the application, or
+        answer them with ``status``
+    :param status: HTTP status of the requests over budget, if not
+        ``fail_open``
+    :param phases: names of the phases performed on the workers, the other
+        ones are performed in the request's thread
+    :param workers: number of worker threads
+    :param max_events: number of :class:`BudgetEvent` kept in :attr:`events`
+    """
+    def __init__(self, budget, fail_open=True, status=503,
+                 phases=("request_body", "response_body"), workers=4,
+                 max_events=1024):
+        self.budget = budget
+        self.fail_open = fail_open
+        self.status = status
+        self.phases = frozenset(phases)
+
+        #: Latest :class:`BudgetEvent`, oldest first.
+        self.events = collections.deque(maxlen=max_events)
+        #: Number of transactions which ran over their budget.
+        self.exceeded = 0
+        #: Number of phases over budget which raised once done on their
+        #: worker.
+        self.failed = 0
+        self._lock = threading.Lock()
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            workers, thread_name_prefix="pymodsecurity-inspection")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """
+        Wait for the phases still running, then stop the workers.
+        """
+        self._executor.shutdown(wait=True)
+
+    def start(self, uri):
+        """
+        Start the budget of a transaction, once it is created.
+
+        :param uri: URI of the request
+
+        :return: a :class:`LatencyTimer` to attach to the transaction as its
+            ``latency`` attribute
+        """
+        return LatencyTimer(uri, self.budget)
+
+    def run(self, timer, phase, function, *pargs):
+        """
+        Perform a phase on a worker, waiting for it up to the time left in
+        the budget.
+
+        Every call pays for handing the phase over to a worker and waking up
+        the request's thread once it is done, even well within the budget:
+        keep cheap phases out of :attr:`phases`.
+
+        :param timer: :class:`LatencyTimer` of the transaction
+        :param phase: name of the phase
+        :param function: function performing the phase
+
+        :return: the value returned by ``function``
+
+        :raise: :exc:`~pymodsecurity.exceptions.LatencyBudgetExceeded` if
+            the phase is not done in time, whose ``pending`` attribute is the
+            future of the phase, ``None`` if it never started
+        """
+        future = self._executor.submit(function, *pargs)
+        try:
+            return future.result(max(timer.remaining(), 0))
+        except concurrent.futures.TimeoutError:
+            pass
+
+        if future.cancel():
+            future = None
+        else:
+            # Nobody waits for its result anymore.
+            future.add_done_callback(self._done)
+        self._record(timer, phase)
+        raise LatencyBudgetExceeded(pending=future)
+
+    def _done(self, future):
+        if future.exception() is not None:
+            with self._lock:
+                self.failed += 1
+
+    def _record(self, timer, phase):
+        event = BudgetEvent(timer.uri, phase,
+                            time.perf_counter() - timer.start, time.time())
+        with self._lock:
+            self.exceeded += 1
+            self.events.append(event)
+        stats = metrics.library
+        if stats is not None:
+            stats.over_budget.labels(phase).inc()
@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+"""
+pymodsecurity.logmessage
+------------------------
+
+Provide a class :class:`LogMessage` giving access to the fields of the
+messages passed by libmodsecurity to the log callback, such as::
+
+    [client 192.0.2.1] ModSecurity: Warning. Matched "Operator `Rx' ..."
+    [file "/etc/modsecurity/rules.conf"] [line "12"] [id "942100"]
+    [msg "SQL Injection Attack"] [data "..."] [severity "2"]
+    [tag "attack-sqli"] [hostname "example.com"] [uri "/login"]
+    [unique_id "161480000066.953143"]
+"""
+
+
+# Value of the fields not extracted yet.
+_UNSET = object()
+
+
+def field(message, name):
+    """
+    Return the value of the first field ``[name "value"]`` of a message.
+
+    :param message: log message as :class:`str`
+    :param name: field name, such as ``"id"``
+
+    :return: the value as :class:`str`, ``None`` if the message has no such
+        field
+    """
+    marker = "[" + name + ' "'
+    position = message.find(marker)
+    if position == -1:
+        return None
+    position += len(marker)
+    end = message.find('"]', position)
+    if end == -1:
+        return None
+    return message[position:end]
+
+
+def last_field(message, name):
+    """
+    Return the value of the last field ``[name "value"]`` of a message.
+
+    Fields describing the request are written last by libmodsecurity: they
+    are found faster from the end.
+
+    :param message: log message as :class:`str`
+    :param name: field name, such as ``"uri"``
+
+    :return: the value as :class:`str`, ``None`` if the message has no such
+        field
+    """
+    marker = "[" + name + ' "'
+    position = message.rfind(marker)
+    if position == -1:
+        return None
+    position += len(marker)
+    end = message.find('"]', position)
+    if end == -1:
+        return None
+    return message[position:end]
+
+
+class LogMessage:
+    """
+    Parsed libmodsecurity log message.
+
+    Creating an instance only keeps the message: each field is extracted the
+    first time it is read, then stored. Fields missing from the message are
+    ``None``, values are kept as written in the message.
+
+    .. warning:: libmodsecurity does not escape the values it writes in the
+        message, so request data can mimic fields: use the record for
+        reporting, not for security decisions.
+
+    :param message: log message as :class:`str`, as passed to the callback
+        set with
+        :meth:`~pymodsecurity.modsecurity.ModSecurity.set_log_callback`
+
+    .. attribute:: message
+
+        The original message.
+
+    .. attribute:: id
+
+        ID of the matched rule.
+
+    .. attribute:: msg
+
+        Message of the matched rule.
+
+    .. attribute:: severity
+
+        Severity of the matched rule, as a digit from ``"0"`` (emergency) to
+        ``"7"`` (debug).
+
+    .. attribute:: tags
+
+        :class:`tuple` of the tags of the matched rule, empty if it has
+        none.
+
+    .. attribute:: data
+
+        Logged data of the matched rule.
+
+    .. attribute:: uri
+
+        URI of the request.
+
+    .. attribute:: unique_id
+
+        Unique ID of the transaction.
+    """
+    __slots__ = ("message",
+                 "_id",
+                 "_msg",
+                 "_severity",
+                 "_tags",
+                 "_data",
+                 "_uri",
+                 "_unique_id")
+
+    def __init__(self, message):
+        self.message = message
+        self._id = self._msg = self._severity = self._tags = self._data = \
+            self._uri = self._unique_id = _UNSET
+
+    @property
+    def id(self):
+        value = self._id
+        if value is _UNSET:
+            value = self._id = field(self.message, "id")
+        return value
+
+    @property
+    def msg(self):
+        value = self._msg
+        if value is _UNSET:
+            value = self._msg = field(self.message, "msg")
+        return value
+
+    @property
+    def severity(self):
+        value = self._severity
+        if value is _UNSET:
+            value = self._severity = field(self.message, "severity")
+        return value
+
+    @property
+    def tags(self):
+        value = self._tags
+        if value is _UNSET:
+            value = self._tags = self._parse_tags()
+        return value
+
+    @property
+    def data(self):
+        value = self._data
+        if value is _UNSET:
+            value = self._data = field(self.message, "data")
+        return value
+
+    @property
+    def uri(self):
+        value = self._uri
+        if value is _UNSET:
+            value = self._uri = last_field(self.message, "uri")
+        return value
+
+    @property
+    def unique_id(self):
+        value = self._unique_id
+        if value is _UNSET:
+            value = self._unique_id = last_field(self.message,
+                                                 "unique_id")
+        return value
+
+    def _parse_tags(self):
+        tags = []
+        message = self.message
+        position = message.find('[tag "')
+        while position != -1:
+            position += 6
+            end = message.find('"]', position)
+            if end == -1:
+                break
+            tags.append(message[position:end])
+            position = message.find('[tag "', end)
+        return tuple(tags)
+
+    def __repr__(self):
+        return "<LogMessage id={!r} msg={!r}>".format(self.id, self.msg)
@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+"""
+pymodsecurity.logsink
+---------------------
+
+Provide a class :class:`AggregatingLogSink` protecting a log callback from
+the storms of messages produced by libmodsecurity under attack, when it is
+called once per matched rule of every request::
+
+    sink = AggregatingLogSink(callback, rate=50)
+    modsecurity.set_log_callback(sink)
+"""
+
+import threading
+import time
+
+from pymodsecurity import logmessage
+
+
+# Fields appended to a message by libmodsecurity which change with every
+# request. Messages are compared without them.
+_REQUEST_FIELDS = (' [hostname "', ' [uri "', ' [unique_id "')
+_UNKNOWN_ID = "-"
+
+
+def _message_key(message):
+    """
+    Return the part of a message identifying it across requests: without
+    the leading client address and the request fields.
+    """
+    if message.startswith("[client "):
+        start = message.find("] ") + 2
+    else:
+        start = 0
+    end = len(message)
+    for field in _REQUEST_FIELDS:
+        position = message.find(field, start, end)
+        if position != -1:
+            end = position
+    return message[start:end]
+
+
+def _rule_id(message):
+    rule_id = logmessage.field(message, "id")
+    return _UNKNOWN_ID if rule_id is None else rule_id
+
+
+class AggregatingLogSink:
+    """
+    Log callback forwarding messages to another callback, at a bounded
+    pace.
+
+    Each message goes through these steps:
+
+    * its rule ID is counted;
+    * when more than ``cpu_budget`` seconds of CPU time have been spent in
+      the sink during the current second, the message is counted as shed;
+    * a message identical to one already seen during the current window,
+      apart from the client address, host name, URI and unique ID, is
+      counted as a duplicate;
+    * when the token bucket is empty, the message is counted as rate
+      limited;
+    * otherwise, it is forwarded to ``callback``.
+
+    Every ``summary_interval`` seconds, a summary of the counts is forwarded
+    to ``callback`` with ``None`` as data, and the counts are reset. Summaries
+    are emitted by the next message logged once the interval is over, or by
+    :meth:`flush`.
+
+    :param callback: callable taking ``(data, message)``, as accepted by
+        :meth:`~pymodsecurity.modsecurity.ModSecurity.set_log_callback`
+    :param window: number of seconds during which identical messages are
+        collapsed
+    :param rate: number of messages forwarded per second
+    :param burst: maximum number of messages forwarded at once, defaults to
+        ``rate``
+    :param summary_interval: number of seconds between two summaries,
+        ``None`` disables them
+    :param cpu_budget: maximum number of seconds of CPU time spent in the
+        sink per second, as measured by :func:`time.thread_time` in the
+        logging threads, ``None`` disables the limit
+    :param top_rules: number of rule IDs detailed in summaries
+    """
+    def __init__(self, callback, window=1.0, rate=100, burst=None,
+                 summary_interval=60.0, cpu_budget=0.05, top_rules=10):
+        self.callback = callback
+        self.window = window
+        self.rate = rate
+        self.burst = rate if burst is None else burst
+        self.summary_interval = summary_interval
+        self.cpu_budget = cpu_budget
+        self.top_rules = top_rules
+
+        #: Number of messages received, since the last summary.
+        self.received = 0
+        #: Number of messages forwarded, since the last summary.
+        self.forwarded = 0
+        #: Number of duplicate messages, since the last summary.
+        self.duplicates = 0
+        #: Number of messages over the rate limit, since the last summary.
+        self.rate_limited = 0
+        #: Number of messages over the CPU budget, since the last summary.
+        self.shed = 0
+        #: Messages counted by rule ID, since the last summary.
+        self.rule_counts = {}
+
+        now = time.perf_counter()
+        self._lock = threading.Lock()
+        self._seen = set()
+        self._window_end = now + window
+        self._tokens = float(self.burst)
+        self._refilled = now
+        self._cpu_second = now + 1
+        self._cpu_spent = 0.0
+        self._summary_due = (None if summary_interval is None
+                             else now + summary_interval)
+
+    def __call__(self, data, message):
+        cpu_start = time.thread_time()
+        start = time.perf_counter()
+        rule_id = _rule_id(message)
+        with self._lock:
+            summary = self._due_summary(start)
+            self.received += 1
+            self.rule_counts[rule_id] = self.rule_counts.get(rule_id, 0) + 1
+            if start >= self._cpu_second:
+                self._cpu_second = start + 1
+                self._cpu_spent = 0.0
+            if (self.cpu_budget is not None and
+                    self._cpu_spent >= self.cpu_budget):
+                self.shed += 1
+                forward = False
+            else:
+                forward = self._count(message, start)
+
+        if summary is None and not forward:
+            return
+        try:
+            if summary is not None:
+                self.callback(None, summary)
+            if forward:
+                self.callback(data, message)
+        finally:
+            elapsed = time.thread_time() - cpu_start
+            with self._lock:
+                self._cpu_spent += elapsed
+
+    def _count(self, message, now):
+        """
+        Count a message within the CPU budget.
+
+        :return: ``True`` if the message must be forwarded
+        """
+        if now >= self._window_end:
+            self._seen.clear()
+            self._window_end = now + self.window
+        key = _message_key(message)
+        if key in self._seen:
+            self.duplicates += 1
+            return False
+        self._seen.add(key)
+
+        self._tokens = min(self.burst,
+                           self._tokens + (now - self._refilled) * self.rate)
+        self._refilled = now
+        if self._tokens < 1:
+            self.rate_limited += 1
+            return False
+        self._tokens -= 1
+        self.forwarded += 1
+        return True
+
+    def _due_summary(self, now):
+        if self._summary_due is None or now < self._summary_due:
+            return None
+        self._summary_due = now + self.summary_interval
+        return self._reset()
+
+    def _reset(self):
+        """
+        Format the summary of the counts then reset them.
+        """
+        if not self.received:
+            return None
+
+        rules = sorted(self.rule_counts.items(),
+                       key=lambda item: (-item[1], item[0]))
+        summary = ("pymodsecurity: {} log messages, {} forwarded, "
+                   "{} duplicates, {} rate limited, {} shed; "
+                   "rules: {}").format(
+                       self.received, self.forwarded, self.duplicates,
+                       self.rate_limited, self.shed,
+                       ", ".join("{}={}".format(rule_id, count)
+                                 for rule_id, count
+                                 in rules[:self.top_rules]) or "none")
+
+        self.received = 0
+        self.forwarded = 0
+        self.duplicates = 0
+        self.rate_limited = 0
+        self.shed = 0
+        self.rule_counts = {}
+        return summary
+
+    def flush(self):
+        """
+        Forward the summary of the counts since the last summary, if any
+        message has been received, and reset them.
+        """
+        with self._lock:
+            summary = self._reset()
+            if self.summary_interval is not None:
+                self._summary_due = (time.perf_counter() +
+                                     self.summary_interval)
+        if summary is not None:
+            self.callback(None, summary)
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""
+pymodsecurity.lowlevel
+----------------------
+
+Expose the C functions :class:`~pymodsecurity.transaction.Transaction` and
+the other classes call, for loops where their checks and exceptions cost
+too much.
+
+This module is a set of aliases alongside the classes, which do not use it:
+they call the same CFFI functions directly. The aliases are the CFFI
+functions themselves, bound once at import:
+
+* they take C handles, as returned by :func:`new_transaction` or by the
+  ``handle`` property of the classes, and already encoded :class:`bytes`;
+* phase and feeding functions return libmodsecurity's status code, 1 on
+  success and 0 on failure, without raising;
+* ``*_checked`` phase functions also check for an intervention in the same
+  call, and return -1 on failure, 1 if there is an intervention, written to
+  their last argument, 0 otherwise;
+* nothing is released automatically: every transaction must be released
+  with :func:`transaction_cleanup`, and every intervention read with
+  :func:`intervention` or a ``*_checked`` function with
+  :func:`intervention_cleanup`;
+* nothing is kept alive either: the :class:`~pymodsecurity.rules.Rules` and
+  :class:`~pymodsecurity.modsecurity.ModSecurity` instances whose handles
+  are used must stay open until the transactions created from them are
+  released.
+
+::
+
+    from pymodsecurity import lowlevel
+
+    ms, rules = modsecurity.handle, rules.handle
+    it = lowlevel.new_intervention()
+    for uri in uris:
+        transaction = lowlevel.new_transaction(ms, rules, lowlevel.NULL)
+        if lowlevel.process_uri_checked(transaction, uri, b"GET", b"1.1",
+                                        it) == 1:
+            blocked.append((uri, it.status))
+            lowlevel.intervention_cleanup(it)
+        lowlevel.process_logging(transaction)
+        lowlevel.transaction_cleanup(transaction)
+"""
+
+from pymodsecurity._modsecurity import ffi as _ffi
+from pymodsecurity._modsecurity import lib as _lib
+
+
+#: C ``NULL`` pointer, e.g. for the log callback data of
+#: :func:`new_transaction`.
+NULL = _ffi.NULL
+
+new_transaction = _lib.msc_new_transaction
+transaction_cleanup = _lib.msc_transaction_cleanup
+
+process_connection = _lib.msc_process_connection
+process_uri = _lib.msc_process_uri
+add_request_header = _lib.msc_add_request_header
+process_request_headers = _lib.msc_process_request_headers
+append_request_body = _lib.msc_append_request_body
+request_body_from_file = _lib.msc_request_body_from_file
+process_request_body = _lib.msc_process_request_body
+add_response_header = _lib.msc_add_response_header
+process_response_headers = _lib.msc_process_response_headers
+append_response_body = _lib.msc_append_response_body
+process_response_body = _lib.msc_process_response_body
+process_logging = _lib.msc_process_logging
+
+process_connection_checked = _lib.pymsc_process_connection
+process_uri_checked = _lib.pymsc_process_uri
+process_request_headers_checked = _lib.pymsc_process_request_headers
+process_request_body_checked = _lib.pymsc_process_request_body
+process_response_headers_checked = _lib.pymsc_process_response_headers
+process_response_body_checked = _lib.pymsc_process_response_body
+
+intervention = _lib.msc_intervention
+intervention_cleanup = _lib.pymsc_intervention_cleanup
+get_matched_rules_info = _lib.msc_get_matched_rules_info
+
+
+def new_intervention():
+    """
+    Allocate an intervention to be filled by :func:`intervention` and the
+    ``*_checked`` functions. It is released when garbage collected.
+
+    :return: ``ModSecurityIntervention *`` with ``status``, ``pause``,
+        ``url``, ``log`` and ``disruptive`` fields
+    """
+    return _ffi.new("ModSecurityIntervention *")
+
+
+def handle(instance):
+    """
+    Get the C handle of a high-level instance, its ``handle`` property. It
+    stays valid as long as the instance is alive and not closed.
+
+    :param instance: an instance of
+        :class:`~pymodsecurity.modsecurity.ModSecurity`,
+        :class:`~pymodsecurity.rules.Rules` or
+        :class:`~pymodsecurity.transaction.Transaction`
+
+    :raise: :exc:`TypeError` if ``instance`` has no C handle, and
+        :exc:`~pymodsecurity.exceptions.ClosedError` if it is closed
+    """
+    try:
+        return instance.handle
+    except AttributeError:
+        raise TypeError("No C handle in " + type(instance).__name__)
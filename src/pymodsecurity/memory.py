@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+"""
+pymodsecurity.memory
+--------------------
+
+Provide a class :class:`MemoryAccounting` measuring the memory allocated
+during each transaction, on the native heap (libmodsecurity included) with
+``mallinfo2()`` and by Python with :mod:`tracemalloc`, and aggregating it by
+URI pattern.
+
+Both sources measure the whole process: deltas are only accurate when a
+single transaction is inspected at a time by the process, as with
+synchronous prefork workers.
+"""
+
+import collections
+import re
+import threading
+import tracemalloc
+
+from pymodsecurity import utils
+
+
+#: Memory allocated by the transactions of a URI pattern. ``native`` and
+#: ``python`` fields are sums of the bytes still allocated at cleanup, or
+#: after the last step recorded, the ``*_peak`` fields are the highest
+#: values reached after a phase.
+PatternUsage = collections.namedtuple("PatternUsage", ("pattern",
+                                                       "count",
+                                                       "native",
+                                                       "native_peak",
+                                                       "python",
+                                                       "python_peak",
+                                                       "phases"))
+
+# Label of the patterns past the maximum number of patterns.
+OTHER = "other"
+
+_NUMBER = re.compile(r"(?<=/)\d+(?=/|$)")
+_IDENTIFIER = re.compile(r"(?<=/)(?:[0-9a-f]{16,}|[0-9a-f]{8}-[0-9a-f]{4}-"
+                         r"[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})(?=/|$)",
+                         re.IGNORECASE)
+
+
+def uri_pattern(uri):
+    """
+    Get the pattern of a URI: its path, without query string, with numeric
+    segments replaced by ``{n}`` and hexadecimal identifiers or UUIDs by
+    ``{id}``.
+
+    :param uri: URI as :class:`str`
+    """
+    path = uri.partition("?")[0]
+    path = _IDENTIFIER.sub("{id}", path)
+    return _NUMBER.sub("{n}", path)
+
+
+def _python_in_use():
+    if not tracemalloc.is_tracing():
+        return 0
+    return tracemalloc.get_traced_memory()[0]
+
+
+def _native_in_use():
+    return utils.heap_in_use() or 0
+
+
+class MemoryUsage:
+    """
+    Memory allocated since a transaction was created, attached to it as its
+    ``memory`` attribute.
+
+    .. attribute:: phases
+
+        :class:`dict` mapping each recorded step to the ``(native, python)``
+        bytes allocated since the previous step.
+    """
+    __slots__ = ("uri",
+                 "phases",
+                 "native",
+                 "native_peak",
+                 "python",
+                 "python_peak",
+                 "_native_start",
+                 "_python_start",
+                 "_native_last",
+                 "_python_last")
+
+    def __init__(self, uri):
+        self.uri = uri
+        self.phases = {}
+        #: Native bytes allocated since the creation.
+        self.native = 0
+        #: Highest value of :attr:`native` after a step.
+        self.native_peak = 0
+        #: Python bytes allocated since the creation.
+        self.python = 0
+        #: Highest value of :attr:`python` after a step.
+        self.python_peak = 0
+        self._native_start = self._native_last = _native_in_use()
+        self._python_start = self._python_last = _python_in_use()
+
+    def record(self, step):
+        """
+        Record the memory allocated since the previous step.
+
+        :param step: name of the step, such as a phase name
+        """
+        native = _native_in_use()
+        python = _python_in_use()
+        self.phases[step] = (native - self._native_last,
+                             python - self._python_last)
+        self._native_last = native
+        self._python_last = python
+
+        self.native = native - self._native_start
+        self.python = python - self._python_start
+        self.native_peak = max(self.native_peak, self.native)
+        self.python_peak = max(self.python_peak, self.python)
+
+
+class _Aggregate:
+    __slots__ = ("count", "native", "native_peak", "python", "python_peak",
+                 "phases")
+
+    def __init__(self):
+        self.count = 0
+        self.native = 0
+        self.native_peak = 0
+        self.python = 0
+        self.python_peak = 0
+        self.phases = {}
+
+
+class MemoryAccounting:
+    """
+    Attach a :class:`MemoryUsage` to transactions, then aggregate them by
+    URI pattern once they are done.
+
+    :param pattern: callable getting the pattern of a URI, defaults to
+        :func:`uri_pattern`
+    :param max_patterns: maximum number of patterns aggregated separately,
+        the transactions of other patterns are aggregated under
+        :data:`OTHER`
+    :param trace_python: start :mod:`tracemalloc` if it is not tracing yet,
+        it is stopped by :meth:`close`. Python allocations are reported as 0
+        when it is not tracing.
+    """
+    def __init__(self, pattern=uri_pattern, max_patterns=1024,
+                 trace_python=True):
+        self.pattern = pattern
+        self.max_patterns = max_patterns
+        self._patterns = {}
+        self._lock = threading.Lock()
+        self._started_tracing = trace_python and not tracemalloc.is_tracing()
+        if self._started_tracing:
+            tracemalloc.start()
+
+    def close(self):
+        """
+        Stop :mod:`tracemalloc` if it has been started by this instance.
+        """
+        if self._started_tracing:
+            self._started_tracing = False
+            tracemalloc.stop()
+
+    def start(self, uri):
+        """
+        Start measuring the memory of a request, before its transaction is
+        created.
+
+        Once created, attach the returned usage to the transaction as its
+        ``memory`` attribute, record the ``"creation"`` step then each phase
+        with :meth:`MemoryUsage.record`.
+
+        :param uri: URI of the request
+
+        :return: a :class:`MemoryUsage`
+        """
+        return MemoryUsage(uri)
+
+    def finish(self, usage, cleanup=True):
+        """
+        Record the ``"cleanup"`` step of a transaction, once it is closed,
+        and aggregate its usage.
+
+        :param usage: :class:`MemoryUsage` returned by :meth:`start`
+        :param cleanup: ``False`` to aggregate the usage without the
+            ``"cleanup"`` step, when the transaction is released later, such
+            as by a :class:`~pymodsecurity.scheduler.LoggingScheduler`
+        """
+        if cleanup:
+            usage.record("cleanup")
+        pattern = self.pattern(usage.uri)
+        with self._lock:
+            aggregate = self._patterns.get(pattern)
+            if aggregate is None:
+                if len(self._patterns) >= self.max_patterns:
+                    pattern = OTHER
+                aggregate = self._patterns.setdefault(pattern, _Aggregate())
+            aggregate.count += 1
+            aggregate.native += usage.native
+            aggregate.native_peak = max(aggregate.native_peak,
+                                        usage.native_peak)
+            aggregate.python += usage.python
+            aggregate.python_peak = max(aggregate.python_peak,
+                                        usage.python_peak)
+            for step, (native, python) in usage.phases.items():
+                total = aggregate.phases.get(step, (0, 0))
+                aggregate.phases[step] = (total[0] + native,
+                                          total[1] + python)
+
+    def report(self):
+        """
+        Get the memory allocated by URI pattern, highest native peak first.
+
+        :return: :class:`list` of :class:`PatternUsage`, whose ``phases``
+            field maps each step to the sums of its ``(native, python)``
+            deltas
+        """
+        with self._lock:
+            usages = [PatternUsage(pattern, aggregate.count,
+                                   aggregate.native, aggregate.native_peak,
+                                   aggregate.python, aggregate.python_peak,
+                                   dict(aggregate.phases))
+                      for pattern, aggregate in self._patterns.items()]
+        usages.sort(key=lambda usage: (-usage.native_peak, usage.pattern))
+        return usages
+
+    def clear(self):
+        """
+        Forget the aggregated usages.
+        """
+        with self._lock:
+            self._patterns.clear()
@@ -0,0 +1,515 @@
+# -*- coding: utf-8 -*-
+"""
+pymodsecurity.metrics
+---------------------
+
+Counters and histograms describing the library behaviour, rendered in the
+Prometheus text format.
+
+Library metrics are only recorded once :func:`enable` has been called::
+
+    from pymodsecurity import metrics
+
+    metrics.enable()
+    metrics.serve(9100)  # or metrics.REGISTRY.render()
+
+.. note:: Metrics are updated without locking to keep recording cheap. With
+    several threads, an update can very rarely be lost.
+"""
+
+import bisect
+import http.server
+import math
+import threading
+
+from pymodsecurity import admission
+from pymodsecurity import utils
+
+
+#: Default histogram buckets, in seconds.
+LATENCY_BUCKETS = (0.00001, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025,
+                   0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+#: Intervention statuses rendered even before being recorded.
+INTERVENTION_STATUSES = (301, 302, 400, 403, 404, 406, 413, 500, 501, 502,
+                         503)
+
+#: Phases timed by :class:`~pymodsecurity.connector.Connector`.
+PHASES = ("connection", "uri", "request_headers", "request_body",
+          "response_headers", "response_body", "logging")
+
+#: Outcomes of :class:`~pymodsecurity.admission.AdmissionControl`: admitted
+#: or shed with one of its policies.
+ADMISSION_OUTCOMES = ("admitted", "bypass", "detection_only", "reject")
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value):
+    return (str(value).replace("\\", "\\\\")
+            .replace("\n", "\\n")
+            .replace('"', '\\"'))
+
+
+def _format_labels(names, values, extra=""):
+    labels = ['{}="{}"'.format(name, _escape(value))
+              for name, value in zip(names, values)]
+    if extra:
+        labels.append(extra)
+    return "{" + ",".join(labels) + "}" if labels else ""
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        if math.isinf(value):
+            return "+Inf" if value > 0 else "-Inf"
+        return repr(value)
+    return str(value)
+
+
+class _Metric:
+    """
+    Base class of metrics, possibly split by labels.
+
+    A metric declared with label names records nothing by itself: values
+    are recorded by the children returned by :meth:`labels`.
+    """
+    type_name = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        """
+        Get the child metric recording values for a set of label values.
+
+        :param values: one value per label name, in declaration order
+        """
+        values = tuple(str(value) for value in values)
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError("Expected " + str(len(self.labelnames)) +
+                                 " label values for " + self.name)
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _samples(self):
+        """
+        Yield ``(label_values, child)`` for each recorded set of labels.
+        """
+        if self.labelnames:
+            return sorted(self._children.items())
+        return [((), self)]
+
+    def render(self):
+        """
+        Render the metric in the Prometheus text format.
+
+        :return: :class:`str`
+        """
+        lines = ["# HELP {} {}".format(self.name,
+                                       self.documentation.replace("\n", " ")),
+                 "# TYPE {} {}".format(self.name, self.type_name)]
+        for values, child in self._samples():
+            lines.extend(child._render_lines(self.name, self.labelnames,
+                                             values))
+        return "\n".join(lines) + "\n"
+
+
+class Counter(_Metric):
+    """
+    Monotonically increasing value.
+
+    :param name: metric name
+    :param documentation: help text
+    :param labelnames: names of the labels splitting the metric
+    """
+    type_name = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self.value = 0
+
+    def _new_child(self):
+        return Counter(self.name, self.documentation)
+
+    def inc(self, amount=1):
+        """
+        Increase the counter.
+
+        :param amount: increment, must not be negative
+        """
+        self.value += amount
+
+    def _render_lines(self, name, labelnames, values):
+        return [name + _format_labels(labelnames, values) + " " +
+                _format_value(self.value)]
+
+
+class Histogram(_Metric):
+    """
+    Distribution of observed values in buckets.
+
+    :param name: metric name
+    :param documentation: help text
+    :param labelnames: names of the labels splitting the metric
+    :param buckets: sorted upper bounds of the buckets
+    """
+    type_name = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(),
+                 buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+        # Last item counts values greater than every bound
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0
+
+    def _new_child(self):
+        return Histogram(self.name, self.documentation, buckets=self.buckets)
+
+    def observe(self, value, _bisect_left=bisect.bisect_left):
+        """
+        Record a value.
+
+        :param value: observed value (e.g. a duration in seconds)
+        """
+        self.counts[_bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def _render_lines(self, name, labelnames, values):
+        lines = []
+        cumulative = 0
+        bounds = self.buckets + (math.inf,)
+        for bound, count in zip(bounds, self.counts):
+            cumulative += count
+            le = 'le="' + _format_value(float(bound)) + '"'
+            lines.append(name + "_bucket" +
+                         _format_labels(labelnames, values, le) + " " +
+                         str(cumulative))
+        labels = _format_labels(labelnames, values)
+        lines.append(name + "_sum" + labels + " " + _format_value(self.sum))
+        lines.append(name + "_count" + labels + " " + str(cumulative))
+        return lines
+
+
+class CallbackMetric(_Metric):
+    """
+    Metric whose values are read from a function when rendered.
+
+    :param name: metric name
+    :param documentation: help text
+    :param function: callable returning a :class:`dict` mapping tuples of
+        label values to a number
+    :param labelnames: names of the labels splitting the metric
+    :param type_name: Prometheus type, ``"gauge"`` or ``"counter"``
+    """
+    def __init__(self, name, documentation, function, labelnames=(),
+                 type_name="gauge"):
+        super().__init__(name, documentation, labelnames)
+        self.function = function
+        self.type_name = type_name
+
+    def labels(self, *values):
+        """
+        Not supported: values are read from the function, for every set of
+        labels at once.
+
+        :raise: :exc:`TypeError`
+        """
+        raise TypeError(self.name + " is a callback metric, its values "
+                        "are read from its function")
+
+    def _samples(self):
+        return sorted(self.function().items())
+
+    def render(self):
+        lines = ["# HELP {} {}".format(self.name, self.documentation),
+                 "# TYPE {} {}".format(self.name, self.type_name)]
+        for values, value in self._samples():
+            lines.append(self.name + _format_labels(self.labelnames, values) +
+                         " " + _format_value(value))
+        return "\n".join(lines) + "\n"
+
+
+class Registry:
+    """
+    Collection of metrics rendered together.
+    """
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        """
+        Add a metric to the registry.
+
+        :param metric: a :class:`Counter`, :class:`Histogram` or
+            :class:`CallbackMetric`
+
+        :return: ``metric``
+        """
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError("Duplicated metric " + metric.name)
+            self._metrics[metric.name] = metric
+        return metric
+
+    def unregister(self, metric):
+        """
+        Remove a metric from the registry.
+
+        :param metric: a metric added by :meth:`register`
+        """
+        with self._lock:
+            self._metrics.pop(metric.name, None)
+
+    def counter(self, name, documentation, labelnames=(), labelvalues=()):
+        """
+        Create and register a :class:`Counter`.
+
+        :param labelvalues: label values recorded up front, so that they are
+            rendered before being increased
+
+        :return: the :class:`Counter`
+        """
+        counter = Counter(name, documentation, labelnames)
+        for values in labelvalues:
+            counter.labels(*values)
+        return self.register(counter)
+
+    def histogram(self, name, documentation, labelnames=(), labelvalues=(),
+                  buckets=LATENCY_BUCKETS):
+        """
+        Create and register a :class:`Histogram`, see :meth:`counter`.
+
+        :return: the :class:`Histogram`
+        """
+        histogram = Histogram(name, documentation, labelnames, buckets)
+        for values in labelvalues:
+            histogram.labels(*values)
+        return self.register(histogram)
+
+    def callback(self, name, documentation, function, labelnames=(),
+                 type_name="gauge"):
+        """
+        Create and register a :class:`CallbackMetric`.
+
+        :return: the :class:`CallbackMetric`
+        """
+        return self.register(CallbackMetric(name, documentation, function,
+                                            labelnames, type_name))
+
+    def render(self):
+        """
+        Render every metric in the Prometheus text format.
+
+        :return: :class:`str`
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "".join(metric.render() for metric in metrics)
+
+
+#: Default registry.
+REGISTRY = Registry()
+
+
+class LibraryMetrics:
+    """
+    Metrics recorded by pymodsecurity classes.
+
+    :param registry: :class:`Registry`, or any object providing the same
+        ``counter()``, ``histogram()``, ``callback()`` and ``unregister()``
+        methods, holding the metrics
+    """
+    def __init__(self, registry):
+        self.registry = registry
+        self.interventions = registry.counter(
+            "pymodsecurity_interventions_total",
+            "Disruptive interventions asked by ModSecurity, by status.",
+            ("status",),
+            [(status,) for status in INTERVENTION_STATUSES])
+        self.phase_latency = registry.histogram(
+            "pymodsecurity_phase_duration_seconds",
+            "Time spent in each transaction phase.",
+            ("phase",),
+            [(phase,) for phase in PHASES])
+        self.phase_latencies = {phase: self.phase_latency.labels(phase)
+                                for phase in PHASES}
+        self.body_bytes = registry.counter(
+            "pymodsecurity_body_bytes_total",
+            "Body bytes fed to ModSecurity for inspection.",
+            ("direction",),
+            [("request",), ("response",)])
+        self.request_body_bytes = self.body_bytes.labels("request")
+        self.response_body_bytes = self.body_bytes.labels("response")
+        self.response_body_truncated_bytes = registry.counter(
+            "pymodsecurity_response_body_truncated_bytes_total",
+            "Response body bytes sent without inspection, past the budget "
+            "of the response policy.")
+        self.rule_hits = registry.counter(
+            "pymodsecurity_rule_hits_total",
+            "Rules matched by inspected transactions.")
+        self.over_budget = registry.counter(
+            "pymodsecurity_over_budget_total",
+            "Transactions which ran over their latency budget, by phase.",
+            ("phase",),
+            [(phase,) for phase in PHASES])
+        self.admissions = registry.counter(
+            "pymodsecurity_admissions_total",
+            "Requests admitted for inspection, or shed by policy.",
+            ("outcome",),
+            [(outcome,) for outcome in ADMISSION_OUTCOMES])
+        self.admission_queue_time = registry.histogram(
+            "pymodsecurity_admission_queue_seconds",
+            "Time spent by requests waiting for an inspection slot.")
+        self.rule_load_errors = registry.counter(
+            "pymodsecurity_rule_load_errors_total",
+            "Rules rejected by libmodsecurity.")
+
+        self._metrics = [
+            self.interventions,
+            self.phase_latency,
+            self.body_bytes,
+            self.response_body_truncated_bytes,
+            self.rule_hits,
+            self.over_budget,
+            self.admissions,
+            self.admission_queue_time,
+            self.rule_load_errors,
+            registry.callback(
+                "pymodsecurity_admission_in_flight",
+                "Inspections in progress in admitted slots.",
+                lambda: {(): admission.totals()[0]}),
+            registry.callback(
+                "pymodsecurity_admission_waiting",
+                "Requests waiting for an inspection slot.",
+                lambda: {(): admission.totals()[1]}),
+            registry.callback(
+                "pymodsecurity_admission_detection_only",
+                "Shed requests being inspected in detection only mode.",
+                lambda: {(): admission.totals()[2]}),
+            registry.callback(
+                "pymodsecurity_admission_saturation",
+                "Ratio of the inspection slots in use.",
+                _saturation),
+            registry.callback(
+                "pymodsecurity_handles_created_total",
+                "C handles allocated by libmodsecurity, by type.",
+                lambda: _by_type(utils.created_handles()),
+                ("type",), "counter"),
+            registry.callback(
+                "pymodsecurity_handles_released_total",
+                "C handles released, by type.",
+                _released_handles,
+                ("type",), "counter"),
+            registry.callback(
+                "pymodsecurity_live_handles",
+                "C handles allocated by libmodsecurity and not released yet, "
+                "by type.",
+                lambda: _by_type(utils.live_handles()),
+                ("type",)),
+        ]
+
+    def close(self):
+        """
+        Remove the metrics from their registry.
+        """
+        for metric in self._metrics:
+            if metric is not None:
+                self.registry.unregister(metric)
+
+
+def _saturation():
+    in_flight, _, _, limit = admission.totals()
+    return {(): in_flight / limit if limit else 0.0}
+
+
+def _by_type(handles):
+    return {(kind,): count for kind, count in handles.items()}
+
+
+def _released_handles():
+    live = utils.live_handles()
+    return {(kind,): count - live[kind]
+            for kind, count in utils.created_handles().items()}
+
+
+#: :class:`LibraryMetrics` being recorded, ``None`` until :func:`enable` is
+#: called.
+library = None
+
+
+def enable(registry=REGISTRY):
+    """
+    Start recording library metrics.
+
+    :param registry: :class:`Registry` holding the metrics
+
+    :return: the :class:`LibraryMetrics` being recorded
+    """
+    global library
+    if library is None:
+        library = LibraryMetrics(registry)
+    return library
+
+
+def disable():
+    """
+    Stop recording library metrics and remove them from their registry.
+    """
+    global library
+    if library is not None:
+        library.close()
+        library = None
+
+
+class _MetricsHandler(http.server.BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.partition("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+
+        body = self.registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *pargs):
+        pass
+
+
+def serve(port, address="127.0.0.1", registry=REGISTRY):
+    """
+    Serve the metrics on ``http://address:port/metrics`` from a background
+    thread.
+
+    :param port: TCP port, ``0`` picks a free one
+    :param address: listening address
+    :param registry: :class:`Registry` to render
+
+    :return: the :class:`http.server.HTTPServer`, call its ``shutdown()``
+        method to stop serving
+    """
+    handler = type("MetricsHandler", (_MetricsHandler,),
+                   {"registry": registry})
+    server = http.server.HTTPServer((address, port), handler)
+    thread = threading.Thread(target=server.serve_forever,
+                              name="pymodsecurity-metrics",
+                              daemon=True)
+    thread.start()
+    return server
@@ -12,6 +12,7 @@ import functools
 from pymodsecurity._modsecurity import ffi as _ffi
 from pymodsecurity._modsecurity import lib as _lib
 from pymodsecurity import utils
+from pymodsecurity.exceptions import ClosedError
 
 
 _NULL = _ffi.NULL
@@ -21,14 +22,67 @@ class ModSecurity:
     """
     Wrapper for C function built from **modsecurity.h** via CFFI.
     """
+    __slots__ = ("_modsecurity_struct",
+                 "_log_callback",
+                 "_finalizer",
+                 "_dependents",
+                 "__weakref__")
+
     def __init__(self,):
         self._modsecurity_struct = _lib.msc_init()
         assert self._modsecurity_struct != _NULL
+        self._finalizer = utils.register_handle(self, "ModSecurity",
+                                                _lib.msc_cleanup,
+                                                self._modsecurity_struct)
+        self._dependents = utils.Dependents(self._finalizer)
 
         self._log_callback = _NULL
 
-    def __del__(self):
-        _lib.msc_cleanup(self._modsecurity_struct)
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __getattr__(self, name):
+        # Only reached for unset slots: the handle is removed once closed.
+        if name == "_modsecurity_struct":
+            raise ClosedError("ModSecurity instance is closed")
+        raise AttributeError(name)
+
+    @property
+    def closed(self):
+        """
+        Whether :meth:`close` has been called.
+        """
+        return self._dependents.closed
+
+    @property
+    def handle(self):
+        """
+        C handle, ``ModSecurity *``, valid until :meth:`close` is called.
+
+        :raise: :exc:`~pymodsecurity.exceptions.ClosedError` if it is closed
+        """
+        return self._modsecurity_struct
+
+    def close(self):
+        """
+        Free the memory allocated by libmodsecurity.
+
+        It is done automatically when the instance is garbage collected.
+        Calling this method several times has no effect.
+
+        The instance must not be used anymore once closed: its methods raise
+        :exc:`~pymodsecurity.exceptions.ClosedError`. The memory is only
+        freed once the :class:`~pymodsecurity.transaction.Transaction`
+        instances created with it are closed too.
+        """
+        self._dependents.close()
+        try:
+            del self._modsecurity_struct
+        except AttributeError:
+            pass
 
     def set_log_callback(self, callback):
         """
@@ -40,7 +94,9 @@ class ModSecurity:
         :param callback: Python callable object
 
         .. note:: The callback should perform few operations or even none on
-            data.
+            data. It is called once per matched rule: wrap it in a
+            :class:`~pymodsecurity.logsink.AggregatingLogSink` to bound its
+            cost under attack.
 
         .. warning:: Be careful when writing the Python callback function. If
             it returns an object of the wrong type, or more generally raises
@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+"""
+pymodsecurity.prefilter
+-----------------------
+
+Provide a class :class:`IPPrefilter` deciding from allow and deny lists of
+networks whether a client should be let through or blocked before any
+libmodsecurity transaction is created.
+"""
+
+import bisect
+import ipaddress
+import socket
+
+
+#: Let the request through without inspecting it.
+ALLOW = "allow"
+#: Block the request without inspecting it.
+DENY = "deny"
+
+# Deny wins over allow for identical networks.
+_PRIORITIES = {ALLOW: 0, DENY: 1}
+
+_IPV4_MAPPED_PREFIX = b"\x00" * 10 + b"\xff\xff"
+
+# Bound once, lookups are on the hot path.
+_AF_INET = socket.AF_INET
+_AF_INET6 = socket.AF_INET6
+_inet_pton = socket.inet_pton
+_bisect_right = bisect.bisect_right
+_from_bytes = int.from_bytes
+
+
+def _parse_networks(networks, action):
+    parsed = []
+    for network in networks:
+        network = ipaddress.ip_network(network, strict=False)
+        parsed.append((network, action))
+    return parsed
+
+
+def _read_networks(path):
+    """
+    Read networks written in CIDR notation, one per line. Empty lines and
+    lines starting with ``#`` are ignored.
+    """
+    networks = []
+    with open(path) as f:
+        for number, line in enumerate(f, 1):
+            line = line.split("#", 1)[0].strip()
+            if not line:
+                continue
+            try:
+                networks.append(ipaddress.ip_network(line, strict=False))
+            except ValueError as error:
+                raise ValueError(path + ":" + str(number) + ": " +
+                                 str(error))
+    return networks
+
+
+def _build_table(entries, bits):
+    """
+    Flatten a set of networks into a sorted table of ranges, each range
+    holding the action of the most specific network covering it.
+
+    :param entries: :class:`list` of ``(network, action)``
+    :param bits: size of the addresses of the family
+
+    :return: ``(starts, actions)`` where addresses from ``starts[i]`` to
+        ``starts[i + 1]`` (excluded) get ``actions[i]``
+    """
+    boundaries = {0, 1 << bits}
+    for network, _ in entries:
+        start = int(network.network_address)
+        boundaries.add(start)
+        boundaries.add(start + network.num_addresses)
+    boundaries = sorted(boundaries)
+    positions = {boundary: i for i, boundary in enumerate(boundaries)}
+
+    # Paint ranges from the least to the most specific network
+    actions = [None] * (len(boundaries) - 1)
+    entries = sorted(entries, key=lambda entry: (entry[0].prefixlen,
+                                                 _PRIORITIES[entry[1]]))
+    for network, action in entries:
+        start = int(network.network_address)
+        first = positions[start]
+        last = positions[start + network.num_addresses]
+        actions[first:last] = [action] * (last - first)
+
+    # Merge adjacent ranges sharing the same action
+    starts = []
+    merged_actions = []
+    for boundary, action in zip(boundaries, actions):
+        if not merged_actions or merged_actions[-1] != action:
+            starts.append(boundary)
+            merged_actions.append(action)
+    return starts, merged_actions
+
+
+def _build_tables(allow, deny):
+    entries = _parse_networks(allow, ALLOW) + _parse_networks(deny, DENY)
+    ipv4 = [entry for entry in entries if entry[0].version == 4]
+    ipv6 = [entry for entry in entries if entry[0].version == 6]
+    return _build_table(ipv4, 32), _build_table(ipv6, 128)
+
+
+class IPPrefilter:
+    """
+    Longest-prefix match of client addresses against allow and deny lists of
+    IPv4 and IPv6 networks.
+
+    The most specific network matching an address gives the decision, deny
+    wins when the same network is in both lists. The networks are compiled
+    into a table of sorted address ranges, so that a lookup is a binary
+    search running in C.
+
+    :param allow: iterable of networks, as :class:`str` in CIDR notation or
+        :mod:`ipaddress` objects, whose clients are let through without
+        inspection
+    :param deny: iterable of networks whose clients are blocked
+    """
+    __slots__ = ("_tables",)
+
+    def __init__(self, allow=(), deny=()):
+        self._tables = _build_tables(allow, deny)
+
+    @classmethod
+    def from_files(cls, allow_file=None, deny_file=None):
+        """
+        Create a prefilter from files listing networks in CIDR notation, one
+        per line. Empty lines and comments starting with ``#`` are ignored.
+
+        :param allow_file: path to the list of allowed networks
+        :param deny_file: path to the list of denied networks
+
+        :return: an instance of :class:`IPPrefilter`
+        """
+        prefilter = cls()
+        prefilter.load_files(allow_file, deny_file)
+        return prefilter
+
+    def load(self, allow=(), deny=()):
+        """
+        Replace the allow and deny lists.
+
+        The new lists are compiled before replacing the current ones in a
+        single step, so that concurrent lookups use either the old or the
+        new lists.
+
+        :param allow: iterable of allowed networks
+        :param deny: iterable of denied networks
+        """
+        self._tables = _build_tables(allow, deny)
+
+    def load_files(self, allow_file=None, deny_file=None):
+        """
+        Replace the allow and deny lists with the content of files, see
+        :meth:`from_files` and :meth:`load`.
+
+        :param allow_file: path to the list of allowed networks
+        :param deny_file: path to the list of denied networks
+        """
+        allow = _read_networks(allow_file) if allow_file else ()
+        deny = _read_networks(deny_file) if deny_file else ()
+        self.load(allow, deny)
+
+    def lookup(self, ip):
+        """
+        Get the decision for a client address.
+
+        :param ip: client's IP address as :class:`str`
+
+        :return: :data:`ALLOW`, :data:`DENY` or ``None`` if the request must
+            be inspected (including when ``ip`` is not a valid address)
+        """
+        ipv4, ipv6 = self._tables
+        try:
+            if ":" in ip:
+                packed = _inet_pton(_AF_INET6, ip)
+                if packed[:12] == _IPV4_MAPPED_PREFIX:
+                    packed = packed[12:]
+                else:
+                    ipv4 = ipv6
+            else:
+                packed = _inet_pton(_AF_INET, ip)
+        except OSError:
+            return None
+
+        starts, actions = ipv4
+        return actions[_bisect_right(starts, _from_bytes(packed, "big")) - 1]
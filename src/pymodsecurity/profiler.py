@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+"""
+pymodsecurity.profiler
+----------------------
+
+Provide a class :class:`RuleLoadProfiler` loading a configuration one file
+at a time to find which files and ``Include`` directives make loading the
+rules slow.
+
+Files are walked like :func:`~pymodsecurity.bundle.resolve` does: the
+directives of each file are sent to
+:meth:`~pymodsecurity.rules.Rules.add_rules` in segments split at its
+``Include`` directives, and only these calls are timed. Relative paths to
+data files are made absolute first.
+
+From the command line::
+
+    $ pymodsecurity profile /etc/modsecurity/main.conf
+"""
+
+import collections
+import os
+import time
+
+from pymodsecurity import utils
+from pymodsecurity.bundle import (included_files, join_continuations,
+                                  logical_lines, resolve_paths)
+from pymodsecurity.exceptions import BundleError
+
+
+#: Cost of a loading step. ``seconds`` and ``memory``, the growth of the
+#: native heap in bytes, are measured around the calls to
+#: :meth:`~pymodsecurity.rules.Rules.add_rules`: they are those of the file
+#: itself for :data:`FILE` steps, and include the included files for
+#: :data:`INCLUDE` steps. ``rules`` is the number of rules added.
+LoadStep = collections.namedtuple("LoadStep", ("kind",
+                                               "name",
+                                               "seconds",
+                                               "rules",
+                                               "memory"))
+
+# Kinds of steps: a file, without the files it includes, or an ``Include``
+# directive with every file it includes.
+FILE = "file"
+INCLUDE = "include"
+
+
+def _accumulate(total, cost):
+    for i, value in enumerate(cost):
+        total[i] += value
+
+
+class RuleLoadProfiler:
+    """
+    Load rules into a rules set while recording the cost of each file and
+    ``Include`` directive.
+
+    ::
+
+        profiler = RuleLoadProfiler()
+        profiler.load_file("/etc/modsecurity/main.conf")
+        for step in profiler.report(10):
+            print(step.kind, step.name, step.seconds, step.rules)
+
+    Rules are loaded in many calls instead of one: the total may differ
+    slightly from the time taken by
+    :meth:`~pymodsecurity.rules.Rules.add_rules_file`.
+
+    :param rules: an instance of :class:`~pymodsecurity.rules.Rules` to load
+        the rules into, a new one by default
+    """
+    def __init__(self, rules=None):
+        if rules is None:
+            from pymodsecurity.rules import Rules
+
+            rules = Rules()
+        self.rules = rules
+        #: Recorded :class:`LoadStep`, in loading order of their end.
+        self.steps = []
+
+    def load_file(self, path):
+        """
+        Load the rules of a configuration file and of the files it includes.
+
+        :param path: path to the configuration file
+
+        :return: the :class:`LoadStep` of the whole file, not recorded in
+            :attr:`steps`
+
+        :raise: :exc:`~pymodsecurity.exceptions.BundleError` if a file
+            cannot be read or an ``Include`` directive matches no file, as
+            :func:`~pymodsecurity.bundle.resolve` does, and
+            :exc:`~pymodsecurity.exceptions.InternalError` if libmodsecurity
+            rejects the configuration
+        """
+        path = os.path.abspath(path)
+        return LoadStep(FILE, path, *self._load_file(path, []))
+
+    def load(self, plain_rules, origin="<rules>"):
+        """
+        Load rules given as text, relative paths being relative to the
+        current directory.
+
+        :param plain_rules: ModSecurity rules as :class:`str`
+        :param origin: name of the text in the report
+
+        :return: the :class:`LoadStep` of the whole text, not recorded in
+            :attr:`steps`
+        """
+        lines = list(join_continuations(plain_rules.splitlines()))
+        return LoadStep(FILE, origin,
+                        *self._load_lines(origin, lines, os.getcwd(), []))
+
+    def _load_file(self, path, stack):
+        if path in stack:
+            raise BundleError("Include loop on " + path)
+        stack.append(path)
+        total = self._load_lines(path, list(logical_lines(path)),
+                                 os.path.dirname(path), stack)
+        stack.pop()
+        return total
+
+    def _load_lines(self, name, lines, directory, stack):
+        """
+        Load the lines of a file, record its :data:`FILE` step and those of
+        its ``Include`` directives.
+
+        :return: ``(seconds, rules, memory)`` of the file with the files it
+            includes
+        """
+        own = [0.0, 0, 0]
+        included = [0.0, 0, 0]
+        segment = []
+        for line in lines:
+            stripped = line.strip()
+            if not stripped or stripped.startswith("#"):
+                continue
+
+            filenames = included_files(line, directory)
+            if filenames is None:
+                segment.append(resolve_paths(line, directory, inline=False))
+                continue
+
+            self._add(segment, own)
+            segment = []
+
+            cost = [0.0, 0, 0]
+            for filename in filenames:
+                _accumulate(cost, self._load_file(filename, stack))
+            self.steps.append(LoadStep(INCLUDE, name + ": " + stripped,
+                                       *cost))
+            _accumulate(included, cost)
+        self._add(segment, own)
+
+        self.steps.append(LoadStep(FILE, name, *own))
+        _accumulate(included, own)
+        return tuple(included)
+
+    def _add(self, segment, cost):
+        """
+        Add a segment of directives to the rules set, adding its
+        ``[seconds, rules, memory]`` to ``cost``.
+        """
+        if not segment:
+            return
+        plain_rules = "\n".join(segment) + "\n"
+        heap = utils.heap_in_use() or 0
+        start = time.perf_counter()
+        rules = self.rules.add_rules(plain_rules)
+        cost[0] += time.perf_counter() - start
+        cost[1] += rules
+        cost[2] += (utils.heap_in_use() or 0) - heap
+
+    def report(self, limit=None):
+        """
+        Get the recorded steps, slowest first.
+
+        :param limit: maximum number of steps to return
+
+        :return: :class:`list` of :class:`LoadStep`
+        """
+        steps = sorted(self.steps, key=lambda step: (-step.seconds,
+                                                     step.kind, step.name))
+        return steps[:limit]
+
+    def format_report(self, limit=None):
+        """
+        Format :meth:`report` as a text table.
+
+        :return: :class:`str`
+        """
+        lines = ["{:>10} {:>7} {:>12}  {:<7} {}".format(
+            "ms", "rules", "memory", "kind", "name")]
+        for step in self.report(limit):
+            lines.append("{:>10.2f} {:>7} {:>12}  {:<7} {}".format(
+                step.seconds * 1000, step.rules, step.memory, step.kind,
+                step.name))
+        return "\n".join(lines) + "\n"
+
+    def clear(self):
+        """
+        Forget the recorded steps. The rules stay loaded.
+        """
+        self.steps = []
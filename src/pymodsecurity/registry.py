@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""
+pymodsecurity.registry
+----------------------
+
+Provide a class :class:`RuleSetRegistry` sharing a base rules set between
+the virtual hosts of a multi-tenant server.
+"""
+
+import collections
+import hashlib
+import threading
+
+from pymodsecurity import bundle
+from pymodsecurity import utils
+from pymodsecurity.rules import Rules
+from pymodsecurity.transaction import Transaction
+
+
+#: Rules set shared by tenants with identical overlays. ``memory`` is the
+#: growth of the native heap in bytes while the set was built, ``None`` if
+#: it cannot be measured.
+RuleSet = collections.namedtuple("RuleSet", ("key", "rules", "memory",
+                                             "hosts"))
+
+
+def _normalize_host(host):
+    """
+    Lower-case ``host`` and remove the port it may hold.
+    """
+    host = host.lower()
+    if host.startswith("["):
+        # IPv6 literal
+        return host[:host.find("]") + 1]
+    return host.partition(":")[0]
+
+
+class RuleSetRegistry:
+    """
+    Build per-tenant rules sets from a base rules set loaded once and small
+    overlays merged into it with :meth:`~pymodsecurity.rules.Rules.merge_rules`.
+
+    Tenants with identical overlays share the same rules set. Hosts without
+    any overlay use the base rules set.
+
+    :param base_file: path to the base configuration file or to a bundle
+        built by :func:`~pymodsecurity.bundle.build`
+    """
+    def __init__(self, base_file):
+        self._lock = threading.Lock()
+        before = utils.heap_in_use()
+        if bundle.is_bundle(base_file):
+            rules = Rules.from_bundle(base_file)
+        else:
+            rules = Rules()
+            rules.add_rules_file(base_file)
+        self._base = RuleSet(None, rules, self._growth(before), set())
+
+        # Overlay key -> RuleSet
+        self._sets = {}
+        # Normalized host -> RuleSet
+        self._hosts = {}
+
+    @staticmethod
+    def _growth(before):
+        after = utils.heap_in_use()
+        if before is None or after is None:
+            return None
+        return max(after - before, 0)
+
+    @property
+    def base(self):
+        """
+        Base rules set as an instance of :class:`~pymodsecurity.rules.Rules`.
+        """
+        return self._base.rules
+
+    def register(self, host, overlay):
+        """
+        Route ``host`` to the base rules set plus ``overlay``.
+
+        :param host: virtual host name
+        :param overlay: ModSecurity rule(s) as :class:`str` added to the base
+            rules set for this host
+
+        :return: the :class:`RuleSet` used by ``host``
+
+        :raise: :exc:`~pymodsecurity.exceptions.InternalError` if
+            libmodsecurity rejects ``overlay``
+        """
+        host = _normalize_host(host)
+        overlay = overlay.strip()
+        key = hashlib.sha256(overlay.encode("utf-8")).hexdigest()
+
+        with self._lock:
+            rule_set = self._sets.get(key)
+            if rule_set is None:
+                before = utils.heap_in_use()
+                rules = Rules()
+                try:
+                    rules.merge_rules(self._base.rules)
+                    rules.add_rules(overlay)
+                except BaseException:
+                    rules.close()
+                    raise
+                rule_set = RuleSet(key, rules, self._growth(before), set())
+                self._sets[key] = rule_set
+
+            if self._hosts.get(host) is not rule_set:
+                self._unregister(host)
+                rule_set.hosts.add(host)
+                self._hosts[host] = rule_set
+        return rule_set
+
+    def unregister(self, host):
+        """
+        Route ``host`` back to the base rules set.
+
+        A rules set is released once no host uses it anymore and the
+        transactions created with it are gone.
+
+        :param host: virtual host name
+        """
+        with self._lock:
+            self._unregister(_normalize_host(host))
+
+    def _unregister(self, host):
+        rule_set = self._hosts.pop(host, None)
+        if rule_set is None:
+            return
+
+        rule_set.hosts.discard(host)
+        if not rule_set.hosts:
+            # Not closed: transactions still in flight may use it, it is
+            # released once the last reference is dropped.
+            del self._sets[rule_set.key]
+
+    def rules_for(self, host):
+        """
+        Get the rules set used by ``host``.
+
+        :param host: virtual host name, as found in the ``Host`` header
+
+        :return: an instance of :class:`~pymodsecurity.rules.Rules`
+        """
+        return self._hosts.get(_normalize_host(host), self._base).rules
+
+    def new_transaction(self, modsecurity, host, log_data=None):
+        """
+        Create a transaction using the rules set of ``host``.
+
+        :param modsecurity: an instance of
+            :class:`~pymodsecurity.modsecurity.ModSecurity`
+        :param host: virtual host name, as found in the ``Host`` header
+        :param log_data: data passed to the log callback
+
+        :return: an instance of
+            :class:`~pymodsecurity.transaction.Transaction`
+        """
+        return Transaction(modsecurity, self.rules_for(host), log_data)
+
+    def memory_report(self):
+        """
+        Get the memory used by each rules set, the base one first.
+
+        :return: :class:`list` of :class:`RuleSet`
+        """
+        with self._lock:
+            return [self._base] + list(self._sets.values())
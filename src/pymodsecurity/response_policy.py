@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""
+pymodsecurity.response_policy
+-----------------------------
+
+Provide a class :class:`ResponseBodyPolicy` bounding how many bytes of each
+response body are inspected, depending on its content type.
+"""
+
+import threading
+
+
+def media_type(content_type):
+    """
+    Get the media type of a ``Content-Type`` header value, lowercased and
+    without parameters.
+
+    :param content_type: header value as :class:`str`, or ``None``
+
+    :return: :class:`str`, empty if ``content_type`` is ``None``
+    """
+    if not content_type:
+        return ""
+    return content_type.partition(";")[0].strip().lower()
+
+
+class ResponseBodyPolicy:
+    """
+    Per content type budgets of response body bytes to inspect.
+
+    Budgets are looked up by media type (``"application/json"``), then by
+    type wildcard (``"image/*"``), then ``default`` applies. A ``None``
+    budget inspects whole bodies, a ``0`` budget inspects none of it.
+
+    Past its budget, the rest of a body is not inspected: it is counted as
+    truncated.
+
+    ::
+
+        policy = ResponseBodyPolicy({"text/html": 1024 * 1024,
+                                     "application/json": 64 * 1024,
+                                     "image/*": 0,
+                                     "video/*": 0},
+                                    default=256 * 1024)
+
+    :param budgets: mapping of media types or wildcards to their budget,
+        in bytes
+    :param default: budget of the other content types, in bytes
+    """
+    def __init__(self, budgets=None, default=None):
+        self.budgets = {media_type(key): value
+                        for key, value in (budgets or {}).items()}
+        self.default = default
+
+        #: Number of responses whose body was truncated.
+        self.truncated_responses = 0
+        #: Bytes not inspected, by media type.
+        self.truncated = {}
+        self._lock = threading.Lock()
+
+    def budget(self, content_type):
+        """
+        Get the number of body bytes to inspect for a content type.
+
+        :param content_type: ``Content-Type`` header value, or ``None``
+
+        :return: :class:`int`, or ``None`` to inspect the whole body
+        """
+        key = media_type(content_type)
+        try:
+            return self.budgets[key]
+        except KeyError:
+            pass
+        try:
+            return self.budgets[key.partition("/")[0] + "/*"]
+        except KeyError:
+            return self.default
+
+    def record(self, content_type, truncated):
+        """
+        Count the bytes of a response body which were not inspected.
+
+        :param content_type: ``Content-Type`` header value, or ``None``
+        :param truncated: number of bytes past the budget
+        """
+        if not truncated:
+            return
+        key = media_type(content_type)
+        with self._lock:
+            self.truncated_responses += 1
+            self.truncated[key] = self.truncated.get(key, 0) + truncated
+
+    @property
+    def truncated_bytes(self):
+        """
+        Total number of bytes not inspected.
+        """
+        return sum(self.truncated.values())
@@ -5,29 +5,185 @@ pymodsecurity.rules
 
 Provide a class :class:`Rules` gathering methods coming from
 libmodsecurity.
+
+.. warning:: libmodsecurity only dumps rules to the standard output, so
+    :meth:`Rules.index` redirects the file descriptor 1 of the whole process
+    while it runs: anything other threads write to the standard output
+    meanwhile is lost. A :class:`RuntimeWarning` is emitted the first time.
 """
 
+import os
+import re
+import tempfile
+import threading
+import warnings
+
+from pymodsecurity import bundle
+from pymodsecurity import metrics
 from pymodsecurity import utils
 from pymodsecurity._modsecurity import ffi as _ffi
 from pymodsecurity._modsecurity import lib as _lib
-from pymodsecurity.exceptions import InternalError
+from pymodsecurity.exceptions import ClosedError, InternalError
 
 
 _NULL = _ffi.NULL
 
+# Serialises the redirections of the standard output during rules dumps.
+_dump_lock = threading.Lock()
+# Whether the redirection was warned about already.
+_dump_warned = False
+
+_DUMP_PHASE = re.compile(rb"^Phase: (\d+) ")
+_DUMP_RULE = re.compile(rb"^\s+Rule ID: (\d+)--")
+
+# Phases of the rules dump, mapped to the value of the ``phase`` action: the
+# URI phase has no rules of its own and runs before phase 1.
+_PHASE_ACTIONS = {0: 0, 1: 0, 2: 1, 3: 2, 4: 3, 5: 4, 6: 5}
+
+
+class RuleIndex:
+    """
+    Phase of every rule of a rules set, returned by :meth:`Rules.index`.
+
+    Phases are the values of the ``phase`` action, from 0 (connection) to 5
+    (logging). Chained rules are indexed by the ID of their first rule.
+
+    ::
+
+        index = rules.index()
+        phases = [index.phase(rule_id) for rule_id in matched_ids]
+    """
+    __slots__ = ("phases", "counts")
+
+    def __init__(self, phases, counts):
+        #: :class:`dict` mapping rule IDs to their phase.
+        self.phases = phases
+        #: :class:`dict` mapping phases to their number of rules.
+        self.counts = counts
+
+    @classmethod
+    def from_dump(cls, dump):
+        """
+        Build an index from the output of :meth:`Rules.dump_rules`.
+
+        :param dump: output as :class:`bytes`
+        """
+        phases = {}
+        counts = {}
+        phase = 0
+        for line in dump.splitlines():
+            match = _DUMP_RULE.match(line)
+            if match:
+                phases[int(match.group(1))] = phase
+                counts[phase] = counts.get(phase, 0) + 1
+                continue
+            match = _DUMP_PHASE.match(line)
+            if match:
+                phase = _PHASE_ACTIONS.get(int(match.group(1)), phase)
+        return cls(phases, counts)
+
+    def __len__(self):
+        return len(self.phases)
+
+    def __contains__(self, rule_id):
+        return rule_id in self.phases
+
+    def phase(self, rule_id):
+        """
+        Get the phase of a rule.
+
+        :param rule_id: rule ID as :class:`int`
+
+        :return: :class:`int`, ``None`` if the rule is unknown
+        """
+        return self.phases.get(rule_id)
+
 
 class Rules:
     """
     Wrapper for C function built from **rules.h** via CFFI.
     """
+    __slots__ = ("_rules_set",
+                 "_error_pointer",
+                 "_index",
+                 "_finalizer",
+                 "_dependents",
+                 "__weakref__")
+
     def __init__(self,):
         self._rules_set = _lib.msc_create_rules_set()
         assert self._rules_set != _NULL
+        self._finalizer = utils.register_handle(self, "Rules",
+                                                _lib.msc_rules_cleanup,
+                                                self._rules_set)
+        self._dependents = utils.Dependents(self._finalizer)
 
         self._error_pointer = _ffi.new("const char **", _NULL)
+        self._index = None
+
+    @classmethod
+    def from_bundle(cls, path):
+        """
+        Create a rules set from a bundle built by
+        :func:`~pymodsecurity.bundle.build`.
+
+        The bundle is memory-mapped and its rules added with a single call to
+        libmodsecurity.
+
+        :param path: path to the bundle
+
+        :return: an instance of :class:`Rules`
+        """
+        _, plain_rules = bundle.read(path)
+        rules = cls()
+        rules.add_rules(plain_rules)
+        return rules
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __getattr__(self, name):
+        # Only reached for unset slots: the handle is removed once closed.
+        if name == "_rules_set":
+            raise ClosedError("Rules set is closed")
+        raise AttributeError(name)
+
+    @property
+    def closed(self):
+        """
+        Whether :meth:`close` has been called.
+        """
+        return self._dependents.closed
+
+    @property
+    def handle(self):
+        """
+        C handle, ``RulesSet *``, valid until :meth:`close` is called.
 
-    def __del__(self):
-        _lib.msc_rules_cleanup(self._rules_set)
+        :raise: :exc:`~pymodsecurity.exceptions.ClosedError` if it is closed
+        """
+        return self._rules_set
+
+    def close(self):
+        """
+        Free the memory allocated by libmodsecurity.
+
+        It is done automatically when the instance is garbage collected.
+        Calling this method several times has no effect.
+
+        The instance must not be used anymore once closed: its methods raise
+        :exc:`~pymodsecurity.exceptions.ClosedError`. The memory is only
+        freed once the :class:`~pymodsecurity.transaction.Transaction`
+        instances created with it are closed too.
+        """
+        self._dependents.close()
+        try:
+            del self._rules_set
+        except AttributeError:
+            pass
 
     def _last_error_message(self):
         """
@@ -41,12 +197,50 @@ class Rules:
 
         return error_message
 
+    def _raise_load_error(self):
+        stats = metrics.library
+        if stats is not None:
+            stats.rule_load_errors.inc()
+        raise InternalError(self._last_error_message())
+
     def dump_rules(self):
         """
         Print rules IDs and addresses sorted by rule phase to stdout.
+
+        See :meth:`index` to get the phase of the rules instead.
         """
         _lib.msc_rules_dump(self._rules_set)
 
+    def index(self):
+        """
+        Get the phase of each rule and the number of rules by phase.
+
+        The index is built from :meth:`dump_rules`, with the file descriptor
+        of the standard output redirected to a temporary file meanwhile:
+        anything other threads write to the standard output during the dump
+        ends up in this file, and is discarded with it. Dumps are serialised
+        across rules sets, and a :class:`RuntimeWarning` is emitted the first
+        time. The index is cached until rules are added.
+
+        :return: a :class:`RuleIndex`
+        """
+        global _dump_warned
+        index = self._index
+        if index is None:
+            if not _dump_warned:
+                _dump_warned = True
+                warnings.warn("Rules.index() redirects the standard output "
+                              "of the process while rules are dumped",
+                              RuntimeWarning, stacklevel=2)
+            with tempfile.TemporaryFile() as f:
+                with _dump_lock:
+                    if _lib.pymsc_rules_dump_fd(self._rules_set,
+                                                f.fileno()) == -1:
+                        raise OSError(_ffi.errno, os.strerror(_ffi.errno))
+                f.seek(0)
+                index = self._index = RuleIndex.from_dump(f.read())
+        return index
+
     def merge_rules(self, other_rules):
         """
         Merge a rules set into another one.
@@ -55,6 +249,7 @@ class Rules:
 
         :return: number of rules merged as :class:`int`
         """
+        self._index = None
         return _lib.msc_rules_merge(self._rules_set,
                                     other_rules._rules_set,
                                     self._error_pointer)
@@ -68,12 +263,13 @@ class Rules:
 
         :return: number of rules merged as :class:`int`
         """
+        self._index = None
         retvalue = _lib.msc_rules_add_remote(self._rules_set,
                                              utils.as_bytes(key),
                                              utils.as_bytes(uri),
                                              self._error_pointer)
         if retvalue == -1:
-            raise InternalError(self._last_error_message())
+            self._raise_load_error()
         return retvalue
 
     def add_rules_file(self, filename):
@@ -84,11 +280,12 @@ class Rules:
 
         :return: number of rules merged as :class:`int`
         """
+        self._index = None
         retvalue = _lib.msc_rules_add_file(self._rules_set,
                                            utils.as_bytes(filename),
                                            self._error_pointer)
         if retvalue == -1:
-            raise InternalError(self._last_error_message())
+            self._raise_load_error()
         return retvalue
 
     def add_rules(self, plain_rules):
@@ -100,9 +297,10 @@ class Rules:
 
         :return: number of rules merged as :class:`int`
         """
+        self._index = None
         retvalue = _lib.msc_rules_add(self._rules_set,
                                       utils.as_bytes(plain_rules),
                                       self._error_pointer)
         if retvalue == -1:
-            raise InternalError(self._last_error_message())
+            self._raise_load_error()
         return retvalue
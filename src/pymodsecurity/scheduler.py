@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+"""
+pymodsecurity.scheduler
+-----------------------
+
+Provide a class :class:`LoggingScheduler` running
+:meth:`~pymodsecurity.transaction.Transaction.process_logging` out of the
+request path, on a dedicated thread.
+"""
+
+import atexit
+import queue
+import threading
+import time
+
+from pymodsecurity.exceptions import LoggingActionError
+
+
+#: Block the caller until there is room in the queue.
+BLOCK = "block"
+#: Close the transaction without logging it.
+DROP = "drop"
+#: Log the transaction in the caller's thread.
+INLINE = "inline"
+
+_POLICIES = (BLOCK, DROP, INLINE)
+
+# Sentinel telling the writer thread to stop.
+_STOP = object()
+
+
+class LoggingScheduler:
+    """
+    Queue finished transactions and log them in batches on a background
+    writer thread.
+
+    A scheduled :class:`~pymodsecurity.transaction.Transaction` is referenced
+    by the queue, so it stays alive until its log has been written. It is
+    closed right after, whether logging succeeded or not.
+
+    :param maxsize: maximum number of transactions waiting to be logged
+    :param batch_size: maximum number of transactions logged per wake-up of
+        the writer thread
+    :param policy: what to do when the queue is full: :data:`BLOCK`,
+        :data:`DROP` or :data:`INLINE`
+    :param timeout: with the :data:`BLOCK` policy, maximum number of seconds
+        to wait for room in the queue before dropping the transaction,
+        ``None`` waits forever
+    """
+    def __init__(self, maxsize=1024, batch_size=64, policy=BLOCK,
+                 timeout=None):
+        if policy not in _POLICIES:
+            raise ValueError("Unknown policy: " + repr(policy))
+        if batch_size < 1:
+            raise ValueError("batch_size must be greater than 0")
+
+        self.policy = policy
+        self.batch_size = batch_size
+        self.timeout = timeout
+
+        #: Number of transactions successfully logged.
+        self.logged = 0
+        #: Number of transactions whose logging failed.
+        self.failed = 0
+        #: Number of transactions discarded because the queue was full.
+        self.dropped = 0
+
+        self._queue = queue.Queue(maxsize)
+        self._closed = False
+        # Set when the stop sentinel could not be queued: the writer thread
+        # stops once the queue is drained instead.
+        self._stopping = threading.Event()
+        # Serialises schedule() and close(), so that nothing is queued after
+        # the stop sentinel.
+        self._lock = threading.Lock()
+        # Guards the counters, changed from the writer and INLINE callers.
+        self._counters_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run,
+                                        name="pymodsecurity-logging",
+                                        daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def schedule(self, transaction):
+        """
+        Schedule the logging of a finished transaction.
+
+        :param transaction: an instance of
+            :class:`~pymodsecurity.transaction.Transaction`
+
+        :return: ``False`` if the transaction has been dropped, ``True``
+            otherwise
+
+        .. note:: The transaction must not be used anymore by the caller once
+            it has been scheduled. A transaction created by a
+            :class:`~pymodsecurity.connection.Connection` must be detached
+            from it first, with
+            :meth:`~pymodsecurity.connection.Connection.detach`.
+        """
+        with self._lock:
+            if self._closed:
+                raise LoggingActionError("Logging scheduler is closed")
+
+            try:
+                self._queue.put_nowait(transaction)
+                return True
+            except queue.Full:
+                pass
+
+            if self.policy == BLOCK:
+                try:
+                    self._queue.put(transaction, timeout=self.timeout)
+                    return True
+                except queue.Full:
+                    pass
+
+        if self.policy == INLINE:
+            self._process(transaction)
+            return True
+
+        with self._counters_lock:
+            self.dropped += 1
+        transaction.close()
+        return False
+
+    def flush(self):
+        """
+        Block until every scheduled transaction has been logged.
+        """
+        self._queue.join()
+
+    def close(self, timeout=None):
+        """
+        Log every scheduled transaction then stop the writer thread.
+
+        Calling this method several times has no effect. It is called
+        automatically when the interpreter exits.
+
+        :param timeout: maximum number of seconds to wait for room in the
+            queue then for the writer thread, ``None`` waits forever. Once
+            it is over, the writer thread keeps logging the scheduled
+            transactions in the background, then stops.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        atexit.unregister(self.close)
+
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            self._stopping.set()
+        if deadline is not None:
+            timeout = max(deadline - time.monotonic(), 0)
+        self._thread.join(timeout)
+
+    def _process(self, transaction):
+        try:
+            transaction.process_logging()
+        except Exception:
+            # Any failure is counted, the writer thread must keep running.
+            with self._counters_lock:
+                self.failed += 1
+        else:
+            with self._counters_lock:
+                self.logged += 1
+        finally:
+            transaction.close()
+
+    def _run(self):
+        stop = False
+        while not stop:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            for transaction in batch:
+                try:
+                    if transaction is _STOP:
+                        stop = True
+                    else:
+                        self._process(transaction)
+                finally:
+                    self._queue.task_done()
+            del batch, transaction
+            if self._stopping.is_set() and self._queue.empty():
+                stop = True
@@ -0,0 +1,380 @@
+# -*- coding: utf-8 -*-
+"""
+pymodsecurity.shared_metrics
+----------------------------
+
+Provide a class :class:`SharedRegistry` holding counters and histograms in
+shared memory, so that the metrics of every worker of a prefork server
+(gunicorn, uWSGI...) are rendered as a whole by a single exporter.
+
+Each worker records in its own row of the shared block, so that recording
+needs neither a lock nor any IPC. Rendering sums the rows. Create the
+registry in the master process, before workers are forked::
+
+    from pymodsecurity import metrics
+    from pymodsecurity.shared_metrics import SharedRegistry
+
+    registry = SharedRegistry()
+    metrics.enable(registry)
+    metrics.serve(9100, registry=registry)
+
+Metrics read from callbacks, such as live C handles, only make sense within
+a process and are not shared.
+
+Requires Python 3.8 or greater.
+"""
+
+import bisect
+import multiprocessing
+import os
+import weakref
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    # Python < 3.8
+    shared_memory = None
+
+from pymodsecurity import metrics
+
+
+# Histogram sums are stored as integers, in units of 1 / _SUM_SCALE.
+_SUM_SCALE = 10 ** 9
+
+# Header of the block: number of rows and number of slots per row. Each row
+# starts with the PID of the worker owning it.
+_HEADER_SIZE = 2
+
+_registries = weakref.WeakSet()
+
+
+def _after_fork_in_child():
+    for registry in list(_registries):
+        registry._row = None
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class _SharedValue:
+    """
+    Counter value stored in a slot of the worker's row.
+    """
+    __slots__ = ("_registry", "_offset")
+
+    def __init__(self, registry, offset):
+        self._registry = registry
+        self._offset = offset
+
+    def inc(self, amount=1):
+        row = self._registry._row
+        if row is None:
+            row = self._registry.claim()
+        row[self._offset] += amount
+
+
+class _SharedBuckets:
+    """
+    Histogram buckets stored in consecutive slots of the worker's row,
+    followed by the scaled sum of observed values.
+    """
+    __slots__ = ("_registry", "_offset", "buckets", "_sum_offset")
+
+    def __init__(self, registry, offset, buckets):
+        self._registry = registry
+        self._offset = offset
+        self.buckets = buckets
+        self._sum_offset = offset + len(buckets) + 1
+
+    def observe(self, value, _bisect_left=bisect.bisect_left):
+        row = self._registry._row
+        if row is None:
+            row = self._registry.claim()
+        row[self._offset + _bisect_left(self.buckets, value)] += 1
+        row[self._sum_offset] += int(value * _SUM_SCALE)
+
+
+class _SharedMetric:
+    """
+    Metric whose values live in a :class:`SharedRegistry`.
+
+    Label values must be declared when the metric is created. Values
+    recorded for undeclared label values are accounted to the ``"other"``
+    label value.
+    """
+    def __init__(self, registry, name, documentation, labelnames,
+                 labelvalues, width):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+        labelvalues = [tuple(str(value) for value in values)
+                       for values in labelvalues]
+        if self.labelnames:
+            labelvalues.append(("other",) * len(self.labelnames))
+        else:
+            labelvalues = [()]
+
+        self._children = {}
+        for values in labelvalues:
+            if values not in self._children:
+                self._children[values] = self._new_child(
+                    registry, registry._reserve(width))
+        self._other = self._children[labelvalues[-1]]
+
+    def labels(self, *values):
+        """
+        Get the child metric recording values for a set of label values.
+
+        :param values: one value per label name, in declaration order
+        """
+        child = self._children.get(values)
+        if child is None:
+            child = self._children.get(tuple(str(value)
+                                             for value in values),
+                                       self._other)
+        return child
+
+    def render(self, totals):
+        """
+        Render the metric in the Prometheus text format.
+
+        :param totals: sums of every slot over the workers
+        """
+        lines = ["# HELP {} {}".format(self.name,
+                                       self.documentation.replace("\n", " ")),
+                 "# TYPE {} {}".format(self.name, self.type_name)]
+        for values, child in sorted(self._children.items()):
+            lines.extend(self._render_child(child, values, totals))
+        return "\n".join(lines) + "\n"
+
+
+class SharedCounter(_SharedMetric):
+    """
+    :class:`~pymodsecurity.metrics.Counter` stored in shared memory.
+    """
+    type_name = "counter"
+
+    def __init__(self, registry, name, documentation, labelnames=(),
+                 labelvalues=()):
+        super().__init__(registry, name, documentation, labelnames,
+                         labelvalues, 1)
+
+    @staticmethod
+    def _new_child(registry, offset):
+        return _SharedValue(registry, offset)
+
+    def inc(self, amount=1):
+        """
+        Increase the counter, when declared without labels.
+        """
+        self._other.inc(amount)
+
+    def _render_child(self, child, values, totals):
+        return [self.name + metrics._format_labels(self.labelnames, values) +
+                " " + str(totals[child._offset])]
+
+
+class SharedHistogram(_SharedMetric):
+    """
+    :class:`~pymodsecurity.metrics.Histogram` stored in shared memory.
+    """
+    type_name = "histogram"
+
+    def __init__(self, registry, name, documentation, labelnames=(),
+                 labelvalues=(), buckets=metrics.LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        super().__init__(registry, name, documentation, labelnames,
+                         labelvalues, len(self.buckets) + 2)
+
+    def _new_child(self, registry, offset):
+        return _SharedBuckets(registry, offset, self.buckets)
+
+    def observe(self, value):
+        """
+        Record a value, when declared without labels.
+        """
+        self._other.observe(value)
+
+    def _render_child(self, child, values, totals):
+        histogram = metrics.Histogram(self.name, self.documentation,
+                                      buckets=self.buckets)
+        start = child._offset
+        histogram.counts = totals[start:start + len(self.buckets) + 1]
+        histogram.sum = totals[child._sum_offset] / _SUM_SCALE
+        return histogram._render_lines(self.name, self.labelnames, values)
+
+
+class SharedRegistry:
+    """
+    Collection of metrics stored in a shared memory block holding one row of
+    64-bit slots per worker.
+
+    The same metrics must be declared in the same order by every process
+    using the block, which is granted when workers are forked from the
+    process which declared them.
+
+    :param name: name of the shared memory block, a unique name is generated
+        if ``None`` and ``create`` is ``True``
+    :param workers: maximum number of workers recording at the same time
+    :param slots: number of slots in each row
+    :param create: create the block, or attach to an existing one
+    """
+    def __init__(self, name=None, workers=64, slots=1024, create=True):
+        if shared_memory is None:
+            raise RuntimeError("Shared metrics require Python 3.8 or greater")
+
+        if create:
+            size = 8 * (_HEADER_SIZE + workers * (slots + 1))
+            self._memory = shared_memory.SharedMemory(name, True, size)
+            self._values = self._memory.buf.cast("q")
+            self._values[0] = workers
+            self._values[1] = slots
+        else:
+            self._memory = shared_memory.SharedMemory(name)
+            self._values = self._memory.buf.cast("q")
+        self.workers = self._values[0]
+        self.slots = self._values[1]
+
+        # Only effective between processes forked from the creator.
+        self._claim_lock = multiprocessing.Lock()
+        self._row = None
+        self._used = 0
+        self._metrics = {}
+        _registries.add(self)
+
+    @property
+    def name(self):
+        """
+        Name of the shared memory block, to attach to it from another
+        process.
+        """
+        return self._memory.name
+
+    def _row_start(self, row):
+        return _HEADER_SIZE + row * (self.slots + 1)
+
+    def _reserve(self, count):
+        offset = self._used
+        if offset + count > self.slots:
+            raise ValueError("Not enough slots in the shared registry")
+        self._used += count
+        return offset
+
+    def claim(self):
+        """
+        Claim a row for the current process. Rows of dead processes are
+        reused, their values are kept.
+
+        It is done automatically the first time the process records a value.
+
+        :return: the row as a :class:`memoryview` of slots
+        """
+        pid = os.getpid()
+        with self._claim_lock:
+            free = None
+            for row in range(self.workers):
+                start = self._row_start(row)
+                owner = self._values[start]
+                if owner == pid:
+                    free = start
+                    break
+                if free is None and (owner == 0 or not _alive(owner)):
+                    free = start
+            if free is None:
+                raise RuntimeError("No free worker row in the shared "
+                                   "registry")
+            self._values[free] = pid
+
+        self._row = self._values[free + 1:free + 1 + self.slots]
+        return self._row
+
+    def register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError("Duplicated metric " + metric.name)
+        self._metrics[metric.name] = metric
+        return metric
+
+    def unregister(self, metric):
+        """
+        Stop rendering a metric. Its slots are not reused.
+        """
+        self._metrics.pop(metric.name, None)
+
+    def counter(self, name, documentation, labelnames=(), labelvalues=()):
+        """
+        Create and register a :class:`SharedCounter`, see
+        :meth:`pymodsecurity.metrics.Registry.counter`.
+        """
+        return self.register(SharedCounter(self, name, documentation,
+                                           labelnames, labelvalues))
+
+    def histogram(self, name, documentation, labelnames=(), labelvalues=(),
+                  buckets=metrics.LATENCY_BUCKETS):
+        """
+        Create and register a :class:`SharedHistogram`, see
+        :meth:`pymodsecurity.metrics.Registry.histogram`.
+        """
+        return self.register(SharedHistogram(self, name, documentation,
+                                             labelnames, labelvalues,
+                                             buckets))
+
+    def callback(self, name, documentation, function, labelnames=(),
+                 type_name="gauge"):
+        """
+        Callback metrics are not shared between processes: nothing is
+        registered.
+
+        :return: ``None``
+        """
+        return None
+
+    def totals(self):
+        """
+        Sum every used slot over the workers.
+
+        :return: :class:`list` of :class:`int`
+        """
+        totals = [0] * self._used
+        for row in range(self.workers):
+            start = self._row_start(row) + 1
+            values = self._values[start:start + self._used].tolist()
+            totals = [total + value for total, value in zip(totals, values)]
+        return totals
+
+    def render(self):
+        """
+        Render every metric, summed over the workers, in the Prometheus text
+        format.
+
+        :return: :class:`str`
+        """
+        totals = self.totals()
+        return "".join(metric.render(totals)
+                       for metric in list(self._metrics.values()))
+
+    def close(self):
+        """
+        Detach from the shared memory block.
+        """
+        _registries.discard(self)
+        self._row = None
+        self._values.release()
+        self._memory.close()
+
+    def unlink(self):
+        """
+        Destroy the shared memory block, once every process has closed it.
+        """
+        self._memory.unlink()
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+pymodsecurity.spool
+-------------------
+
+Provide a class :class:`RequestBodySpooler` feeding request bodies to
+libmodsecurity while bounding the memory each upload takes in the Python
+process.
+"""
+
+import io
+import os
+import tempfile
+
+
+class RequestBodySpooler:
+    """
+    Feed request bodies to transactions, in memory when they are small,
+    through a temporary file otherwise.
+
+    A body larger than ``threshold`` is copied from the client stream to a
+    temporary file by chunks of ``chunk_size`` bytes, then handed over with
+    :meth:`~pymodsecurity.transaction.Transaction.get_request_body_from_file`.
+    The file is unlinked as soon as libmodsecurity has read it: it stays
+    readable through the returned file object, and disappears once this one
+    is closed.
+
+    .. note:: libmodsecurity reads the file in memory to inspect it, up to
+        ``SecRequestBodyLimit``: set this directive to bound its own copy.
+
+    :param threshold: maximum size of a body kept in memory, in bytes
+    :param chunk_size: size of the reads from the client stream and of the
+        writes to the temporary file, in bytes
+    :param directory: directory of the temporary files, the default
+        temporary directory if ``None``
+    """
+    def __init__(self, threshold=1024 * 1024, chunk_size=1024 * 1024,
+                 directory=None):
+        if chunk_size < 1:
+            raise ValueError("chunk_size must be greater than 0")
+
+        self.threshold = threshold
+        self.chunk_size = chunk_size
+        self.directory = directory
+
+        #: Number of bodies fed from memory.
+        self.buffered = 0
+        #: Number of bodies fed through a temporary file.
+        self.spooled = 0
+
+    def feed(self, transaction, stream, length):
+        """
+        Read a request body from a stream and append it to a transaction.
+
+        :param transaction: an instance of
+            :class:`~pymodsecurity.transaction.Transaction`
+        :param stream: file-like object the body is read from, such as the
+            ``wsgi.input`` of a WSGI environment
+        :param length: length of the body, in bytes
+
+        :return: a file-like object holding the body, positioned at its
+            beginning, to be closed by the caller
+        """
+        if length <= self.threshold:
+            body = stream.read(length)
+            transaction.append_request_body(body)
+            self.buffered += 1
+            return io.BytesIO(body)
+
+        descriptor, path = tempfile.mkstemp(prefix="pymodsecurity-",
+                                            dir=self.directory)
+        spool = os.fdopen(descriptor, "w+b")
+        try:
+            try:
+                self._copy(stream, spool, length)
+                spool.flush()
+                transaction.get_request_body_from_file(path)
+            finally:
+                os.unlink(path)
+        except BaseException:
+            spool.close()
+            raise
+
+        self.spooled += 1
+        spool.seek(0)
+        return spool
+
+    def _copy(self, stream, spool, length):
+        remaining = length
+        while remaining:
+            chunk = stream.read(min(remaining, self.chunk_size))
+            if not chunk:
+                break
+            spool.write(chunk)
+            remaining -= len(chunk)
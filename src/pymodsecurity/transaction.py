@@ -7,53 +7,251 @@ Provide a class :class:`Transaction` gathering methods coming from
 libmodsecurity.
 """
 
+import collections
+import os
+
+from pymodsecurity import metrics
 from pymodsecurity._modsecurity import ffi as _ffi
 from pymodsecurity._modsecurity import lib as _lib
-from pymodsecurity.utils import as_bytes
-from pymodsecurity.exceptions import (ProcessConnectionError,
+from pymodsecurity.utils import as_bytes, register_handle, text
+from pymodsecurity.exceptions import (ClosedError,
+                                      ProcessConnectionError,
                                       FeedingError,
                                       LoggingActionError)
 
 
 _NULL = _ffi.NULL
 
+#: Action ModSecurity asks the server to perform, see
+#: :meth:`Transaction.get_intervention`.
+Intervention = collections.namedtuple("Intervention", ("status",
+                                                       "pause",
+                                                       "url",
+                                                       "log",
+                                                       "disruptive"))
+
+
+def _acquire(modsecurity, rules):
+    """
+    Defer the closing of ``modsecurity`` and ``rules`` while their C structs
+    are in use.
+
+    :return: their :class:`~pymodsecurity.utils.Dependents`, to be released
+        with :func:`_release`
+    """
+    modsecurity._dependents.acquire()
+    try:
+        rules._dependents.acquire()
+    except BaseException:
+        modsecurity._dependents.release()
+        raise
+    return modsecurity._dependents, rules._dependents
+
+
+def _release(parents):
+    for parent in parents:
+        parent.release()
+
 
 class Transaction:
     """
     Wrapper for C functions built from **transaction.h** via CFFI.
 
+    The same C functions are aliased by :mod:`pymodsecurity.lowlevel`,
+    without checks nor exceptions, for hot loops: pass them :attr:`handle`.
+
     :param modsecurity: an instance of :class:`~modsecurity.ModSecurity`
     :param rules: an instance of :class:`~rules.Rules`
+    :param log_data: object passed to the log callback
+    :param return_interventions: make each ``process_*`` phase method check
+        for an intervention in the same call to the C interface, and return
+        it as :meth:`get_intervention` does
     """
-    def __init__(self, modsecurity, rules, log_data=None):
+    __slots__ = ("_modsecurity",
+                 "_rules",
+                 "_log_callback_data",
+                 "_intervention",
+                 "_last_intervention",
+                 "_return_interventions",
+                 "memory",
+                 "latency",
+                 "_transaction_struct",
+                 "_finalizer",
+                 "__weakref__")
+
+    def __init__(self, modsecurity, rules, log_data=None,
+                 return_interventions=False):
         self._modsecurity = modsecurity
         self._rules = rules
+        self._return_interventions = return_interventions
+        #: :class:`~pymodsecurity.memory.MemoryUsage` of the transaction,
+        #: when memory accounting is enabled.
+        self.memory = None
+        #: :class:`~pymodsecurity.latency.LatencyTimer` of the transaction,
+        #: when a latency budget is enabled.
+        self.latency = None
         if log_data is None:
             log_data = _NULL
         else:
             log_data = _ffi.new_handle(log_data)
         self._log_callback_data = log_data
 
-        self._status = 0
-        self._pause = 0
-        self._disruptive = 0
-        self._url = _ffi.new("char *")
-        self._log = _ffi.new("char *")
-        self._intervention = _ffi.new("ModSecurityIntervention *",
-                                      [self._status,
-                                       self._pause,
-                                       self._url,
-                                       self._log,
-                                       self._disruptive])
-
-        self._transaction_struct = _lib.msc_new_transaction(
-            self._modsecurity._modsecurity_struct,
-            self._rules._rules_set,
-            self._log_callback_data)
+        # Zero-initialized: status, pause and disruptive set to 0, url and
+        # log set to NULL.
+        self._intervention = _ffi.new("ModSecurityIntervention *")
+        # Intervention of the latest phase, libmodsecurity only reports it
+        # once.
+        self._last_intervention = None
+
+        # ModSecurity and Rules instances are kept alive, and closing them
+        # deferred, until the C transaction is released since it refers to
+        # their C structs.
+        parents = _acquire(modsecurity, rules)
+        try:
+            self._transaction_struct = _lib.msc_new_transaction(
+                self._modsecurity._modsecurity_struct,
+                self._rules._rules_set,
+                self._log_callback_data)
+        except BaseException:
+            _release(parents)
+            raise
         assert self._transaction_struct != _NULL
-
-    def __del__(self):
-        _lib.msc_transaction_cleanup(self._transaction_struct)
+        self._finalizer = register_handle(self, "Transaction",
+                                          _lib.msc_transaction_cleanup,
+                                          self._transaction_struct,
+                                          self._modsecurity,
+                                          self._rules,
+                                          self._log_callback_data,
+                                          parents=parents)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __getattr__(self, name):
+        # Only reached for unset slots: the handle is removed once closed.
+        if name == "_transaction_struct":
+            raise ClosedError("Transaction is closed")
+        raise AttributeError(name)
+
+    @property
+    def closed(self):
+        """
+        Whether the transaction has been closed.
+        """
+        return not self._finalizer.alive
+
+    @property
+    def handle(self):
+        """
+        C handle of the transaction, ``Transaction *``, valid until it is
+        closed.
+
+        :raise: :exc:`~pymodsecurity.exceptions.ClosedError` if it is closed
+        """
+        return self._transaction_struct
+
+    def close(self):
+        """
+        Free the memory allocated by libmodsecurity for this transaction,
+        including buffered bodies.
+
+        It is done automatically when the instance is garbage collected.
+        Calling this method several times has no effect.
+
+        The instance must not be used anymore once closed: its methods raise
+        :exc:`~pymodsecurity.exceptions.ClosedError`.
+        """
+        self._finalizer()
+        try:
+            del self._transaction_struct
+        except AttributeError:
+            pass
+
+    @staticmethod
+    def inspect_many(modsecurity, rules, requests):
+        """
+        Inspect a batch of requests with a single call to the C interface.
+
+        Each request gets its own transaction, on which the connection, URI,
+        request headers, request body and logging phases are performed. The
+        request phases stop at the first intervention. The GIL is released
+        while the batch is inspected.
+
+        Requests are mappings with the following keys, all optional except
+        ``uri``:
+
+            - ``client_ip``, ``client_port``, ``server_ip`` and
+              ``server_port`` as for :meth:`process_connection` (default to
+              ``"127.0.0.1"``, ``0``, ``"127.0.0.1"`` and ``80``)
+            - ``uri``, ``method`` and ``http_version`` as for
+              :meth:`process_uri` (default to ``"GET"`` and ``"1.1"``)
+            - ``headers``: iterable of ``(key, value)`` request headers
+            - ``body``: request body
+
+        :param modsecurity: an instance of :class:`~modsecurity.ModSecurity`
+        :param rules: an instance of :class:`~rules.Rules`
+        :param requests: sequence of requests
+
+        :return: CFFI array of ``PyMscVerdict`` structs, one per request,
+            with ``status``, ``disruptive`` and ``matched_rules`` fields
+        """
+        count = len(requests)
+        c_requests = _ffi.new("PyMscRequest[]", count)
+        verdicts = _ffi.new("PyMscVerdict[]", count)
+        # C strings must outlive the call
+        keepalive = []
+
+        def _string(value):
+            string = _ffi.new("char[]", as_bytes(value))
+            keepalive.append(string)
+            return string
+
+        for c_request, request in zip(c_requests, requests):
+            c_request.client_ip = _string(request.get("client_ip",
+                                                      "127.0.0.1"))
+            c_request.client_port = int(request.get("client_port", 0))
+            c_request.server_ip = _string(request.get("server_ip",
+                                                      "127.0.0.1"))
+            c_request.server_port = int(request.get("server_port", 80))
+            c_request.uri = _string(request["uri"])
+            c_request.method = _string(request.get("method", "GET"))
+            c_request.http_version = _string(request.get("http_version",
+                                                         "1.1"))
+
+            headers = list(request.get("headers", ()))
+            keys = _ffi.new("const char *[]",
+                            [_string(key) for key, _ in headers])
+            values = _ffi.new("const char *[]",
+                              [_string(value) for _, value in headers])
+            keepalive.extend((keys, values))
+            c_request.header_keys = keys
+            c_request.header_values = values
+            c_request.header_count = len(headers)
+
+            body = as_bytes(request.get("body", b""))
+            if body:
+                body = _ffi.from_buffer(body)
+                keepalive.append(body)
+                c_request.body = body
+                c_request.body_size = len(body)
+
+        parents = _acquire(modsecurity, rules)
+        try:
+            inspected = _lib.pymsc_inspect_many(
+                modsecurity._modsecurity_struct,
+                rules._rules_set,
+                c_requests,
+                count,
+                verdicts)
+        finally:
+            _release(parents)
+        if inspected != count:
+            raise ProcessConnectionError.failed_at(
+                "request " + str(inspected) + " of the batch")
+        return verdicts
 
     def process_connection(self,
                            client_ip, client_port,
@@ -70,9 +268,23 @@ class Transaction:
         :param server_ip: server's IP address as :class:`str`
         :param server_port: server's port as :class:`int`
 
+        :return: with ``return_interventions``, an :class:`Intervention` or
+            ``None``
+
         .. note:: Remember to check for a possible intervention with
-            :meth:`has_intervention()`.
-        """
+            :meth:`has_intervention()`, unless ``return_interventions`` is
+            set.
+        """
+        self._last_intervention = None
+        if self._return_interventions:
+            return self._folded(
+                _lib.pymsc_process_connection(self._transaction_struct,
+                                              as_bytes(client_ip),
+                                              int(client_port),
+                                              as_bytes(server_ip),
+                                              int(server_port),
+                                              self._intervention),
+                "connection")
         retvalue = _lib.msc_process_connection(self._transaction_struct,
                                                as_bytes(client_ip),
                                                int(client_port),
@@ -97,8 +309,21 @@ class Transaction:
             * Value consistency is not checked for ``method`` and
               ``http_version``.
             * Remember to check for a possible intervention
-              with :meth:`has_intervention()`.
-        """
+              with :meth:`has_intervention()`, unless
+              ``return_interventions`` is set.
+
+        :return: with ``return_interventions``, an :class:`Intervention` or
+            ``None``
+        """
+        self._last_intervention = None
+        if self._return_interventions:
+            return self._folded(
+                _lib.pymsc_process_uri(self._transaction_struct,
+                                       as_bytes(uri),
+                                       as_bytes(method),
+                                       as_bytes(http_version),
+                                       self._intervention),
+                "uri")
         retvalue = _lib.msc_process_uri(self._transaction_struct,
                                         as_bytes(uri),
                                         as_bytes(method),
@@ -115,9 +340,19 @@ class Transaction:
         this function or :exc:`~exceptions.ProcessConnectionError` will be
         raised.
 
-        .. note:: Remember to check for a possible intervention
-            with :meth:`has_intervention()`.
-        """
+        :return: with ``return_interventions``, an :class:`Intervention` or
+            ``None``
+
+        .. note:: Remember to check for a possible intervention with
+            :meth:`has_intervention()`, unless ``return_interventions`` is
+            set.
+        """
+        self._last_intervention = None
+        if self._return_interventions:
+            return self._folded(
+                _lib.pymsc_process_request_headers(self._transaction_struct,
+                                                   self._intervention),
+                "request headers")
         retvalue = _lib.msc_process_request_headers(self._transaction_struct)
         if not retvalue:
             raise ProcessConnectionError.failed_at("request headers")
@@ -157,17 +392,28 @@ class Transaction:
         if not retvalue:
             raise FeedingError.failed_at("request body")
 
+        stats = metrics.library
+        if stats is not None:
+            stats.request_body_bytes.inc(len(body))
+
     def get_request_body_from_file(self, filepath):
         """
         Add request body stored in a file to be inspected.
 
         :param filepath: path to a file
+
+        .. note:: Use :class:`~pymodsecurity.spool.RequestBodySpooler` to
+            spool large bodies to a file.
         """
         retvalue = _lib.msc_request_body_from_file(self._transaction_struct,
                                                    as_bytes(filepath))
         if not retvalue:
             raise FeedingError.failed_at("getting request body from file")
 
+        stats = metrics.library
+        if stats is not None:
+            stats.request_body_bytes.inc(os.path.getsize(filepath))
+
     def process_request_body(self):
         """
         Perform the analysis on the request body (if any).
@@ -180,9 +426,19 @@ class Transaction:
         this function or :exc:`~exceptions.ProcessConnectionError` will be
         raised.
 
-        .. note:: Remember to check for a possible intervention
-            with :meth:`has_intervention()`.
-        """
+        :return: with ``return_interventions``, an :class:`Intervention` or
+            ``None``
+
+        .. note:: Remember to check for a possible intervention with
+            :meth:`has_intervention()`, unless ``return_interventions`` is
+            set.
+        """
+        self._last_intervention = None
+        if self._return_interventions:
+            return self._folded(
+                _lib.pymsc_process_request_body(self._transaction_struct,
+                                                self._intervention),
+                "request body")
         retvalue = _lib.msc_process_request_body(self._transaction_struct)
         if not retvalue:
             raise ProcessConnectionError.failed_at("request body")
@@ -199,9 +455,21 @@ class Transaction:
         :param statuscode: HTTP status code as :class:`int`
         :param protocol: protocol name with its version (e.g "HTTP 1.1")
 
-        .. note:: Remember to check for a possible intervention
-            with :meth:`has_intervention()`.
-        """
+        :return: with ``return_interventions``, an :class:`Intervention` or
+            ``None``
+
+        .. note:: Remember to check for a possible intervention with
+            :meth:`has_intervention()`, unless ``return_interventions`` is
+            set.
+        """
+        self._last_intervention = None
+        if self._return_interventions:
+            return self._folded(
+                _lib.pymsc_process_response_headers(self._transaction_struct,
+                                                    int(statuscode),
+                                                    as_bytes(protocol),
+                                                    self._intervention),
+                "response headers")
         retvalue = _lib.msc_process_response_headers(self._transaction_struct,
                                                      int(statuscode),
                                                      as_bytes(protocol))
@@ -236,9 +504,19 @@ class Transaction:
         this function or :exc:`~exceptions.ProcessConnectionError` will be
         raised.
 
-        .. note:: Remember to check for a possible intervention
-            with :meth:`has_intervention()`.
-        """
+        :return: with ``return_interventions``, an :class:`Intervention` or
+            ``None``
+
+        .. note:: Remember to check for a possible intervention with
+            :meth:`has_intervention()`, unless ``return_interventions`` is
+            set.
+        """
+        self._last_intervention = None
+        if self._return_interventions:
+            return self._folded(
+                _lib.pymsc_process_response_body(self._transaction_struct,
+                                                 self._intervention),
+                "response body")
         retvalue = _lib.msc_process_response_body(self._transaction_struct)
         if not retvalue:
             raise ProcessConnectionError.failed_at("response body")
@@ -264,6 +542,10 @@ class Transaction:
         if not retvalue:
             raise FeedingError.failed_at("response body")
 
+        stats = metrics.library
+        if stats is not None:
+            stats.response_body_bytes.inc(len(body))
+
     def get_response_body(self):
         """
         Retrieve a buffer with the updated response body.
@@ -298,13 +580,59 @@ class Transaction:
         Intervention can generate a log event and/or perform a disruptive
         action depending on ``SecRuleEngine`` value in ModSecurity
         configuration file.
-        This function only displays information about the current transaction
-        so calling it has no side-effect.
+        It reports the intervention of the latest phase: calling it several
+        times gives the same result until the next phase is performed.
 
         :return: ``True`` if a disrupive action has (to be) performed
         """
-        return bool(_lib.msc_intervention(self._transaction_struct,
-                                          self._intervention))
+        return self.get_intervention() is not None
+
+    def get_intervention(self):
+        """
+        Get the action ModSecurity asks the server to perform, if any.
+
+        As :meth:`has_intervention()`, it reports the intervention of the
+        latest phase, the same one until the next phase is performed.
+
+        :return: an :class:`Intervention`, ``None`` if there is nothing to do
+        """
+        if not _lib.msc_intervention(self._transaction_struct,
+                                     self._intervention):
+            return self._last_intervention
+        return self._read_intervention()
+
+    def _folded(self, result, phase):
+        """
+        Handle the result of a phase performed by a ``pymsc_process_*``
+        helper.
+
+        :param result: -1 if the phase failed, 1 if there is an
+            intervention, 0 otherwise
+        :param phase: phase name used in the error message
+        """
+        if not result:
+            return None
+        if result < 0:
+            raise ProcessConnectionError.failed_at(phase)
+        return self._read_intervention()
+
+    def _read_intervention(self):
+        """
+        Read the intervention just written by libmodsecurity, keep it as the
+        one of the latest phase, then free the strings it duplicated.
+        """
+        intervention = self._intervention
+        stats = metrics.library
+        if stats is not None:
+            stats.interventions.labels(intervention.status).inc()
+        result = Intervention(intervention.status,
+                              intervention.pause,
+                              text(intervention.url),
+                              text(intervention.log),
+                              intervention.disruptive)
+        _lib.pymsc_intervention_cleanup(intervention)
+        self._last_intervention = result
+        return result
 
     def process_logging(self):
         """
@@ -314,6 +642,9 @@ class Transaction:
 
         At this point there is not need to hold the connection, the response
         can be delivered prior to the execution of this function.
+
+        .. note:: Use :class:`~pymodsecurity.scheduler.LoggingScheduler` to
+            run it on a background thread.
         """
         retvalue = _lib.msc_process_logging(self._transaction_struct)
         if not retvalue:
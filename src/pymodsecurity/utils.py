@@ -1,19 +1,106 @@
 # -*- coding: utf-8 -*-
 
+import ctypes
+import ctypes.util
 import sys
+import threading
+import weakref
 
 from pymodsecurity._modsecurity import ffi as _ffi
+from pymodsecurity.exceptions import ClosedError
 
 _encoding = sys.getdefaultencoding()
 
+_live_handles = {"ModSecurity": 0, "Rules": 0, "Transaction": 0}
+_created_handles = dict.fromkeys(_live_handles, 0)
+_live_handles_lock = threading.Lock()
+
+# Maximum number of strings kept pre-encoded by :func:`register_encoded`.
+_ENCODED_CACHE_SIZE = 512
+_encoded = {}
+
 
 def as_bytes(arg, encoding=_encoding):
-    try:
-        return bytes(arg, encoding)
-    except TypeError:
-        # ``arg`` is not a :class:`str`
+    """
+    Get a :class:`bytes` representation of ``arg`` to be passed to
+    libmodsecurity.
+
+    :class:`str` objects are encoded, with a lookup in the strings
+    pre-encoded by :func:`register_encoded` first. Any other object (e.g.
+    :class:`bytes` or :class:`bytearray`) is returned as is.
+
+    :param arg: object to convert
+    :param encoding: encoding used for :class:`str` objects
+    """
+    kind = type(arg)
+    if kind is bytes:
         return arg
 
+    if kind is str:
+        if encoding == _encoding:
+            encoded = _encoded.get(arg)
+            if encoded is not None:
+                return encoded
+        return arg.encode(encoding)
+
+    if isinstance(arg, str):
+        return arg.encode(encoding)
+    return arg
+
+
+def register_encoded(*strings):
+    """
+    Keep the default encoding of ``strings`` so that :func:`as_bytes` does
+    not encode them again.
+
+    The number of pre-encoded strings is bounded, strings registered once
+    the limit is reached are ignored.
+
+    :param strings: :class:`str` objects to pre-encode
+
+    :return: number of strings actually registered as :class:`int`
+    """
+    registered = 0
+    for string in strings:
+        if string in _encoded:
+            continue
+        if len(_encoded) >= _ENCODED_CACHE_SIZE:
+            break
+        _encoded[string] = string.encode(_encoding)
+        registered += 1
+    return registered
+
+
+register_encoded(
+    # HTTP methods
+    "GET", "HEAD", "POST", "PUT", "DELETE", "CONNECT", "OPTIONS", "TRACE",
+    "PATCH",
+    # HTTP versions and protocols
+    "1.0", "1.1", "2", "2.0", "HTTP/1.0", "HTTP/1.1", "HTTP/2", "HTTP/2.0",
+    "HTTP 1.0", "HTTP 1.1",
+    # Addresses
+    "127.0.0.1", "::1",
+    # Request headers
+    "Accept", "Accept-Charset", "Accept-Encoding", "Accept-Language",
+    "Authorization", "Cache-Control", "Connection", "Content-Length",
+    "Content-Type", "Cookie", "DNT", "Expect", "Forwarded", "From", "Host",
+    "If-Match", "If-Modified-Since", "If-None-Match", "If-Range",
+    "If-Unmodified-Since", "Origin", "Pragma", "Range", "Referer", "TE",
+    "Upgrade", "Upgrade-Insecure-Requests", "User-Agent", "Via",
+    "X-Forwarded-For", "X-Forwarded-Host", "X-Forwarded-Proto",
+    "X-Real-IP", "X-Requested-With",
+    # Response headers
+    "Accept-Ranges", "Age", "Allow", "Content-Disposition",
+    "Content-Encoding", "Content-Language", "Content-Location",
+    "Content-Range", "Content-Security-Policy", "Date", "ETag", "Expires",
+    "Last-Modified", "Link", "Location", "Retry-After", "Server",
+    "Set-Cookie", "Strict-Transport-Security", "Transfer-Encoding", "Vary",
+    "WWW-Authenticate", "X-Content-Type-Options", "X-Frame-Options",
+    "X-XSS-Protection",
+)
+register_encoded(*[name.lower() for name in tuple(_encoded)
+                   if name[0].isalpha() and not name.isupper()])
+
 
 def text(charp):
     """
@@ -23,3 +110,159 @@ def text(charp):
     :return: a :class:`str`
     """
     return bytes.decode(_ffi.string(charp)) if charp else ""
+
+
+def live_handles():
+    """
+    Get the number of C handles allocated by libmodsecurity and not released
+    yet, per type.
+
+    :return: a :class:`dict` mapping ``"ModSecurity"``, ``"Rules"`` and
+        ``"Transaction"`` to an :class:`int`
+    """
+    with _live_handles_lock:
+        return dict(_live_handles)
+
+
+def created_handles():
+    """
+    Get the number of C handles allocated by libmodsecurity since the module
+    was loaded, per type.
+
+    :return: a :class:`dict` with the same keys as :func:`live_handles`
+    """
+    with _live_handles_lock:
+        return dict(_created_handles)
+
+
+def _release_handle(kind, release, handle, parents, *keepalive):
+    release(handle)
+    with _live_handles_lock:
+        _live_handles[kind] -= 1
+    for parent in parents:
+        parent.release()
+
+
+def register_handle(owner, kind, release, handle, *keepalive, parents=()):
+    """
+    Count ``handle`` as a live C handle of type ``kind`` and make sure it is
+    released once, either explicitly or when ``owner`` is garbage collected.
+
+    :param owner: Python object wrapping ``handle``
+    :param kind: key of ``handle`` in :func:`live_handles`
+    :param release: C function freeing ``handle``
+    :param handle: CFFI pointer to the C object
+    :param keepalive: objects which must not be garbage collected before
+        ``handle`` is released
+    :param parents: :class:`Dependents` of the handles ``handle`` refers
+        to, already acquired, released once ``handle`` is released
+
+    :return: a :class:`weakref.finalize` object, call it to release
+        ``handle``
+    """
+    with _live_handles_lock:
+        _live_handles[kind] += 1
+        _created_handles[kind] += 1
+
+    return weakref.finalize(owner, _release_handle,
+                            kind, release, handle, tuple(parents),
+                            *keepalive)
+
+
+class Dependents:
+    """
+    Count the handles referring to a C handle, so that closing it is
+    deferred until the last of them is released.
+
+    :param finalizer: :class:`weakref.finalize` object returned by
+        :func:`register_handle` for the handle
+    """
+    __slots__ = ("_finalizer", "_count", "_closing", "_lock")
+
+    def __init__(self, finalizer):
+        self._finalizer = finalizer
+        self._count = 0
+        self._closing = False
+        self._lock = threading.Lock()
+
+    @property
+    def closed(self):
+        """
+        Whether :meth:`close` has been called.
+        """
+        return self._closing
+
+    def acquire(self):
+        """
+        Count a new dependent handle.
+
+        :raise: :exc:`~pymodsecurity.exceptions.ClosedError` if the handle
+            is closed
+        """
+        with self._lock:
+            if self._closing:
+                raise ClosedError()
+            self._count += 1
+
+    def release(self):
+        """
+        Forget a dependent handle, releasing the handle if it is the last one
+        of a closed handle.
+        """
+        with self._lock:
+            self._count -= 1
+            release = self._closing and not self._count
+        if release:
+            self._finalizer()
+
+    def close(self):
+        """
+        Release the handle now if nothing depends on it, once the last
+        dependent handle is released otherwise.
+        """
+        with self._lock:
+            self._closing = True
+            release = not self._count
+        if release:
+            self._finalizer()
+
+
+class _MallInfo2(ctypes.Structure):
+    _fields_ = [(name, ctypes.c_size_t)
+                for name in ("arena", "ordblks", "smblks", "hblks", "hblkhd",
+                             "usmblks", "fsmblks", "uordblks", "fordblks",
+                             "keepcost")]
+
+
+def _load_mallinfo():
+    """
+    Get a function returning the mallinfo2 struct of the C library, ``None``
+    if it is not available (e.g. glibc older than 2.33 or not glibc).
+    """
+    name = ctypes.util.find_library("c")
+    if name is None:
+        return None
+    try:
+        function = ctypes.CDLL(name).mallinfo2
+    except (OSError, AttributeError):
+        return None
+    function.restype = _MallInfo2
+    function.argtypes = []
+    return function
+
+
+_mallinfo = _load_mallinfo()
+
+
+def heap_in_use():
+    """
+    Get the number of bytes allocated on the native heap by ``malloc``,
+    including libmodsecurity allocations.
+
+    :return: bytes as :class:`int`, ``None`` if the C library does not
+        provide this information
+    """
+    if _mallinfo is None:
+        return None
+    info = _mallinfo()
+    return info.uordblks + info.hblkhd
@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+"""
+pymodsecurity.verdicts
+----------------------
+
+Provide a class :class:`VerdictBatch` collecting the verdicts of many
+transactions in typed columns, for offline analysis.
+
+A binary file written by :meth:`VerdictBatch.write_binary` is made of a
+header followed by the columns, in little-endian byte order: ``status``
+(int32), ``disruptive`` (int8), ``offsets`` (uint64), ``rule_ids`` (int64)
+and ``scores`` (int32).
+"""
+
+import array
+import csv
+import struct
+import sys
+
+from pymodsecurity._modsecurity import lib as _lib
+
+
+MAGIC = b"PYMSCVRD"
+VERSION = 1
+
+# Magic, format version, number of rows and number of matched rules.
+_HEADER = struct.Struct("<8sHQQ")
+
+# Type codes of the columns, in file order.
+_COLUMNS = (("status", "i"),
+            ("disruptive", "b"),
+            ("offsets", "Q"),
+            ("rule_ids", "q"),
+            ("scores", "i"))
+
+_SWAP = sys.byteorder != "little"
+
+
+class VerdictBatch:
+    """
+    Verdicts of transactions stored column by column.
+
+    Row ``i`` is made of ``status[i]`` and ``disruptive[i]``, and of the
+    matched rules found from ``offsets[i]`` to ``offsets[i + 1]`` in the
+    ``rule_ids`` and ``scores`` columns.
+
+    Columns are :class:`array.array` instances: they expose their memory
+    through the buffer protocol, e.g. to :func:`numpy.frombuffer`, without
+    any copy.
+    """
+    def __init__(self):
+        #: HTTP status asked by the intervention, 200 without intervention.
+        self.status = array.array("i")
+        #: 1 if the intervention was disruptive, 0 otherwise.
+        self.disruptive = array.array("b")
+        #: Start of the matched rules of each row, followed by their end.
+        self.offsets = array.array("Q", (0,))
+        #: IDs of the matched rules.
+        self.rule_ids = array.array("q")
+        #: Anomaly scores of the matched rules.
+        self.scores = array.array("i")
+
+    def __len__(self):
+        return len(self.status)
+
+    def append(self, status, disruptive, rule_ids=(), scores=()):
+        """
+        Append a row.
+
+        :param status: HTTP status
+        :param disruptive: whether the intervention was disruptive
+        :param rule_ids: IDs of the matched rules
+        :param scores: anomaly scores of the matched rules, in the same order
+        """
+        self.rule_ids.extend(rule_ids)
+        self.scores.extend(scores)
+        if len(self.scores) != len(self.rule_ids):
+            del self.rule_ids[self.offsets[-1]:]
+            del self.scores[self.offsets[-1]:]
+            raise ValueError("rule_ids and scores differ in length")
+
+        self.status.append(status)
+        self.disruptive.append(1 if disruptive else 0)
+        self.offsets.append(len(self.rule_ids))
+
+    def add(self, transaction, intervention=None):
+        """
+        Append the verdict of a transaction.
+
+        Matched rules are read straight from libmodsecurity, without their
+        messages.
+
+        :param transaction: an instance of
+            :class:`~pymodsecurity.transaction.Transaction`
+        :param intervention: its
+            :class:`~pymodsecurity.transaction.Intervention`, if any
+        """
+        info = _lib.msc_get_matched_rules_info(transaction.handle)
+        rules = info.rules_info
+        for i in range(info.size):
+            self.rule_ids.append(rules[i].id)
+            self.scores.append(rules[i].score)
+
+        if intervention is None:
+            self.status.append(200)
+            self.disruptive.append(0)
+        else:
+            self.status.append(intervention.status)
+            self.disruptive.append(1 if intervention.disruptive else 0)
+        self.offsets.append(len(self.rule_ids))
+
+    def rules(self, row):
+        """
+        Get the matched rules of a row.
+
+        :return: ``(rule_ids, scores)`` as :class:`array.array` instances
+        """
+        start, end = self.offsets[row], self.offsets[row + 1]
+        return self.rule_ids[start:end], self.scores[start:end]
+
+    def clear(self):
+        """
+        Remove every row.
+
+        The columns are replaced by empty ones, so that buffers exported
+        from the previous ones stay valid.
+        """
+        self.status = array.array("i")
+        self.disruptive = array.array("b")
+        self.offsets = array.array("Q", (0,))
+        self.rule_ids = array.array("q")
+        self.scores = array.array("i")
+
+    def write_csv(self, f):
+        """
+        Write one line per row: status, disruptive flag, then the matched
+        rule IDs and their scores, each separated by spaces.
+
+        :param f: text file opened with ``newline=""``
+        """
+        writer = csv.writer(f)
+        writer.writerow(("status", "disruptive", "rule_ids", "scores"))
+        rule_ids = self.rule_ids.tolist()
+        scores = self.scores.tolist()
+        offsets = self.offsets
+        for row, (status, disruptive) in enumerate(zip(self.status,
+                                                       self.disruptive)):
+            start, end = offsets[row], offsets[row + 1]
+            writer.writerow((status, disruptive,
+                             " ".join(map(str, rule_ids[start:end])),
+                             " ".join(map(str, scores[start:end]))))
+
+    def write_binary(self, f):
+        """
+        Write the columns in the binary format.
+
+        :param f: binary file
+        """
+        f.write(_HEADER.pack(MAGIC, VERSION, len(self), len(self.rule_ids)))
+        for name, _ in _COLUMNS:
+            column = getattr(self, name)
+            if _SWAP:
+                column = array.array(column.typecode, column)
+                column.byteswap()
+            f.write(memoryview(column).cast("B"))
+
+    def flush(self, f, binary=True):
+        """
+        Write every row then clear them.
+
+        :param f: file opened in binary mode if ``binary``, in text mode
+            with ``newline=""`` otherwise
+        :param binary: binary format or CSV
+        """
+        if binary:
+            self.write_binary(f)
+        else:
+            self.write_csv(f)
+        self.clear()
+
+    @classmethod
+    def read_binary(cls, f):
+        """
+        Read columns written by :meth:`write_binary`.
+
+        :param f: binary file
+
+        :return: a :class:`VerdictBatch`
+        """
+        header = f.read(_HEADER.size)
+        if len(header) != _HEADER.size:
+            raise ValueError("Truncated verdicts header")
+        magic, version, rows, rules = _HEADER.unpack(header)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("Not a verdicts file")
+
+        batch = cls()
+        sizes = {"status": rows, "disruptive": rows, "offsets": rows + 1,
+                 "rule_ids": rules, "scores": rules}
+        for name, typecode in _COLUMNS:
+            column = array.array(typecode)
+            data = f.read(sizes[name] * column.itemsize)
+            if len(data) != sizes[name] * column.itemsize:
+                raise ValueError("Truncated verdicts column " + name)
+            column.frombytes(data)
+            if _SWAP:
+                column.byteswap()
+            setattr(batch, name, column)
+        return batch
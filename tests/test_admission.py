@@ -0,0 +1,97 @@
+# coding: utf-8
+"""
+Test AdmissionControl methods.
+"""
+
+import threading
+import unittest
+
+from pymodsecurity import admission
+from pymodsecurity import metrics
+
+
+class TestAdmissionControl(unittest.TestCase):
+    def test_limit(self):
+        control = admission.AdmissionControl(2)
+        self.assertTrue(control.acquire())
+        self.assertTrue(control.acquire())
+        self.assertEqual(control.saturation, 1)
+        self.assertFalse(control.acquire())
+
+        control.release()
+        self.assertTrue(control.acquire())
+        self.assertEqual((control.in_flight, control.admitted, control.shed),
+                         (2, 3, 1))
+
+    def test_queue(self):
+        control = admission.AdmissionControl(1, queue_size=1,
+                                             queue_timeout=5)
+        self.assertTrue(control.acquire())
+
+        waiting = threading.Event()
+        results = []
+
+        def _acquire():
+            waiting.set()
+            results.append(control.acquire())
+
+        thread = threading.Thread(target=_acquire)
+        thread.start()
+        waiting.wait()
+        while not control.waiting:
+            thread.join(0.001)
+        # The queue is full
+        self.assertFalse(control.acquire())
+
+        control.release()
+        thread.join()
+        self.assertEqual(results, [True])
+        self.assertGreater(control.queue_time, 0)
+
+    def test_queue_timeout(self):
+        control = admission.AdmissionControl(1, queue_size=1,
+                                             queue_timeout=0.01)
+        stats = metrics.enable(metrics.Registry())
+        try:
+            self.assertTrue(control.acquire())
+            self.assertFalse(control.acquire())
+        finally:
+            metrics.disable()
+
+        self.assertEqual(stats.admissions.labels("admitted").value, 1)
+        self.assertEqual(stats.admissions.labels("reject").value, 1)
+        self.assertEqual(sum(stats.admission_queue_time.counts), 2)
+
+    def test_detection_only(self):
+        control = admission.AdmissionControl(
+            1, policy=admission.DETECTION_ONLY)
+        self.assertTrue(control.acquire())
+        self.assertFalse(control.acquire())
+        self.assertEqual(control.detecting, 1)
+
+        control.release(admitted=False)
+        self.assertEqual((control.in_flight, control.detecting), (1, 0))
+
+    def test_gauges(self):
+        in_flight, waiting, detecting, limit = admission.totals()
+        control = admission.AdmissionControl(4)
+        self.assertTrue(control.acquire())
+        self.assertEqual(admission.totals(),
+                         (in_flight + 1, waiting, detecting, limit + 4))
+
+        registry = metrics.Registry()
+        metrics.enable(registry)
+        try:
+            text = registry.render()
+        finally:
+            metrics.disable()
+        self.assertIn("pymodsecurity_admission_in_flight " +
+                      str(in_flight + 1) + "\n", text)
+        self.assertIn("pymodsecurity_admission_waiting ", text)
+        self.assertIn("pymodsecurity_admission_saturation ", text)
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            admission.AdmissionControl(1, policy="spam")
+        with self.assertRaises(ValueError):
+            admission.AdmissionControl(0)
@@ -0,0 +1,146 @@
+# coding: utf-8
+"""
+Test rules bundle functions.
+"""
+
+import os
+import tempfile
+import unittest
+
+from pymodsecurity import bundle
+from pymodsecurity.exceptions import BundleError
+
+
+class TestBundle(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = self.directory.name
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write_file(self, filename, content):
+        filepath = os.path.join(self.path, filename)
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        with open(filepath, "w") as f:
+            f.write(content)
+        return filepath
+
+    def test_resolve(self):
+        main = self.write_file("main.conf",
+                               "# Comment\n"
+                               "SecRuleEngine On\n"
+                               "\n"
+                               "Include rules/*.conf\n"
+                               "IncludeOptional optional/*.conf\n"
+                               "SecUnicodeMapFile unicode.mapping 20127\n")
+        self.write_file("rules/1.conf",
+                        'SecRule REQUEST_HEADERS:User-Agent '
+                        '"@pmFromFile scanners.data" \\\n'
+                        '    "id:1,phase:1,deny"\n')
+        self.write_file("rules/2.conf",
+                        'SecRule REMOTE_ADDR "@ipMatchFromFile ips.data" '
+                        '"id:2,phase:1,deny"\n'
+                        'SecRule ARGS "@pmf phrases.data" '
+                        '"id:3,phase:2,deny"\n')
+        self.write_file("rules/scanners.data",
+                        "# Scanners\nnikto\n\nsqlmap\n")
+        self.write_file("rules/ips.data", "10.0.0.0/8\n192.168.1.1\n")
+        phrases = self.write_file("rules/phrases.data", "spam eggs\n")
+
+        self.assertEqual(
+            bundle.resolve(main),
+            "SecRuleEngine On\n"
+            'SecRule REQUEST_HEADERS:User-Agent "@pm nikto sqlmap" \\\n'
+            '    "id:1,phase:1,deny"\n'
+            'SecRule REMOTE_ADDR "@ipMatch 10.0.0.0/8,192.168.1.1" '
+            '"id:2,phase:1,deny"\n'
+            # Phrases with spaces cannot be inlined
+            'SecRule ARGS "@pmf ' + phrases + '" "id:3,phase:2,deny"\n'
+            "SecUnicodeMapFile " + os.path.join(self.path, "unicode.mapping")
+            + " 20127\n")
+
+    def test_resolve_external(self):
+        main = self.write_file(
+            "main.conf",
+            'SecRule ARGS "@pmFromFile a.data b.data" "id:1,phase:2,deny"\n'
+            'SecRule ARGS "@pmf phrases.data b.data" "id:2,phase:2,deny"\n'
+            'SecRule ARGS "@ipMatchF http://example.com/ips" '
+            '"id:3,phase:1,deny"\n'
+            'SecRule ARGS "@inspectFile scan.lua" "id:4,phase:2,deny"\n'
+            "SecGeoLookupDb geo.dat\n")
+        self.write_file("a.data", "nikto\n")
+        self.write_file("b.data", "sqlmap\n")
+        self.write_file("phrases.data", "Mozilla/5.0 (compatible; spam)\n")
+        path = os.path.join(self.path, "")
+
+        external = []
+        self.assertEqual(
+            bundle.resolve(main, external),
+            'SecRule ARGS "@pm nikto sqlmap" "id:1,phase:2,deny"\n'
+            'SecRule ARGS "@pmf ' + path + 'phrases.data ' + path +
+            'b.data" "id:2,phase:2,deny"\n'
+            'SecRule ARGS "@ipMatchF http://example.com/ips" '
+            '"id:3,phase:1,deny"\n'
+            'SecRule ARGS "@inspectFile ' + path + 'scan.lua" '
+            '"id:4,phase:2,deny"\n'
+            "SecGeoLookupDb " + path + "geo.dat\n")
+        self.assertEqual(external,
+                         [path + "phrases.data", path + "b.data",
+                          "http://example.com/ips", path + "scan.lua",
+                          path + "geo.dat"])
+
+        filepath = os.path.join(self.path, "rules.bundle")
+        with self.assertWarns(RuntimeWarning):
+            bundle.build(main, filepath, validate=False)
+        with self.assertRaises(BundleError):
+            bundle.build(main, filepath, validate=False, strict=True)
+
+    def test_resolve_errors(self):
+        main = self.write_file("main.conf", "Include missing.conf\n")
+        with self.assertRaises(BundleError):
+            bundle.resolve(main)
+
+        main = self.write_file("main.conf", "Include main.conf\n")
+        with self.assertRaises(BundleError):
+            bundle.resolve(main)
+
+        with self.assertRaises(BundleError):
+            bundle.resolve(os.path.join(self.path, "missing.conf"))
+
+    def test_write_read(self):
+        filepath = os.path.join(self.path, "rules.bundle")
+        plain_rules = 'SecRule ARGS "@rx é" "id:1,phase:2,deny"\n'
+        bundle.write(filepath, plain_rules, 1)
+
+        self.assertEqual(bundle.read(filepath),
+                         (1, plain_rules.encode("utf-8")))
+        self.assertEqual(os.listdir(self.path), ["rules.bundle"])
+
+    def test_read_errors(self):
+        filepath = self.write_file("empty.bundle", "")
+        with self.assertRaises(BundleError):
+            bundle.read(filepath)
+
+        filepath = self.write_file("main.conf", "SecRuleEngine On\n" * 10)
+        with self.assertRaises(BundleError):
+            bundle.read(filepath)
+
+        filepath = os.path.join(self.path, "rules.bundle")
+        bundle.write(filepath, "SecRuleEngine On\n")
+        with open(filepath, "r+b") as f:
+            f.seek(-4, os.SEEK_END)
+            f.write(b"spam")
+        with self.assertRaises(BundleError):
+            bundle.read(filepath)
+
+        with self.assertRaises(BundleError):
+            bundle.read(os.path.join(self.path, "missing.bundle"))
+
+    def test_build(self):
+        main = self.write_file("main.conf", "Include rules.conf\n")
+        self.write_file("rules.conf", "SecRuleEngine On\n")
+        filepath = os.path.join(self.path, "rules.bundle")
+
+        self.assertEqual(bundle.build(main, filepath, validate=False), 0)
+        self.assertEqual(bundle.read(filepath), (0, b"SecRuleEngine On\n"))
@@ -0,0 +1,71 @@
+# coding: utf-8
+"""
+Test Connection methods.
+"""
+
+import unittest
+
+from pymodsecurity import connection
+from pymodsecurity import transaction
+from pymodsecurity.modsecurity import ModSecurity
+from pymodsecurity.rules import Rules
+
+
+class TestConnection(unittest.TestCase):
+    def setUp(self):
+        rules = Rules()
+        rules.add_rules('SecRuleEngine On\n'
+                        'SecRule ARGS:attack "@streq 1" '
+                        '"id:300000,phase:1,deny,status:403"')
+        self.connection = connection.Connection(ModSecurity(), rules,
+                                                ("192.0.2.1", 54321),
+                                                ("192.0.2.2", 443))
+
+    def tearDown(self):
+        self.connection.close()
+
+    def test_new_transaction(self):
+        streams = [self.connection.new_transaction(return_interventions=True)
+                   for _ in range(3)]
+        self.assertEqual(self.connection.active, 3)
+
+        self.assertIsNone(streams[0].process_uri("/", "GET", "2.0"))
+        self.assertIsNone(streams[1].process_uri("/?attack=1", "GET", "2.0"))
+        self.assertIsNone(streams[0].process_request_headers())
+        intervention = streams[1].process_request_headers()
+        self.assertIsInstance(intervention, transaction.Intervention)
+        self.assertEqual(intervention.status, 403)
+
+        streams[0].close()
+        self.assertEqual(self.connection.active, 2)
+
+    def test_close(self):
+        with self.connection as conn:
+            stream = conn.new_transaction()
+        self.assertEqual(self.connection.active, 0)
+        self.assertTrue(stream.closed)
+        # Closing twice has no effect
+        self.connection.close()
+
+    def test_detach(self):
+        stream = self.connection.new_transaction()
+        self.connection.detach(stream)
+        self.assertEqual(self.connection.active, 0)
+        self.connection.close()
+        self.assertFalse(stream.closed)
+        stream.process_logging()
+        stream.close()
+
+    def test_connection_intervention(self):
+        rules = Rules()
+        rules.add_rules('SecRuleEngine On\n'
+                        'SecAction "id:300001,phase:0,deny,status:403"')
+        with connection.Connection(ModSecurity(), rules, ("192.0.2.1", 1),
+                                   ("192.0.2.2", 443)) as conn:
+            stream = conn.new_transaction(return_interventions=True)
+            other = conn.new_transaction()
+            # Kept by each stream
+            self.assertEqual(stream.get_intervention().status, 403)
+            self.assertEqual(other.get_intervention().status, 403)
+            self.assertIsNone(stream.process_uri("/", "GET", "2.0"))
+            self.assertIsNone(stream.get_intervention())
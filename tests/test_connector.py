@@ -0,0 +1,310 @@
+# coding: utf-8
+"""
+Test Connector methods.
+"""
+
+import io
+import time
+import unittest
+import unittest.mock
+import wsgiref.util
+
+from pymodsecurity import connector
+from pymodsecurity import metrics
+from pymodsecurity import utils
+from pymodsecurity.admission import AdmissionControl, BYPASS, DETECTION_ONLY
+from pymodsecurity.exclusions import URIExclusions
+from pymodsecurity.latency import LatencyBudget
+from pymodsecurity.memory import MemoryAccounting
+from pymodsecurity.modsecurity import ModSecurity
+from pymodsecurity.prefilter import IPPrefilter
+from pymodsecurity.response_policy import ResponseBodyPolicy
+from pymodsecurity.rules import Rules
+from pymodsecurity.spool import RequestBodySpooler
+from pymodsecurity.transaction import Transaction
+
+
+RULES = '''
+SecRuleEngine On
+SecRequestBodyAccess On
+SecResponseBodyAccess On
+SecResponseBodyMimeType text/plain
+SecRule ARGS:attack "@streq 1" "id:300000,phase:1,deny,status:403"
+SecRule REQUEST_BODY "@contains attack" "id:300001,phase:2,deny,status:406"
+SecRule RESPONSE_BODY "@contains secret" "id:300002,phase:4,deny,status:500"
+'''
+
+
+def application(environ, start_response):
+    body = environ["wsgi.input"].read() or b"Hello"
+    start_response("200 OK", [("Content-Type", "text/plain")])
+    return [body]
+
+
+class TestConnector(unittest.TestCase):
+    def setUp(self):
+        rules = Rules()
+        rules.add_rules(RULES)
+        self.application = unittest.mock.Mock(wraps=application)
+        self.connector = connector.Connector(self.application,
+                                             ModSecurity(), rules)
+
+    def request(self, path="/", body=b"", remote_addr="127.0.0.1"):
+        environ = {}
+        wsgiref.util.setup_testing_defaults(environ)
+        path, _, query = path.partition("?")
+        environ.update({"PATH_INFO": path,
+                        "QUERY_STRING": query,
+                        "REMOTE_ADDR": remote_addr,
+                        "CONTENT_TYPE": "text/plain",
+                        "CONTENT_LENGTH": str(len(body)),
+                        "wsgi.input": io.BytesIO(body)})
+        start_response = unittest.mock.Mock()
+        result = self.connector(environ, start_response)
+        try:
+            response = b"".join(result)
+        finally:
+            # As a WSGI server does
+            if hasattr(result, "close"):
+                result.close()
+        status = start_response.call_args[0][0]
+        return int(status.split()[0]), response
+
+    def test_request_uri(self):
+        environ = {"SCRIPT_NAME": "/app", "PATH_INFO": "/é",
+                   "QUERY_STRING": "a=1"}
+        self.assertEqual(connector._request_uri(environ), "/app/%E9?a=1")
+        self.assertEqual(connector._request_uri({"RAW_URI": "/raw?a"}),
+                         "/raw?a")
+
+    def test_request_headers(self):
+        environ = {"HTTP_USER_AGENT": "spam", "CONTENT_TYPE": "text/plain",
+                   "CONTENT_LENGTH": "", "wsgi.version": (1, 0)}
+        self.assertEqual(sorted(connector._request_headers(environ)),
+                         [("Content-Type", "text/plain"),
+                          ("User-Agent", "spam")])
+
+    def test_pass(self):
+        self.assertEqual(self.request("/?id=1"), (200, b"Hello"))
+        self.assertEqual(self.request("/", b"This is a body"),
+                         (200, b"This is a body"))
+
+    def test_request_intervention(self):
+        self.assertEqual(self.request("/?attack=1"),
+                         (403, b"403 Forbidden\n"))
+        self.assertEqual(self.request("/", b"attack")[0], 406)
+        self.application.assert_not_called()
+
+    def test_response_intervention(self):
+        self.assertEqual(self.request("/", b"secret")[0], 500)
+
+    def test_spooled_body(self):
+        self.connector.spooler = RequestBodySpooler(threshold=4)
+        self.assertEqual(self.request("/", b"This is a body"),
+                         (200, b"This is a body"))
+        self.assertEqual(self.request("/", b"This is an attack")[0], 406)
+        self.assertEqual(self.connector.spooler.spooled, 2)
+
+    def test_response_policy(self):
+        policy = ResponseBodyPolicy({"text/plain": 6})
+        self.connector.response_policy = policy
+        # Within the budget
+        self.assertEqual(self.request("/", b"secret")[0], 500)
+        # Past the budget
+        self.assertEqual(self.request("/", b"The secret"),
+                         (200, b"The secret"))
+        self.assertEqual(policy.truncated, {"text/plain": 4})
+        self.assertEqual(policy.truncated_responses, 1)
+
+    def test_streamed_body(self):
+        def streaming(environ, start_response):
+            start_response("200 OK", [("Content-Type", "text/plain")])
+            yield b"Hello "
+            # Read once the inspected prefix is sent
+            yield environ["wsgi.input"].read()
+
+        self.connector.application = streaming
+        self.connector.spooler = RequestBodySpooler(threshold=4)
+        self.connector.response_policy = ResponseBodyPolicy(
+            {"text/plain": 4})
+        live = utils.live_handles()["Transaction"]
+        self.assertEqual(self.request("/", b"This is a secret"),
+                         (200, b"Hello This is a secret"))
+        self.assertEqual(utils.live_handles()["Transaction"], live)
+
+    def test_write(self):
+        def writing(environ, start_response):
+            write = start_response("200 OK", [("Content-Type", "text/plain")])
+            write(b"The ")
+            write(b"secret")
+            return []
+
+        policy = ResponseBodyPolicy({"text/plain": 6})
+        self.connector.application = writing
+        self.connector.response_policy = policy
+        self.assertEqual(self.request("/"), (200, b"The secret"))
+        self.assertEqual(policy.truncated, {"text/plain": 4})
+
+        self.connector.response_policy = None
+        self.assertEqual(self.request("/")[0], 500)
+
+    def test_memory_accounting(self):
+        accounting = MemoryAccounting()
+        self.addCleanup(accounting.close)
+        self.connector.memory_accounting = accounting
+        self.request("/items/1", b"This is a body")
+        self.request("/items/2?attack=1")
+
+        usage, = accounting.report()
+        self.assertEqual(usage.pattern, "/items/{n}")
+        self.assertEqual(usage.count, 2)
+        self.assertIn("request_body", usage.phases)
+        self.assertIn("cleanup", usage.phases)
+
+    def slow_request_body(self):
+        process_request_body = Transaction.process_request_body
+
+        def _slow(transaction):
+            time.sleep(0.2)
+            return process_request_body(transaction)
+
+        return unittest.mock.patch.object(Transaction, "process_request_body",
+                                          _slow)
+
+    def test_latency_budget(self):
+        live = utils.live_handles()["Transaction"]
+        budget = LatencyBudget(0.05)
+        self.connector.latency_budget = budget
+        self.assertEqual(self.request("/", b"attack")[0], 406)
+
+        with self.slow_request_body():
+            # Fails open
+            self.assertEqual(self.request("/", b"attack"), (200, b"attack"))
+            budget.fail_open = False
+            self.assertEqual(self.request("/", b"Hello")[0], 503)
+            budget.close()
+
+        self.assertEqual([(event.uri, event.phase)
+                          for event in budget.events],
+                         [("/", "request_body")] * 2)
+        # Finished on the workers
+        self.assertEqual(utils.live_handles()["Transaction"], live)
+
+    def test_latency_budget_streamed(self):
+        def streaming(environ, start_response):
+            start_response("200 OK", [("Content-Type", "text/plain")])
+            yield b"Hello "
+            # Read while the body is iterated
+            yield environ["wsgi.input"].read()
+
+        budget = LatencyBudget(0.05)
+        self.addCleanup(budget.close)
+        self.connector.application = streaming
+        self.connector.latency_budget = budget
+        self.connector.spooler = RequestBodySpooler(threshold=4)
+        with self.slow_request_body():
+            self.assertEqual(self.request("/", b"This is a body"),
+                             (200, b"Hello This is a body"))
+
+    def test_admission(self):
+        self.connector.admission = AdmissionControl(1)
+        self.assertEqual(self.request("/?attack=1")[0], 403)
+        self.assertEqual(self.connector.admission.in_flight, 0)
+
+        # Saturated
+        self.connector.admission.acquire()
+        self.assertEqual(self.request("/")[0], 503)
+        self.connector.admission.policy = BYPASS
+        self.assertEqual(self.request("/?attack=1"), (200, b"Hello"))
+        self.connector.admission.policy = DETECTION_ONLY
+        self.assertEqual(self.request("/", b"attack"), (200, b"attack"))
+        self.assertEqual(self.connector.admission.shed, 3)
+        self.assertEqual(self.connector.admission.detecting, 0)
+
+    def test_admission_application(self):
+        admission = self.connector.admission = AdmissionControl(1)
+
+        def slow(environ, start_response):
+            # The slot is given back while the application runs
+            self.assertTrue(admission.acquire())
+            admission.release()
+            return application(environ, start_response)
+
+        self.connector.application = slow
+        self.assertEqual(self.request("/", b"Hello"), (200, b"Hello"))
+        self.assertEqual(self.request("/", b"secret")[0], 500)
+        self.assertEqual(admission.in_flight, 0)
+
+        # Saturated once the application returns
+        def saturating(environ, start_response):
+            admission.acquire()
+            return application(environ, start_response)
+
+        self.connector.application = saturating
+        self.assertEqual(self.request("/", b"secret")[0], 503)
+        admission.release()
+        admission.policy = BYPASS
+        self.assertEqual(self.request("/", b"secret"), (200, b"secret"))
+        self.assertEqual(admission.in_flight, 1)
+
+    def test_admission_over_budget(self):
+        admission = self.connector.admission = AdmissionControl(1)
+        budget = self.connector.latency_budget = LatencyBudget(0.05)
+        with self.slow_request_body():
+            self.assertEqual(self.request("/", b"Hello"), (200, b"Hello"))
+            # Held by the phase still running on its worker
+            self.assertEqual(admission.in_flight, 1)
+            budget.close()
+        self.assertEqual(admission.in_flight, 0)
+
+    def test_prefilter(self):
+        self.connector.prefilter = IPPrefilter(allow=["10.0.0.0/8"],
+                                               deny=["192.168.0.0/16"])
+        with unittest.mock.patch("pymodsecurity.connector.Transaction") \
+                as transaction:
+            self.assertEqual(self.request("/?attack=1",
+                                          remote_addr="10.0.0.1"),
+                             (200, b"Hello"))
+            self.assertEqual(self.request("/", remote_addr="192.168.0.1")[0],
+                             403)
+            transaction.assert_not_called()
+
+        self.assertEqual(self.request("/?attack=1",
+                                      remote_addr="172.16.0.1")[0], 403)
+
+    def test_exclusions(self):
+        self.connector.exclusions = URIExclusions(prefixes=["/static/"])
+        with unittest.mock.patch("pymodsecurity.connector.Transaction") \
+                as transaction:
+            self.assertEqual(self.request("/static/?attack=1"),
+                             (200, b"Hello"))
+            transaction.assert_not_called()
+
+        self.assertEqual(self.request("/static/../?attack=1")[0], 403)
+        self.assertEqual((self.connector.exclusions.hits,
+                          self.connector.exclusions.misses), (1, 1))
+
+    def test_metrics(self):
+        stats = metrics.enable(metrics.Registry())
+        try:
+            self.request("/", b"This is a body")
+            self.request("/?attack=1")
+        finally:
+            metrics.disable()
+
+        self.assertEqual(sum(stats.phase_latencies["uri"].counts), 2)
+        self.assertEqual(sum(stats.phase_latencies["response_body"].counts),
+                         1)
+        self.assertEqual(stats.interventions.labels(403).value, 1)
+        self.assertEqual(stats.request_body_bytes.value, 14)
+        self.assertEqual(stats.response_body_bytes.value, 14)
+
+    def test_scheduler(self):
+        accounting = MemoryAccounting(trace_python=False)
+        self.connector.memory_accounting = accounting
+        self.connector.scheduler = unittest.mock.Mock()
+        self.request("/")
+        self.connector.scheduler.schedule.assert_called_once_with(
+            unittest.mock.ANY)
+        # Released later by the scheduler
+        self.assertNotIn("cleanup", accounting.report()[0].phases)
@@ -0,0 +1,79 @@
+# coding: utf-8
+"""
+Test URIExclusions methods.
+"""
+
+import os
+import tempfile
+import unittest
+
+from pymodsecurity import exclusions
+
+
+CONFIG = """
+# Static assets
+ExcludePrefix /static/ /media/
+excludeextension .woff2 .TAR.GZ
+ExcludePath /healthz
+"""
+
+
+class TestURIExclusions(unittest.TestCase):
+    def setUp(self):
+        self.exclusions = exclusions.URIExclusions()
+        self.exclusions.load(CONFIG)
+
+    def test_excluded(self):
+        excluded = self.exclusions.excluded
+        self.assertTrue(excluded("/static/app.js"))
+        self.assertTrue(excluded("/media/"))
+        self.assertTrue(excluded("/fonts/font.woff2?v=2"))
+        self.assertTrue(excluded("/fonts/FONT.WOFF2"))
+        self.assertTrue(excluded("/archive.tar.gz"))
+        self.assertTrue(excluded("/healthz"))
+        self.assertEqual((self.exclusions.hits, self.exclusions.misses),
+                         (6, 0))
+
+        self.assertFalse(excluded("/static"))
+        self.assertFalse(excluded("/healthz/admin"))
+        self.assertFalse(excluded("/index.php?file=font.woff2"))
+        self.assertFalse(excluded("/archive.gz"))
+        self.assertFalse(excluded("/woff2"))
+        self.assertFalse(excluded(""))
+        self.assertEqual(self.exclusions.misses, 6)
+
+    def test_unsafe(self):
+        excluded = self.exclusions.excluded
+        self.assertFalse(excluded("/static/../admin.php"))
+        self.assertFalse(excluded("/static/%2e%2e/admin.php"))
+        self.assertFalse(excluded("/static//admin.php"))
+        self.assertFalse(excluded("/static/..\\admin.php"))
+        self.assertFalse(excluded("/admin.php;.woff2"))
+
+    def test_load_errors(self):
+        with self.assertRaises(ValueError):
+            self.exclusions.load("ExcludePrefix")
+        with self.assertRaises(ValueError) as ctx:
+            self.exclusions.load("\nSecRuleEngine Off", "exclusions.conf")
+        self.assertIn("exclusions.conf:2", str(ctx.exception))
+
+        # Exclusions are kept on error
+        self.assertTrue(self.exclusions.excluded("/static/app.js"))
+
+    def test_from_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            filepath = os.path.join(directory, "exclusions.conf")
+            with open(filepath, "w") as f:
+                f.write(CONFIG)
+
+            uri_exclusions = exclusions.URIExclusions.from_file(filepath)
+            self.assertTrue(uri_exclusions.excluded("/healthz"))
+
+    def test_constructor(self):
+        uri_exclusions = exclusions.URIExclusions(prefixes=["/a/"],
+                                                  extensions=[".css"],
+                                                  paths=["/b"])
+        self.assertTrue(uri_exclusions.excluded("/a/b"))
+        self.assertTrue(uri_exclusions.excluded("/c.css"))
+        self.assertTrue(uri_exclusions.excluded("/b"))
+        self.assertFalse(uri_exclusions.excluded("/c"))
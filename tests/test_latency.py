@@ -0,0 +1,78 @@
+# coding: utf-8
+"""
+Test LatencyBudget methods.
+"""
+
+import threading
+import unittest
+
+from pymodsecurity import latency
+from pymodsecurity import metrics
+from pymodsecurity.exceptions import LatencyBudgetExceeded
+
+
+class TestLatencyBudget(unittest.TestCase):
+    def setUp(self):
+        self.budget = latency.LatencyBudget(0.05, workers=1)
+
+    def tearDown(self):
+        self.budget.close()
+
+    def test_run(self):
+        timer = self.budget.start("/")
+        self.assertEqual(self.budget.run(timer, "request_body", max, 1, 2),
+                         2)
+        self.assertEqual(self.budget.exceeded, 0)
+
+        with self.assertRaises(ZeroDivisionError):
+            self.budget.run(timer, "request_body", divmod, 1, 0)
+
+    def test_exceeded(self):
+        release = threading.Event()
+        stats = metrics.enable(metrics.Registry())
+        try:
+            timer = self.budget.start("/slow")
+            with self.assertRaises(LatencyBudgetExceeded) as ctx:
+                self.budget.run(timer, "request_body", release.wait)
+            pending = ctx.exception.pending
+            self.assertFalse(pending.done())
+
+            # Queued behind the slow phase, then cancelled
+            timer = self.budget.start("/queued")
+            with self.assertRaises(LatencyBudgetExceeded) as ctx:
+                self.budget.run(timer, "response_body", max, 1, 2)
+            self.assertIsNone(ctx.exception.pending)
+        finally:
+            metrics.disable()
+
+        release.set()
+        self.assertTrue(pending.result())
+
+        self.assertEqual(self.budget.exceeded, 2)
+        self.assertEqual([(event.uri, event.phase)
+                          for event in self.budget.events],
+                         [("/slow", "request_body"),
+                          ("/queued", "response_body")])
+        self.assertGreaterEqual(self.budget.events[0].elapsed, 0.05)
+        self.assertEqual(stats.over_budget.labels("request_body").value, 1)
+
+    def test_failed(self):
+        release = threading.Event()
+
+        def _fail():
+            release.wait()
+            raise ZeroDivisionError
+
+        timer = self.budget.start("/")
+        with self.assertRaises(LatencyBudgetExceeded) as ctx:
+            self.budget.run(timer, "request_body", _fail)
+        release.set()
+        with self.assertRaises(ZeroDivisionError):
+            ctx.exception.pending.result()
+        self.budget.close()
+        self.assertEqual(self.budget.failed, 1)
+
+    def test_timer(self):
+        timer = latency.LatencyTimer("/", 10)
+        self.assertGreater(timer.remaining(), 9)
+        self.assertLess(latency.LatencyTimer("/", 0).remaining(), 0)
@@ -0,0 +1,50 @@
+# coding: utf-8
+"""
+Test LogMessage parsing.
+"""
+
+import unittest
+
+from pymodsecurity.logmessage import LogMessage
+
+MESSAGE = (
+    '[client 192.0.2.1] ModSecurity: Warning. Matched "Operator `Rx\' with '
+    'parameter `union\' against variable `ARGS:q\' (Value: `1 union\' )" '
+    '[file "rules.conf"] [line "45"] [id "942100"] [rev ""] '
+    '[msg "SQL Injection Attack"] [data "Matched Data: \\"1U\\" in ARGS:q"] '
+    '[severity "2"] [tag "application-multi"] [tag "attack-sqli"] '
+    '[hostname "example.com"] [uri "/search"] '
+    '[unique_id "161480000066.953143"] [ref "v48,35"]')
+
+
+class TestLogMessage(unittest.TestCase):
+    def test_fields(self):
+        record = LogMessage(MESSAGE)
+        self.assertEqual(record.message, MESSAGE)
+        self.assertEqual(record.id, "942100")
+        self.assertEqual(record.msg, "SQL Injection Attack")
+        self.assertEqual(record.severity, "2")
+        self.assertEqual(record.tags, ("application-multi", "attack-sqli"))
+        self.assertEqual(record.data, 'Matched Data: \\"1U\\" in ARGS:q')
+        self.assertEqual(record.uri, "/search")
+        self.assertEqual(record.unique_id, "161480000066.953143")
+
+        # Values are extracted once
+        self.assertIs(record.id, record.id)
+
+    def test_missing_fields(self):
+        record = LogMessage("ModSecurity: Access denied with code 403")
+        self.assertIsNone(record.id)
+        self.assertIsNone(record.msg)
+        self.assertIsNone(record.uri)
+        self.assertEqual(record.tags, ())
+
+    def test_truncated(self):
+        record = LogMessage('[id "942100"] [tag "attack-sqli"] [msg "SQL')
+        self.assertEqual(record.id, "942100")
+        self.assertEqual(record.tags, ("attack-sqli",))
+        self.assertIsNone(record.msg)
+
+    def test_slots(self):
+        with self.assertRaises(AttributeError):
+            LogMessage(MESSAGE).spam = 1
@@ -0,0 +1,121 @@
+# coding: utf-8
+"""
+Test AggregatingLogSink methods.
+"""
+
+import unittest
+import unittest.mock
+
+from pymodsecurity import logsink
+
+
+def _message(rule_id, uri="/", unique_id="1"):
+    return ('[client 192.0.2.1] ModSecurity: Warning. Matched "Operator '
+            '`Rx\' with parameter `attack\'" [file "rules.conf"] '
+            '[line "1"] [id "{}"] [msg "Attack"] [hostname "example.com"] '
+            '[uri "{}"] [unique_id "{}"]').format(rule_id, uri, unique_id)
+
+
+class TestAggregatingLogSink(unittest.TestCase):
+    def setUp(self):
+        self.now = 100.0
+        self.cpu = 10.0
+        patcher = unittest.mock.patch("pymodsecurity.logsink.time.perf_counter",
+                                      lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = unittest.mock.patch("pymodsecurity.logsink.time.thread_time",
+                                      lambda: self.cpu)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.callback = unittest.mock.Mock()
+
+    def sink(self, **kwargs):
+        kwargs.setdefault("summary_interval", None)
+        kwargs.setdefault("cpu_budget", None)
+        return logsink.AggregatingLogSink(self.callback, **kwargs)
+
+    def forwarded(self):
+        return [message for _, message in
+                (call[0] for call in self.callback.call_args_list)]
+
+    def test_duplicates(self):
+        sink = self.sink(window=1.0)
+        sink("data", _message(1, "/a", "1"))
+        sink("data", _message(1, "/b", "2"))
+        sink("data", _message(2, "/b", "2"))
+        self.assertEqual(self.forwarded(), [_message(1, "/a", "1"),
+                                            _message(2, "/b", "2")])
+        self.callback.assert_any_call("data", _message(1, "/a", "1"))
+        self.assertEqual(sink.duplicates, 1)
+        self.assertEqual(sink.rule_counts, {"1": 2, "2": 1})
+
+        # Identical messages are forwarded again in the next window
+        self.now += 1.0
+        sink("data", _message(1, "/c", "3"))
+        self.assertEqual(sink.forwarded, 3)
+
+    def test_rate_limit(self):
+        sink = self.sink(rate=2, burst=3)
+        for rule_id in range(5):
+            sink(None, _message(rule_id))
+        self.assertEqual(sink.forwarded, 3)
+        self.assertEqual(sink.rate_limited, 2)
+
+        self.now += 0.5
+        sink(None, _message(10))
+        sink(None, _message(11))
+        self.assertEqual(sink.forwarded, 4)
+        self.assertEqual(sink.rate_limited, 3)
+
+    def test_summary(self):
+        sink = self.sink(summary_interval=60, top_rules=1)
+        sink(None, _message(1))
+        sink(None, _message(1, unique_id="2"))
+        sink(None, _message(2))
+        self.now += 60
+        sink(None, "ModSecurity: no rule")
+
+        self.assertEqual(self.forwarded()[-2:], [
+            "pymodsecurity: 3 log messages, 2 forwarded, 1 duplicates, "
+            "0 rate limited, 0 shed; rules: 1=2",
+            "ModSecurity: no rule"])
+        self.assertEqual(sink.received, 1)
+        self.assertEqual(sink.rule_counts, {"-": 1})
+
+        sink.flush()
+        self.assertEqual(self.forwarded()[-1],
+                         "pymodsecurity: 1 log messages, 1 forwarded, "
+                         "0 duplicates, 0 rate limited, 0 shed; rules: -=1")
+        calls = self.callback.call_count
+        sink.flush()
+        self.assertEqual(self.callback.call_count, calls)
+
+    def test_cpu_budget(self):
+        def _slow_callback(data, message):
+            self.cpu += 0.03
+
+        self.callback.side_effect = _slow_callback
+        sink = self.sink(cpu_budget=0.05)
+        for rule_id in range(4):
+            sink(None, _message(rule_id))
+        self.assertEqual(sink.forwarded, 2)
+        self.assertEqual(sink.shed, 2)
+        # Shed messages are counted too
+        self.assertEqual(sink.rule_counts, {"0": 1, "1": 1, "2": 1, "3": 1})
+
+        # The budget is renewed every second
+        self.now += 1
+        sink(None, _message(5))
+        self.assertEqual(sink.forwarded, 3)
+
+    def test_cpu_budget_blocking(self):
+        def _blocking_callback(data, message):
+            self.now += 0.03
+
+        # Waiting, on a lock or a socket, spends no CPU time
+        self.callback.side_effect = _blocking_callback
+        sink = self.sink(cpu_budget=0.05)
+        for rule_id in range(4):
+            sink(None, _message(rule_id))
+        self.assertEqual((sink.forwarded, sink.shed), (4, 0))
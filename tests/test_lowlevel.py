@@ -0,0 +1,101 @@
+# coding: utf-8
+"""
+Test the lowlevel functions.
+"""
+
+import inspect
+import unittest
+
+from pymodsecurity import lowlevel
+from pymodsecurity import transaction as transaction_module
+from pymodsecurity.exceptions import ClosedError
+from pymodsecurity.modsecurity import ModSecurity
+from pymodsecurity.rules import Rules
+from pymodsecurity.transaction import Transaction
+
+
+# Aliases mapped to the C functions Transaction calls.
+ALIASES = {
+    "new_transaction": "msc_new_transaction",
+    "transaction_cleanup": "msc_transaction_cleanup",
+    "process_connection": "msc_process_connection",
+    "process_uri": "msc_process_uri",
+    "add_request_header": "msc_add_request_header",
+    "process_request_headers": "msc_process_request_headers",
+    "append_request_body": "msc_append_request_body",
+    "request_body_from_file": "msc_request_body_from_file",
+    "process_request_body": "msc_process_request_body",
+    "add_response_header": "msc_add_response_header",
+    "process_response_headers": "msc_process_response_headers",
+    "append_response_body": "msc_append_response_body",
+    "process_response_body": "msc_process_response_body",
+    "process_logging": "msc_process_logging",
+    "process_connection_checked": "pymsc_process_connection",
+    "process_uri_checked": "pymsc_process_uri",
+    "process_request_headers_checked": "pymsc_process_request_headers",
+    "process_request_body_checked": "pymsc_process_request_body",
+    "process_response_headers_checked": "pymsc_process_response_headers",
+    "process_response_body_checked": "pymsc_process_response_body",
+    "intervention": "msc_intervention",
+    "intervention_cleanup": "pymsc_intervention_cleanup",
+    "get_matched_rules_info": "msc_get_matched_rules_info",
+}
+
+
+class TestLowLevel(unittest.TestCase):
+    def setUp(self):
+        self.modsecurity = ModSecurity()
+        self.rules = Rules()
+        self.rules.add_rules('SecRuleEngine On\n'
+                             'SecRule ARGS:attack "@streq 1" '
+                             '"id:300000,phase:1,deny,status:403"')
+        self.transaction = lowlevel.new_transaction(
+            lowlevel.handle(self.modsecurity), lowlevel.handle(self.rules),
+            lowlevel.NULL)
+
+    def tearDown(self):
+        lowlevel.transaction_cleanup(self.transaction)
+
+    def test_phases(self):
+        self.assertEqual(lowlevel.process_connection(
+            self.transaction, b"127.0.0.1", 12345, b"127.0.0.1", 80), 1)
+        self.assertEqual(lowlevel.process_uri(
+            self.transaction, b"/?attack=1", b"GET", b"1.1"), 1)
+        self.assertEqual(lowlevel.add_request_header(
+            self.transaction, b"Host", b"localhost"), 1)
+        self.assertEqual(lowlevel.process_request_headers(self.transaction),
+                         1)
+
+        it = lowlevel.new_intervention()
+        self.assertEqual(lowlevel.intervention(self.transaction, it), 1)
+        self.assertEqual(it.status, 403)
+        lowlevel.intervention_cleanup(it)
+        self.assertEqual(lowlevel.process_logging(self.transaction), 1)
+
+    def test_checked_phases(self):
+        it = lowlevel.new_intervention()
+        self.assertEqual(lowlevel.process_uri_checked(
+            self.transaction, b"/?attack=0", b"GET", b"1.1", it), 0)
+        self.assertEqual(lowlevel.process_request_headers_checked(
+            self.transaction, it), 0)
+
+    def test_aliases(self):
+        source = inspect.getsource(transaction_module)
+        for alias, name in ALIASES.items():
+            with self.subTest(alias=alias):
+                self.assertIs(getattr(lowlevel, alias),
+                              getattr(transaction_module._lib, name))
+                self.assertRegex(source, r"_lib\." + name + r"\b")
+
+    def test_handle(self):
+        transaction = Transaction(self.modsecurity, self.rules)
+        self.assertIs(lowlevel.handle(transaction), transaction.handle)
+        self.assertIs(lowlevel.handle(self.rules), self.rules.handle)
+        self.assertIs(lowlevel.handle(self.modsecurity),
+                      self.modsecurity.handle)
+        with self.assertRaises(TypeError):
+            lowlevel.handle(object())
+
+        transaction.close()
+        with self.assertRaises(ClosedError):
+            lowlevel.handle(transaction)
@@ -0,0 +1,68 @@
+# coding: utf-8
+"""
+Test MemoryAccounting methods.
+"""
+
+import tracemalloc
+import unittest
+
+from pymodsecurity import memory
+
+
+class TestMemoryAccounting(unittest.TestCase):
+    def setUp(self):
+        self.accounting = memory.MemoryAccounting(max_patterns=2)
+        self.addCleanup(self.accounting.close)
+
+    def test_uri_pattern(self):
+        self.assertEqual(memory.uri_pattern("/users/42/orders/7?page=2"),
+                         "/users/{n}/orders/{n}")
+        self.assertEqual(
+            memory.uri_pattern("/files/0123456789ABCDEF0123/raw"),
+            "/files/{id}/raw")
+        self.assertEqual(
+            memory.uri_pattern("/s/123e4567-e89b-12d3-a456-426614174000"),
+            "/s/{id}")
+        self.assertEqual(memory.uri_pattern("/v2/api"), "/v2/api")
+
+    def test_usage(self):
+        self.assertTrue(tracemalloc.is_tracing())
+        usage = self.accounting.start("/upload/1")
+        usage.record("creation")
+        kept = [bytearray(1024 * 1024)]
+        usage.record("request_body")
+        del kept[:]
+        self.accounting.finish(usage)
+
+        self.assertEqual(list(usage.phases),
+                         ["creation", "request_body", "cleanup"])
+        self.assertGreater(usage.phases["request_body"][1], 1024 * 1024 - 1)
+        self.assertGreater(usage.python_peak, 1024 * 1024 - 1)
+        self.assertLess(usage.python, usage.python_peak)
+
+        report = self.accounting.report()
+        self.assertEqual(len(report), 1)
+        self.assertEqual(report[0].pattern, "/upload/{n}")
+        self.assertEqual(report[0].count, 1)
+        self.assertEqual(report[0].python_peak, usage.python_peak)
+
+    def test_without_cleanup(self):
+        usage = self.accounting.start("/")
+        usage.record("creation")
+        self.accounting.finish(usage, cleanup=False)
+        self.assertEqual(list(usage.phases), ["creation"])
+        self.assertEqual(self.accounting.report()[0].count, 1)
+
+    def test_max_patterns(self):
+        for uri in ("/a", "/b", "/c", "/d", "/a"):
+            self.accounting.finish(self.accounting.start(uri))
+        self.assertEqual(sorted((usage.pattern, usage.count)
+                                for usage in self.accounting.report()),
+                         [("/a", 2), ("/b", 1), ("other", 2)])
+
+        self.accounting.clear()
+        self.assertEqual(self.accounting.report(), [])
+
+    def test_close(self):
+        self.accounting.close()
+        self.assertFalse(tracemalloc.is_tracing())
@@ -0,0 +1,122 @@
+# coding: utf-8
+"""
+Test metrics classes and functions.
+"""
+
+import timeit
+import unittest
+import urllib.request
+
+from pymodsecurity import metrics
+from pymodsecurity import utils
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        self.registry = metrics.Registry()
+
+    def tearDown(self):
+        metrics.disable()
+
+    def test_counter(self):
+        counter = self.registry.register(
+            metrics.Counter("requests_total", "Requests."))
+        counter.inc()
+        counter.inc(2)
+        self.assertEqual(self.registry.render(),
+                         "# HELP requests_total Requests.\n"
+                         "# TYPE requests_total counter\n"
+                         "requests_total 3\n")
+
+        with self.assertRaises(ValueError):
+            self.registry.register(metrics.Counter("requests_total", ""))
+
+    def test_labels(self):
+        counter = self.registry.register(
+            metrics.Counter("interventions_total", "Interventions.",
+                            ("status",)))
+        counter.labels(403).inc()
+        counter.labels("403").inc()
+        counter.labels('a"\\\n').inc()
+        self.assertIs(counter.labels(403), counter.labels("403"))
+        self.assertEqual(self.registry.render(),
+                         "# HELP interventions_total Interventions.\n"
+                         "# TYPE interventions_total counter\n"
+                         'interventions_total{status="403"} 2\n'
+                         'interventions_total{status="a\\"\\\\\\n"} 1\n')
+
+        with self.assertRaises(ValueError):
+            counter.labels(403, "spam")
+
+    def test_histogram(self):
+        histogram = self.registry.register(
+            metrics.Histogram("latency_seconds", "Latency.", ("phase",),
+                              buckets=(0.1, 1)))
+        child = histogram.labels("uri")
+        child.observe(0.05)
+        child.observe(0.1)
+        child.observe(0.5)
+        child.observe(2)
+        self.assertEqual(self.registry.render(),
+                         "# HELP latency_seconds Latency.\n"
+                         "# TYPE latency_seconds histogram\n"
+                         'latency_seconds_bucket{phase="uri",le="0.1"} 2\n'
+                         'latency_seconds_bucket{phase="uri",le="1.0"} 3\n'
+                         'latency_seconds_bucket{phase="uri",le="+Inf"} 4\n'
+                         'latency_seconds_sum{phase="uri"} 2.65\n'
+                         'latency_seconds_count{phase="uri"} 4\n')
+
+    def test_callback_metric(self):
+        self.registry.register(
+            metrics.CallbackMetric("handles", "Handles.",
+                                   lambda: {("Rules",): 2}, ("type",)))
+        self.assertEqual(self.registry.render(),
+                         "# HELP handles Handles.\n"
+                         "# TYPE handles gauge\n"
+                         'handles{type="Rules"} 2\n')
+        with self.assertRaises(TypeError):
+            self.registry.callback("live", "Live.", dict, ("type",)).labels(
+                "Rules")
+
+    def test_recording_overhead(self):
+        counter = metrics.Counter("requests_total", "Requests.")
+        histogram = metrics.Histogram("latency_seconds", "Latency.")
+        number = 100000
+        for record in (counter.inc, lambda: histogram.observe(0.0003)):
+            duration = min(timeit.repeat(record, number=number, repeat=5))
+            # Generous bound to keep the test reliable on slow machines.
+            self.assertLess(duration / number, 1e-6)
+
+    def test_enable(self):
+        stats = metrics.enable(self.registry)
+        self.assertIs(metrics.enable(self.registry), stats)
+        self.assertIs(metrics.library, stats)
+
+        stats.rule_load_errors.inc()
+        rendered = self.registry.render()
+        self.assertIn("pymodsecurity_rule_load_errors_total 1\n", rendered)
+        live = utils.live_handles()["Rules"]
+        self.assertIn('pymodsecurity_live_handles{type="Rules"} ' +
+                      str(live) + "\n", rendered)
+
+        metrics.disable()
+        self.assertIsNone(metrics.library)
+        self.assertEqual(self.registry.render(), "")
+
+    def test_serve(self):
+        counter = self.registry.register(
+            metrics.Counter("requests_total", "Requests."))
+        counter.inc()
+        server = metrics.serve(0, registry=self.registry)
+        try:
+            url = "http://127.0.0.1:" + str(server.server_port)
+            with urllib.request.urlopen(url + "/metrics") as response:
+                self.assertEqual(response.headers["Content-Type"],
+                                 metrics.CONTENT_TYPE)
+                self.assertIn(b"requests_total 1\n", response.read())
+
+            with self.assertRaises(urllib.error.HTTPError):
+                urllib.request.urlopen(url + "/spam")
+        finally:
+            server.shutdown()
+            server.server_close()
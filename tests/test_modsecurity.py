@@ -9,6 +9,7 @@ import unittest
 from pymodsecurity import modsecurity
 from pymodsecurity import transaction
 from pymodsecurity import rules
+from pymodsecurity import utils
 
 
 class TestModsecurity(unittest.TestCase):
@@ -62,3 +63,21 @@ class TestModsecurity(unittest.TestCase):
         connector = "ModSecurity " + version
         retvalue = self.modsec.who_am_i()
         self.assertIn(connector, retvalue)
+
+    def test_close(self):
+        live = utils.live_handles()["ModSecurity"]
+        with modsecurity.ModSecurity() as modsec:
+            self.assertEqual(utils.live_handles()["ModSecurity"], live + 1)
+        self.assertEqual(utils.live_handles()["ModSecurity"], live)
+
+        # Closing twice has no effect
+        modsec.close()
+        self.assertEqual(utils.live_handles()["ModSecurity"], live)
+
+        # A transaction keeps its ModSecurity instance alive
+        modsec = modsecurity.ModSecurity()
+        transac = transaction.Transaction(modsec, rules.Rules())
+        del modsec
+        self.assertEqual(utils.live_handles()["ModSecurity"], live + 1)
+        del transac
+        self.assertEqual(utils.live_handles()["ModSecurity"], live)
@@ -0,0 +1,81 @@
+# coding: utf-8
+"""
+Test IPPrefilter methods.
+"""
+
+import os
+import tempfile
+import unittest
+
+from pymodsecurity import prefilter
+
+
+class TestIPPrefilter(unittest.TestCase):
+    def setUp(self):
+        self.prefilter = prefilter.IPPrefilter(
+            allow=["10.1.0.0/16", "192.168.0.1", "2001:db8:1::/48"],
+            deny=["10.0.0.0/8", "10.1.2.0/24", "192.168.0.1/32",
+                  "2001:db8::/32"])
+
+    def test_lookup(self):
+        lookup = self.prefilter.lookup
+        self.assertEqual(lookup("10.0.0.1"), prefilter.DENY)
+        self.assertEqual(lookup("10.255.255.255"), prefilter.DENY)
+        self.assertEqual(lookup("10.1.0.1"), prefilter.ALLOW)
+        self.assertEqual(lookup("10.1.2.3"), prefilter.DENY)
+        self.assertEqual(lookup("10.1.3.0"), prefilter.ALLOW)
+        self.assertIsNone(lookup("11.0.0.0"))
+        self.assertIsNone(lookup("9.255.255.255"))
+        self.assertIsNone(lookup("0.0.0.0"))
+        self.assertIsNone(lookup("255.255.255.255"))
+
+        # Deny wins for identical networks
+        self.assertEqual(lookup("192.168.0.1"), prefilter.DENY)
+
+        self.assertEqual(lookup("2001:db8::1"), prefilter.DENY)
+        self.assertEqual(lookup("2001:db8:1::1"), prefilter.ALLOW)
+        self.assertIsNone(lookup("::1"))
+
+        # IPv4-mapped IPv6 addresses
+        self.assertEqual(lookup("::ffff:10.0.0.1"), prefilter.DENY)
+
+        # Invalid addresses are inspected
+        self.assertIsNone(lookup("spam"))
+        self.assertIsNone(lookup(""))
+        self.assertIsNone(lookup("fe80::1%eth0"))
+
+    def test_empty(self):
+        self.assertIsNone(prefilter.IPPrefilter().lookup("10.0.0.1"))
+        self.assertIsNone(prefilter.IPPrefilter().lookup("::1"))
+
+    def test_load(self):
+        self.prefilter.load(deny=["0.0.0.0/0"])
+        self.assertEqual(self.prefilter.lookup("10.1.0.1"), prefilter.DENY)
+        self.assertIsNone(self.prefilter.lookup("::1"))
+
+        with self.assertRaises(ValueError):
+            self.prefilter.load(deny=["spam"])
+        # Lists are kept on error
+        self.assertEqual(self.prefilter.lookup("10.1.0.1"), prefilter.DENY)
+
+    def test_from_files(self):
+        with tempfile.TemporaryDirectory() as directory:
+            allow_file = os.path.join(directory, "allow")
+            deny_file = os.path.join(directory, "deny")
+            with open(allow_file, "w") as f:
+                f.write("# Health checkers\n10.1.0.0/16\n\n")
+            with open(deny_file, "w") as f:
+                f.write("10.0.0.0/8  # Internal\n")
+
+            ip_prefilter = prefilter.IPPrefilter.from_files(allow_file,
+                                                            deny_file)
+            self.assertEqual(ip_prefilter.lookup("10.1.0.1"),
+                             prefilter.ALLOW)
+            self.assertEqual(ip_prefilter.lookup("10.0.0.1"),
+                             prefilter.DENY)
+
+            with open(deny_file, "a") as f:
+                f.write("spam\n")
+            with self.assertRaises(ValueError) as ctx:
+                ip_prefilter.load_files(allow_file, deny_file)
+            self.assertIn(deny_file + ":2", str(ctx.exception))
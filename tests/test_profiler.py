@@ -0,0 +1,110 @@
+# coding: utf-8
+"""
+Test the rule-load profiler.
+"""
+
+import os
+import tempfile
+import unittest
+import unittest.mock
+
+from pymodsecurity import profiler
+from pymodsecurity import rules
+from pymodsecurity.exceptions import BundleError
+
+
+class TestRuleLoadProfiler(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = self.directory.name
+        self.rules_set = unittest.mock.Mock()
+        self.rules_set.add_rules.side_effect = (
+            lambda plain_rules: plain_rules.count("SecRule "))
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write_file(self, filename, content):
+        filepath = os.path.join(self.path, filename)
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        with open(filepath, "w") as f:
+            f.write(content)
+        return filepath
+
+    def write_configuration(self):
+        self.write_file("rules/1.conf",
+                        'SecRule ARGS "@pmFromFile words.data" '
+                        '"id:1,phase:2,deny"\n'
+                        'SecRule ARGS "@rx b" "id:2,phase:2,deny"\n')
+        self.write_file("rules/2.conf",
+                        'SecRule ARGS "@rx c" \\\n    "id:3,phase:2,deny"\n')
+        return self.write_file("main.conf",
+                               "# Comment\n"
+                               "SecRuleEngine On\n"
+                               "Include rules/*.conf\n"
+                               'SecRule ARGS "@rx d" "id:4,phase:2,deny"\n')
+
+    def test_load_file(self):
+        main = self.write_configuration()
+        rule_profiler = profiler.RuleLoadProfiler(self.rules_set)
+
+        total = rule_profiler.load_file(main)
+
+        self.assertEqual((total.kind, total.name, total.rules),
+                         (profiler.FILE, main, 4))
+        self.assertEqual(
+            [call[0][0] for call in self.rules_set.add_rules.call_args_list],
+            ["SecRuleEngine On\n",
+             'SecRule ARGS "@pmFromFile ' +
+             os.path.join(self.path, "rules", "words.data") +
+             '" "id:1,phase:2,deny"\n'
+             'SecRule ARGS "@rx b" "id:2,phase:2,deny"\n',
+             'SecRule ARGS "@rx c" \\\n    "id:3,phase:2,deny"\n',
+             'SecRule ARGS "@rx d" "id:4,phase:2,deny"\n'])
+
+        steps = {(step.kind, step.name): step.rules
+                 for step in rule_profiler.steps}
+        self.assertEqual(steps, {
+            (profiler.FILE, os.path.join(self.path, "rules", "1.conf")): 2,
+            (profiler.FILE, os.path.join(self.path, "rules", "2.conf")): 1,
+            (profiler.INCLUDE, main + ": Include rules/*.conf"): 3,
+            (profiler.FILE, main): 1,
+        })
+
+        report = rule_profiler.report()
+        self.assertEqual(len(report), 4)
+        self.assertEqual([step.seconds for step in report],
+                         sorted((step.seconds for step in report),
+                                reverse=True))
+        self.assertEqual(len(rule_profiler.report(2)), 2)
+        self.assertIn("Include rules/*.conf",
+                      rule_profiler.format_report())
+
+        rule_profiler.clear()
+        self.assertEqual(rule_profiler.report(), [])
+
+    def test_load_errors(self):
+        rule_profiler = profiler.RuleLoadProfiler(self.rules_set)
+        loop = self.write_file("loop.conf", "Include loop.conf\n")
+        missing = self.write_file("missing.conf", "Include nothing/*.conf\n")
+        optional = self.write_file("optional.conf",
+                                   "IncludeOptional nothing/*.conf\n")
+
+        with self.assertRaisesRegex(BundleError, "Include loop"):
+            rule_profiler.load_file(loop)
+        with self.assertRaisesRegex(BundleError, "No file matches"):
+            rule_profiler.load_file(missing)
+        with self.assertRaisesRegex(BundleError, "Cannot read"):
+            rule_profiler.load_file(os.path.join(self.path, "absent.conf"))
+        self.assertEqual(rule_profiler.load_file(optional).rules, 0)
+
+    def test_load_into_rules(self):
+        main = self.write_configuration()
+        self.write_file("rules/words.data", "a\nb\n")
+
+        with rules.Rules() as rules_set:
+            rule_profiler = profiler.RuleLoadProfiler(rules_set)
+            self.assertEqual(rule_profiler.load_file(main).rules, 4)
+            self.assertEqual(
+                rule_profiler.load('SecRule ARGS "@rx e" '
+                                   '"id:5,phase:2,deny"\n').rules, 1)
@@ -0,0 +1,109 @@
+# coding: utf-8
+"""
+Test RuleSetRegistry methods.
+"""
+
+import os
+import unittest
+
+from pymodsecurity import registry
+from pymodsecurity import utils
+from pymodsecurity.exceptions import InternalError
+from pymodsecurity.modsecurity import ModSecurity
+from pymodsecurity.rules import Rules
+from pymodsecurity.transaction import Transaction
+
+
+class TestRuleSetRegistry(unittest.TestCase):
+    def setUp(self):
+        filename = "basic_rules.conf"
+        filepath = os.path.abspath(os.path.dirname(__file__)) + "/" + filename
+        self.registry = registry.RuleSetRegistry(filepath)
+        self.overlay = ('SecRule ARGS:attack "@streq 1" '
+                        '"id:300000,phase:1,deny,status:403"')
+
+    def test_normalize_host(self):
+        self.assertEqual(registry._normalize_host("WWW.Example.org:8080"),
+                         "www.example.org")
+        self.assertEqual(registry._normalize_host("[::1]:8080"), "[::1]")
+
+    def test_register(self):
+        rule_set = self.registry.register("www.example.org", self.overlay)
+        self.assertIsInstance(rule_set.rules, Rules)
+        self.assertIs(self.registry.rules_for("WWW.example.org:80"),
+                      rule_set.rules)
+
+        # Identical overlays are shared
+        other = self.registry.register("www.example.com",
+                                       "\n" + self.overlay + "\n")
+        self.assertIs(other, rule_set)
+        self.assertEqual(rule_set.hosts, {"www.example.org",
+                                          "www.example.com"})
+
+        # Registering again has no effect
+        self.assertIs(self.registry.register("www.example.org",
+                                             self.overlay), rule_set)
+        self.assertEqual(len(self.registry.memory_report()), 2)
+
+        # Unknown hosts use the base rules set
+        self.assertIs(self.registry.rules_for("unknown.org"),
+                      self.registry.base)
+
+        with self.assertRaises(InternalError):
+            self.registry.register("www.example.net", "spam eggs ham")
+
+    def test_unregister(self):
+        live = utils.live_handles()["Rules"]
+        self.registry.register("www.example.org", self.overlay)
+        self.registry.register("www.example.com", self.overlay)
+        self.assertEqual(utils.live_handles()["Rules"], live + 1)
+
+        self.registry.unregister("www.example.org")
+        self.assertEqual(utils.live_handles()["Rules"], live + 1)
+        self.registry.unregister("www.example.com")
+        self.assertEqual(utils.live_handles()["Rules"], live)
+        self.assertIs(self.registry.rules_for("www.example.com"),
+                      self.registry.base)
+
+        # Unknown hosts are ignored
+        self.registry.unregister("unknown.org")
+
+    def test_new_transaction(self):
+        self.registry.register("www.example.org", self.overlay)
+        transaction = self.registry.new_transaction(ModSecurity(),
+                                                    "www.example.org")
+        self.assertIsInstance(transaction, Transaction)
+
+        transaction.process_connection("127.0.0.1", 12345, "127.0.0.1", 80)
+        transaction.process_uri("/?attack=1", "GET", "1.1")
+        transaction.process_request_headers()
+        self.assertTrue(transaction.has_intervention())
+
+    def test_reroute_in_flight(self):
+        live = utils.live_handles()["Rules"]
+        self.registry.register("www.example.org", self.overlay)
+        transaction = self.registry.new_transaction(ModSecurity(),
+                                                    "www.example.org")
+        self.registry.register("www.example.org", "SecRuleEngine Off")
+
+        # The previous rules set stays usable by the transaction
+        transaction.process_uri("/?attack=1", "GET", "1.1")
+        transaction.process_request_headers()
+        self.assertTrue(transaction.has_intervention())
+        transaction.close()
+        self.assertEqual(utils.live_handles()["Rules"], live + 1)
+
+    def test_rejected_overlay(self):
+        live = utils.live_handles()["Rules"]
+        with self.assertRaises(InternalError):
+            self.registry.register("www.example.org", "spam eggs ham")
+        self.assertEqual(utils.live_handles()["Rules"], live)
+
+    def test_memory_report(self):
+        self.registry.register("www.example.org", self.overlay)
+        report = self.registry.memory_report()
+        self.assertEqual(len(report), 2)
+        self.assertIsNone(report[0].key)
+        for rule_set in report:
+            if rule_set.memory is not None:
+                self.assertGreaterEqual(rule_set.memory, 0)
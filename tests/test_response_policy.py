@@ -0,0 +1,38 @@
+# coding: utf-8
+"""
+Test ResponseBodyPolicy methods.
+"""
+
+import unittest
+
+from pymodsecurity import response_policy
+
+
+class TestResponseBodyPolicy(unittest.TestCase):
+    def setUp(self):
+        self.policy = response_policy.ResponseBodyPolicy(
+            {"application/json": 64, "Image/*": 0, "text/html": None},
+            default=1024)
+
+    def test_media_type(self):
+        self.assertEqual(
+            response_policy.media_type("Text/HTML; charset=utf-8"),
+            "text/html")
+        self.assertEqual(response_policy.media_type(None), "")
+
+    def test_budget(self):
+        self.assertEqual(self.policy.budget("application/json"), 64)
+        self.assertEqual(self.policy.budget("image/png"), 0)
+        self.assertIsNone(self.policy.budget("text/html; charset=utf-8"))
+        self.assertEqual(self.policy.budget("text/plain"), 1024)
+        self.assertEqual(self.policy.budget(None), 1024)
+
+    def test_record(self):
+        self.policy.record("application/json", 100)
+        self.policy.record("application/json; charset=utf-8", 20)
+        self.policy.record("image/png", 0)
+        self.policy.record("image/png", 5)
+        self.assertEqual(self.policy.truncated, {"application/json": 120,
+                                                 "image/png": 5})
+        self.assertEqual(self.policy.truncated_bytes, 125)
+        self.assertEqual(self.policy.truncated_responses, 3)
@@ -5,10 +5,13 @@ Test Rules methods.
 
 import contextlib
 import os
+import tempfile
 import unittest
 import unittest.mock
 
+from pymodsecurity import bundle
 from pymodsecurity import rules
+from pymodsecurity import utils
 from pymodsecurity._modsecurity import ffi
 from pymodsecurity.exceptions import InternalError
 
@@ -114,3 +117,71 @@ class TestRules(unittest.TestCase):
         # Rules() instance without any rules
         self.rules_set3 = rules.Rules()
         self.assertEqual(self.rules_set1.merge_rules(self.rules_set3), 0)
+
+    def test_index(self):
+        rule_1 = ('SecRule ARGS "@rx a" "id:1,phase:1,pass,nolog"\n'
+                  'SecRule ARGS "@rx b" "id:2,phase:2,pass,nolog"\n')
+        rule_2 = 'SecRule ARGS "@rx c" "id:3,phase:2,pass,nolog"'
+        self.rules_set.add_rules(rule_1)
+
+        # Warned about the redirection
+        with unittest.mock.patch.object(rules, "_dump_warned", False):
+            with self.assertWarns(RuntimeWarning):
+                index = self.rules_set.index()
+        self.assertEqual(index.phases, {1: 1, 2: 2})
+        self.assertEqual(index.counts, {1: 1, 2: 1})
+        # Cached until rules are added
+        self.assertIs(self.rules_set.index(), index)
+
+        self.rules_set.add_rules(rule_2)
+        index = self.rules_set.index()
+        self.assertEqual(index.phase(3), 2)
+        self.assertEqual(index.counts, {1: 1, 2: 2})
+        self.assertIsNone(index.phase(4))
+
+    def test_close(self):
+        live = utils.live_handles()["Rules"]
+        with rules.Rules() as rules_set:
+            self.assertEqual(utils.live_handles()["Rules"], live + 1)
+        self.assertEqual(utils.live_handles()["Rules"], live)
+
+        # Closing twice has no effect
+        rules_set.close()
+        self.assertEqual(utils.live_handles()["Rules"], live)
+
+    def test_from_bundle(self):
+        filename = "basic_rules.conf"
+        filepath = os.path.abspath(os.path.dirname(__file__)) + "/" + filename
+
+        with tempfile.TemporaryDirectory() as directory:
+            bundle_path = os.path.join(directory, "rules.bundle")
+            self.assertEqual(bundle.build(filepath, bundle_path), 7)
+
+            rules_set = rules.Rules.from_bundle(bundle_path)
+            self.assertIsInstance(rules_set, rules.Rules)
+            self.assertEqual(rules_set.merge_rules(rules.Rules()), 0)
+
+
+class TestRuleIndex(unittest.TestCase):
+    def test_from_dump(self):
+        dump = (b"Rules: \n"
+                b"Phase: 0 (0 rules)\n"
+                b"Phase: 1 (0 rules)\n"
+                b"Phase: 2 (2 rules)\n"
+                b"    Rule ID: 200000--0x55d4c8a0\n"
+                b"    Rule ID: 921140--0x55d4c9b0\n"
+                b"Phase: 3 (1 rules)\n"
+                b"    Rule ID: 200002--0x55d4cac0\n"
+                b"Phase: 4 (0 rules)\n"
+                b"Phase: 5 (0 rules)\n"
+                b"Phase: 6 (1 rules)\n"
+                b"    Rule ID: 980000--0x55d4cbd0\n")
+        index = rules.RuleIndex.from_dump(dump)
+
+        self.assertEqual(index.phases, {200000: 1, 921140: 1, 200002: 2,
+                                        980000: 5})
+        self.assertEqual(index.counts, {1: 2, 2: 1, 5: 1})
+        self.assertEqual(len(index), 4)
+        self.assertIn(921140, index)
+        self.assertEqual(index.phase(200002), 2)
+        self.assertIsNone(index.phase(1))
@@ -0,0 +1,137 @@
+# coding: utf-8
+"""
+Test LoggingScheduler methods.
+"""
+
+import threading
+import unittest
+import unittest.mock
+
+from pymodsecurity import scheduler
+from pymodsecurity.exceptions import LoggingActionError
+
+
+class TestLoggingScheduler(unittest.TestCase):
+    def setUp(self):
+        self.scheduler = scheduler.LoggingScheduler(maxsize=4, batch_size=2)
+
+    def tearDown(self):
+        self.scheduler.close()
+
+    def blocked_transaction(self):
+        """
+        Return a transaction blocking the writer thread until the returned
+        event is set.
+        """
+        release = threading.Event()
+        started = threading.Event()
+
+        def _process_logging():
+            started.set()
+            release.wait()
+
+        transaction = unittest.mock.Mock()
+        transaction.process_logging.side_effect = _process_logging
+        self.scheduler.schedule(transaction)
+        started.wait()
+        return release
+
+    def test_schedule(self):
+        transactions = [unittest.mock.Mock() for _ in range(10)]
+        for transaction in transactions:
+            self.assertTrue(self.scheduler.schedule(transaction))
+        self.scheduler.flush()
+
+        for transaction in transactions:
+            transaction.process_logging.assert_called_once_with()
+            transaction.close.assert_called_once_with()
+        self.assertEqual(self.scheduler.logged, 10)
+
+    def test_failed_logging(self):
+        transaction = unittest.mock.Mock()
+        transaction.process_logging.side_effect = LoggingActionError
+        self.scheduler.schedule(transaction)
+        self.scheduler.flush()
+
+        self.assertEqual(self.scheduler.failed, 1)
+        self.assertEqual(self.scheduler.logged, 0)
+        transaction.close.assert_called_once_with()
+
+    def test_unexpected_failure(self):
+        transaction = unittest.mock.Mock()
+        transaction.process_logging.side_effect = MemoryError
+        self.scheduler.schedule(transaction)
+        self.scheduler.schedule(unittest.mock.Mock())
+        # The writer thread is still running
+        self.scheduler.flush()
+
+        self.assertEqual(self.scheduler.failed, 1)
+        self.assertEqual(self.scheduler.logged, 1)
+
+    def test_drop_policy(self):
+        self.scheduler.policy = scheduler.DROP
+        release = self.blocked_transaction()
+        for _ in range(4):
+            self.assertTrue(self.scheduler.schedule(unittest.mock.Mock()))
+
+        dropped = unittest.mock.Mock()
+        self.assertFalse(self.scheduler.schedule(dropped))
+        self.assertEqual(self.scheduler.dropped, 1)
+        dropped.process_logging.assert_not_called()
+        dropped.close.assert_called_once_with()
+        release.set()
+
+    def test_block_policy_timeout(self):
+        self.scheduler.timeout = 0.01
+        release = self.blocked_transaction()
+        for _ in range(4):
+            self.scheduler.schedule(unittest.mock.Mock())
+
+        self.assertFalse(self.scheduler.schedule(unittest.mock.Mock()))
+        self.assertEqual(self.scheduler.dropped, 1)
+        release.set()
+
+    def test_inline_policy(self):
+        self.scheduler.policy = scheduler.INLINE
+        release = self.blocked_transaction()
+        for _ in range(4):
+            self.scheduler.schedule(unittest.mock.Mock())
+
+        transaction = unittest.mock.Mock()
+        self.assertTrue(self.scheduler.schedule(transaction))
+        transaction.process_logging.assert_called_once_with()
+        release.set()
+
+    def test_close(self):
+        transactions = [unittest.mock.Mock() for _ in range(3)]
+        for transaction in transactions:
+            self.scheduler.schedule(transaction)
+        self.scheduler.close()
+
+        for transaction in transactions:
+            transaction.process_logging.assert_called_once_with()
+        with self.assertRaises(LoggingActionError):
+            self.scheduler.schedule(unittest.mock.Mock())
+
+        # Closing twice has no effect
+        self.scheduler.close()
+
+    def test_close_timeout(self):
+        release = self.blocked_transaction()
+        for _ in range(4):
+            self.scheduler.schedule(unittest.mock.Mock())
+
+        # The queue is full: the stop sentinel cannot be queued in time
+        self.scheduler.close(timeout=0.01)
+        with self.assertRaises(LoggingActionError):
+            self.scheduler.schedule(unittest.mock.Mock())
+        release.set()
+
+        # Stops once the queue is drained
+        self.scheduler._thread.join(5)
+        self.assertFalse(self.scheduler._thread.is_alive())
+        self.assertEqual(self.scheduler.logged, 5)
+
+    def test_bad_policy(self):
+        with self.assertRaises(ValueError):
+            scheduler.LoggingScheduler(policy="spam")
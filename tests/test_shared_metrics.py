@@ -0,0 +1,82 @@
+# coding: utf-8
+"""
+Test SharedRegistry methods.
+"""
+
+import os
+import unittest
+
+from pymodsecurity import metrics
+from pymodsecurity import shared_metrics
+
+
+@unittest.skipIf(shared_metrics.shared_memory is None,
+                 "shared memory requires Python 3.8")
+class TestSharedRegistry(unittest.TestCase):
+    def setUp(self):
+        self.registry = shared_metrics.SharedRegistry(workers=4, slots=256)
+
+    def tearDown(self):
+        metrics.disable()
+        self.registry.close()
+        self.registry.unlink()
+
+    def test_counter(self):
+        counter = self.registry.counter("interventions_total",
+                                        "Interventions.", ("status",),
+                                        [(403,)])
+        counter.labels(403).inc()
+        counter.labels("403").inc()
+        counter.labels(500).inc(3)
+        self.assertEqual(self.registry.render(),
+                         "# HELP interventions_total Interventions.\n"
+                         "# TYPE interventions_total counter\n"
+                         'interventions_total{status="403"} 2\n'
+                         'interventions_total{status="other"} 3\n')
+
+    def test_histogram(self):
+        histogram = self.registry.histogram("latency_seconds", "Latency.",
+                                            buckets=(0.1, 1))
+        histogram.observe(0.05)
+        histogram.observe(2)
+        self.assertEqual(self.registry.render(),
+                         "# HELP latency_seconds Latency.\n"
+                         "# TYPE latency_seconds histogram\n"
+                         'latency_seconds_bucket{le="0.1"} 1\n'
+                         'latency_seconds_bucket{le="1.0"} 1\n'
+                         'latency_seconds_bucket{le="+Inf"} 2\n'
+                         "latency_seconds_sum 2.05\n"
+                         "latency_seconds_count 2\n")
+
+    @unittest.skipUnless(hasattr(os, "fork"), "requires fork()")
+    def test_workers(self):
+        counter = self.registry.counter("requests_total", "Requests.")
+        counter.inc()
+
+        children = []
+        for _ in range(3):
+            pid = os.fork()
+            if pid == 0:
+                counter.inc(2)
+                os._exit(0)
+            children.append(pid)
+        for pid in children:
+            os.waitpid(pid, 0)
+
+        self.assertIn("requests_total 7\n", self.registry.render())
+
+    def test_full(self):
+        with self.assertRaises(ValueError):
+            self.registry.histogram("latency_seconds", "Latency.",
+                                    buckets=range(300))
+
+    def test_library_metrics(self):
+        stats = metrics.enable(self.registry)
+        stats.interventions.labels(403).inc()
+        stats.phase_latencies["uri"].observe(0.001)
+        rendered = self.registry.render()
+        self.assertIn('pymodsecurity_interventions_total{status="403"} 1\n',
+                      rendered)
+        self.assertIn('pymodsecurity_phase_duration_seconds_count'
+                      '{phase="uri"} 1\n', rendered)
+        self.assertNotIn("pymodsecurity_live_handles", rendered)
@@ -0,0 +1,67 @@
+# coding: utf-8
+"""
+Test RequestBodySpooler methods.
+"""
+
+import io
+import os
+import tempfile
+import unittest
+import unittest.mock
+
+from pymodsecurity import spool
+
+
+class TestRequestBodySpooler(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.spooler = spool.RequestBodySpooler(threshold=16, chunk_size=4,
+                                                directory=self.directory.name)
+        self.transaction = unittest.mock.Mock()
+
+    def test_in_memory(self):
+        body = self.spooler.feed(self.transaction, io.BytesIO(b"a=1&b=2"), 7)
+        self.transaction.append_request_body.assert_called_once_with(
+            b"a=1&b=2")
+        self.transaction.get_request_body_from_file.assert_not_called()
+        self.assertEqual(body.read(), b"a=1&b=2")
+        self.assertEqual(self.spooler.buffered, 1)
+
+    def test_spooled(self):
+        data = b"x" * 30 + b"extra"
+        stream = io.BytesIO(data)
+        stream.read = unittest.mock.Mock(wraps=stream.read)
+        spooled = []
+
+        def _from_file(path):
+            with open(path, "rb") as spooled_file:
+                spooled.append(spooled_file.read())
+
+        self.transaction.get_request_body_from_file.side_effect = _from_file
+        body = self.spooler.feed(self.transaction, stream, 30)
+        self.addCleanup(body.close)
+
+        self.assertEqual(spooled, [b"x" * 30])
+        self.transaction.append_request_body.assert_not_called()
+        for call in stream.read.call_args_list:
+            self.assertLessEqual(call[0][0], 4)
+        self.assertEqual(body.read(), b"x" * 30)
+        self.assertEqual(os.listdir(self.directory.name), [])
+        self.assertEqual(self.spooler.spooled, 1)
+
+    def test_truncated_stream(self):
+        spooled = []
+        self.transaction.get_request_body_from_file.side_effect = (
+            lambda path: spooled.append(os.path.getsize(path)))
+        with self.spooler.feed(self.transaction, io.BytesIO(b"y" * 20),
+                               100) as body:
+            self.assertEqual(body.read(), b"y" * 20)
+        self.assertEqual(spooled, [20])
+
+    def test_failure(self):
+        self.transaction.get_request_body_from_file.side_effect = OSError
+        with self.assertRaises(OSError):
+            self.spooler.feed(self.transaction, io.BytesIO(b"z" * 20), 20)
+        self.assertEqual(os.listdir(self.directory.name), [])
+        self.assertEqual(self.spooler.spooled, 0)
@@ -5,17 +5,27 @@ Test Transaction methods.
 
 import contextlib
 import os
+import tracemalloc
 import unittest
 import unittest.mock
 
+from pymodsecurity import metrics
 from pymodsecurity import transaction
+from pymodsecurity import utils
 from pymodsecurity.modsecurity import ModSecurity
 from pymodsecurity.rules import Rules
-from pymodsecurity.exceptions import (ProcessConnectionError,
+from pymodsecurity.exceptions import (ClosedError,
+                                      ProcessConnectionError,
                                       FeedingError,
                                       LoggingActionError)
 
 
+# Python-side bytes allocated per idle transaction: the instance itself, the
+# intervention struct, the cdata pointer to the C transaction and its
+# finalizer bookkeeping.
+MAX_BYTES_PER_TRANSACTION = 640
+
+
 class TestTransaction(unittest.TestCase):
     """
     All methods except :meth:`~TestTransaction.get_response_body_length`
@@ -164,6 +174,82 @@ class TestTransaction(unittest.TestCase):
         # No intervention has to be done when nothing has been processed
         self.assertFalse(self.transactions.has_intervention())
 
+    def test_get_intervention(self):
+        self.assertIsNone(self.transactions.get_intervention())
+
+        rules_set = Rules()
+        rules_set.add_rules('SecRuleEngine On\n'
+                            'SecRule ARGS:attack "@streq 1" '
+                            '"id:300000,phase:1,deny,status:403"')
+        transac = transaction.Transaction(ModSecurity(), rules_set)
+        transac.process_uri("/?attack=1", "GET", "1.1")
+        transac.process_request_headers()
+
+        intervention = transac.get_intervention()
+        self.assertIsInstance(intervention, transaction.Intervention)
+        self.assertEqual(intervention.status, 403)
+        self.assertEqual(intervention.disruptive, 1)
+
+    def test_intervention_metrics(self):
+        rules_set = Rules()
+        rules_set.add_rules('SecRuleEngine On\n'
+                            'SecRule ARGS:attack "@streq 1" '
+                            '"id:300000,phase:1,deny,status:403"')
+        transac = transaction.Transaction(ModSecurity(), rules_set)
+        transac.process_uri("/?attack=1", "GET", "1.1")
+        transac.process_request_headers()
+
+        stats = metrics.enable(metrics.Registry())
+        try:
+            # Stable until the next phase
+            self.assertTrue(transac.has_intervention())
+            self.assertTrue(transac.has_intervention())
+            self.assertEqual(transac.get_intervention().status, 403)
+        finally:
+            metrics.disable()
+        self.assertEqual(stats.interventions.labels(403).value, 1)
+
+    def test_return_interventions(self):
+        rules_set = Rules()
+        rules_set.add_rules('SecRuleEngine On\n'
+                            'SecRule ARGS:attack "@streq 1" '
+                            '"id:300000,phase:1,deny,status:403"')
+        transac = transaction.Transaction(ModSecurity(), rules_set,
+                                          return_interventions=True)
+        self.assertIsNone(transac.process_connection("127.0.0.1", 12345,
+                                                     "127.0.0.1", 80))
+        self.assertIsNone(transac.process_uri("/?attack=1", "GET", "1.1"))
+
+        intervention = transac.process_request_headers()
+        self.assertIsInstance(intervention, transaction.Intervention)
+        self.assertEqual(intervention.status, 403)
+        self.assertEqual(intervention.disruptive, 1)
+
+        with self.assert_error_message_raised("pymsc_process_request_body",
+                                              ProcessConnectionError,
+                                              return_value=-1):
+            transac.process_request_body()
+
+    def test_intervention_reset(self):
+        rules_set = Rules()
+        rules_set.add_rules('SecRuleEngine On\n'
+                            'SecRule ARGS:attack "@streq 1" '
+                            '"id:300000,phase:1,deny,status:403"\n'
+                            'SecRule REQUEST_BODY "@contains spam" '
+                            '"id:300001,phase:2,deny,status:406"')
+        transac = transaction.Transaction(ModSecurity(), rules_set,
+                                          return_interventions=True)
+        transac.process_uri("/?attack=1", "GET", "1.1")
+        self.assertEqual(transac.process_request_headers().status, 403)
+        self.assertEqual(transac.get_intervention().status, 403)
+
+        # Only the first phase matched: its intervention is not reported
+        # again.
+        transac.append_request_body(self.body)
+        self.assertIsNone(transac.process_request_body())
+        self.assertFalse(transac.has_intervention())
+        self.assertIsNone(transac.get_intervention())
+
     def test_process_logging(self):
         self.transactions.process_logging()
 
@@ -177,3 +263,99 @@ class TestTransaction(unittest.TestCase):
 
         retvalue = self.transactions.get_matched_rules_info()
         self.assertEqual(retvalue, [])
+
+    def test_footprint(self):
+        self.assertFalse(hasattr(self.transactions, "__dict__"))
+
+        modsec = ModSecurity()
+        rules_set = Rules()
+        count = 1000
+
+        tracemalloc.start()
+        try:
+            before = tracemalloc.get_traced_memory()[0]
+            kept = [transaction.Transaction(modsec, rules_set)
+                    for _ in range(count)]
+            after = tracemalloc.get_traced_memory()[0]
+        finally:
+            tracemalloc.stop()
+
+        # Account for the list holding the transactions.
+        used = after - before - len(kept) * 8
+        self.assertLessEqual(used / count, MAX_BYTES_PER_TRANSACTION)
+
+    def test_close(self):
+        live = utils.live_handles()["Transaction"]
+        transac = transaction.Transaction(ModSecurity(), Rules())
+        self.assertEqual(utils.live_handles()["Transaction"], live + 1)
+
+        transac.close()
+        self.assertEqual(utils.live_handles()["Transaction"], live)
+        self.assertTrue(transac.closed)
+        with self.assertRaises(ClosedError):
+            transac.process_uri("/", "GET", "1.1")
+        with self.assertRaises(ClosedError):
+            transac.handle
+
+        # Closing twice has no effect
+        transac.close()
+        self.assertEqual(utils.live_handles()["Transaction"], live)
+
+        # Garbage collected without explicit close
+        transac = transaction.Transaction(ModSecurity(), Rules())
+        del transac
+        self.assertEqual(utils.live_handles()["Transaction"], live)
+
+    def test_close_parents(self):
+        live = utils.live_handles()
+        modsec, rules_set = ModSecurity(), Rules()
+        transac = transaction.Transaction(modsec, rules_set)
+
+        # Freed once the transaction using them is closed
+        modsec.close()
+        rules_set.close()
+        self.assertTrue(rules_set.closed)
+        self.assertEqual(utils.live_handles()["Rules"], live["Rules"] + 1)
+        transac.process_uri("/", "GET", "1.1")
+        with self.assertRaises(ClosedError):
+            transaction.Transaction(ModSecurity(), rules_set)
+        with self.assertRaises(ClosedError):
+            rules_set.add_rules("SecRuleEngine On")
+
+        transac.close()
+        self.assertEqual(utils.live_handles(), live)
+
+    def test_context_manager(self):
+        live = utils.live_handles()["Transaction"]
+        with transaction.Transaction(ModSecurity(), Rules()) as transac:
+            transac.process_uri("/", "GET", "1.1")
+            self.assertEqual(utils.live_handles()["Transaction"], live + 1)
+        self.assertEqual(utils.live_handles()["Transaction"], live)
+
+    def test_inspect_many(self):
+        rules_set = Rules()
+        rules_set.add_rules('SecRuleEngine On\n'
+                            'SecRule ARGS:attack "@streq 1" '
+                            '"id:300000,phase:1,deny,status:403"')
+        requests = [
+            {"uri": "/index.html"},
+            {"uri": "/index.html?attack=1",
+             "method": "POST",
+             "headers": [("Content-Type", "text/plain")],
+             "body": "This is a body"},
+        ]
+
+        verdicts = transaction.Transaction.inspect_many(ModSecurity(),
+                                                        rules_set,
+                                                        requests)
+        self.assertEqual(len(verdicts), 2)
+        self.assertEqual(verdicts[0].disruptive, 0)
+        self.assertEqual(verdicts[0].matched_rules, 0)
+        self.assertEqual(verdicts[1].disruptive, 1)
+        self.assertEqual(verdicts[1].status, 403)
+        self.assertEqual(verdicts[1].matched_rules, 1)
+
+        with self.assert_error_message_raised("pymsc_inspect_many",
+                                              ProcessConnectionError):
+            transaction.Transaction.inspect_many(ModSecurity(), rules_set,
+                                                 requests)
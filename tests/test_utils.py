@@ -0,0 +1,65 @@
+# coding: utf-8
+"""
+Test utils functions.
+"""
+
+import unittest
+import unittest.mock
+
+from pymodsecurity import utils
+from pymodsecurity.exceptions import ClosedError
+
+
+class TestUtils(unittest.TestCase):
+    def test_as_bytes(self):
+        self.assertEqual(utils.as_bytes("/index.html"), b"/index.html")
+        self.assertEqual(utils.as_bytes("é", "latin-1"), b"\xe9")
+
+        # Pre-encoded strings
+        self.assertEqual(utils.as_bytes("GET"), b"GET")
+        self.assertEqual(utils.as_bytes("User-Agent"), b"User-Agent")
+        self.assertEqual(utils.as_bytes("user-agent"), b"user-agent")
+
+        # Objects which are not str are returned as is
+        value = b"/index.html"
+        self.assertIs(utils.as_bytes(value), value)
+        value = bytearray(b"/index.html")
+        self.assertIs(utils.as_bytes(value), value)
+
+        # str subclasses are encoded
+        class Text(str):
+            pass
+        self.assertEqual(utils.as_bytes(Text("spam")), b"spam")
+
+    def test_register_encoded(self):
+        with unittest.mock.patch.object(utils, "_encoded", {}):
+            with unittest.mock.patch.object(utils, "_ENCODED_CACHE_SIZE", 2):
+                self.assertEqual(utils.register_encoded("spam", "spam"), 1)
+                self.assertEqual(utils.register_encoded("eggs", "ham"), 1)
+                self.assertEqual(utils._encoded, {"spam": b"spam",
+                                                  "eggs": b"eggs"})
+
+            self.assertEqual(utils.as_bytes("spam"), b"spam")
+            self.assertEqual(utils.as_bytes("ham"), b"ham")
+
+
+class TestDependents(unittest.TestCase):
+    def test_close(self):
+        finalizer = unittest.mock.Mock()
+        dependents = utils.Dependents(finalizer)
+        dependents.acquire()
+        dependents.acquire()
+
+        dependents.close()
+        self.assertTrue(dependents.closed)
+        with self.assertRaises(ClosedError):
+            dependents.acquire()
+        dependents.release()
+        finalizer.assert_not_called()
+        dependents.release()
+        finalizer.assert_called_once_with()
+
+    def test_close_unused(self):
+        finalizer = unittest.mock.Mock()
+        utils.Dependents(finalizer).close()
+        finalizer.assert_called_once_with()
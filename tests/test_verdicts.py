@@ -0,0 +1,89 @@
+# coding: utf-8
+"""
+Test VerdictBatch methods.
+"""
+
+import array
+import io
+import unittest
+
+from pymodsecurity import transaction
+from pymodsecurity import verdicts
+from pymodsecurity.modsecurity import ModSecurity
+from pymodsecurity.rules import Rules
+
+
+class TestVerdictBatch(unittest.TestCase):
+    def setUp(self):
+        self.batch = verdicts.VerdictBatch()
+        self.batch.append(200, False)
+        self.batch.append(403, True, [942100, 941100], [5, 3])
+        self.batch.append(200, 0, [920350], [2])
+
+    def test_append(self):
+        self.assertEqual(len(self.batch), 3)
+        self.assertEqual(self.batch.offsets.tolist(), [0, 0, 2, 3])
+        self.assertEqual(self.batch.rules(1),
+                         (array.array("q", [942100, 941100]),
+                          array.array("i", [5, 3])))
+        self.assertEqual(memoryview(self.batch.status).tolist(),
+                         [200, 403, 200])
+
+        with self.assertRaises(ValueError):
+            self.batch.append(403, True, [1, 2], [1])
+        self.assertEqual(len(self.batch), 3)
+        self.assertEqual(len(self.batch.rule_ids), 3)
+
+    def test_clear(self):
+        exported = memoryview(self.batch.status)
+        self.batch.clear()
+        self.assertEqual(len(self.batch), 0)
+        self.assertEqual(self.batch.offsets.tolist(), [0])
+        self.assertEqual(self.batch.rule_ids.tolist(), [])
+        # Still valid
+        self.assertEqual(exported.tolist(), [200, 403, 200])
+
+        self.batch.append(403, True, [1], [5])
+        self.assertEqual(self.batch.offsets.tolist(), [0, 1])
+
+    def test_csv(self):
+        output = io.StringIO(newline="")
+        self.batch.write_csv(output)
+        self.assertEqual(output.getvalue().splitlines(),
+                         ["status,disruptive,rule_ids,scores",
+                          "200,0,,",
+                          "403,1,942100 941100,5 3",
+                          "200,0,920350,2"])
+
+    def test_binary(self):
+        output = io.BytesIO()
+        self.batch.flush(output)
+        self.assertEqual(len(self.batch), 0)
+        self.assertEqual(len(output.getvalue()),
+                         26 + 3 * 4 + 3 + 4 * 8 + 3 * 8 + 3 * 4)
+
+        output.seek(0)
+        batch = verdicts.VerdictBatch.read_binary(output)
+        self.assertEqual(batch.status.tolist(), [200, 403, 200])
+        self.assertEqual(batch.disruptive.tolist(), [0, 1, 0])
+        self.assertEqual(batch.offsets.tolist(), [0, 0, 2, 3])
+        self.assertEqual(batch.rule_ids.tolist(), [942100, 941100, 920350])
+        self.assertEqual(batch.scores.tolist(), [5, 3, 2])
+
+        with self.assertRaises(ValueError):
+            verdicts.VerdictBatch.read_binary(io.BytesIO(b"spam"))
+
+    def test_add(self):
+        rules_set = Rules()
+        rules_set.add_rules('SecRuleEngine On\n'
+                            'SecRule ARGS:attack "@streq 1" '
+                            '"id:300000,phase:1,deny,status:403"')
+        transac = transaction.Transaction(ModSecurity(), rules_set)
+        transac.process_uri("/?attack=1", "GET", "1.1")
+        transac.process_request_headers()
+
+        batch = verdicts.VerdictBatch()
+        batch.add(transac, transac.get_intervention())
+        self.assertEqual(batch.status.tolist(), [403])
+        self.assertEqual(batch.disruptive.tolist(), [1])
+        self.assertEqual(batch.rule_ids.tolist(), [300000])